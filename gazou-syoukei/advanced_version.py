@@ -1,10 +1,10 @@
-import cv2
-import numpy as np
-from PIL import Image, ImageDraw, ImageFilter
+from PIL import Image
 import tkinter as tk
 from tkinter import filedialog, Button, Label, Canvas, Scale, IntVar, Frame, HORIZONTAL, Radiobutton
 from PIL import ImageTk
 import os
+from pipeline import advanced_preset
+from vector_export import SAVE_FILETYPES, save_vector
 
 class AdvancedImageToCharacterApp:
     def __init__(self, root):
@@ -15,7 +15,10 @@ class AdvancedImageToCharacterApp:
         self.input_image_path = None
         self.output_image = None
         self.processed_edges = None
-        self.contours = None
+        
+        # 輪郭抽出結果のキャッシュ（画像・エッジ検出のしきい値が同じなら再利用）
+        self._contour_cache_key = None
+        self._contour_cache = None
         
         # パラメータの初期値
         self.canny_threshold1 = IntVar(value=50)
@@ -87,21 +90,21 @@ class AdvancedImageToCharacterApp:
         # 輪郭の単純化レベル
         Label(param_frame, text="輪郭の単純化レベル:").grid(row=0, column=2, sticky=tk.W, padx=5, pady=2)
         Scale(param_frame, from_=1, to=100, orient=HORIZONTAL, variable=self.contour_simplification, 
-              length=200).grid(row=0, column=3, padx=5, pady=2)
+              length=200, command=self.on_render_option_change).grid(row=0, column=3, padx=5, pady=2)
         
         # 線の太さ
         Label(param_frame, text="線の太さ:").grid(row=1, column=2, sticky=tk.W, padx=5, pady=2)
         Scale(param_frame, from_=1, to=20, orient=HORIZONTAL, variable=self.line_thickness, 
-              length=200).grid(row=1, column=3, padx=5, pady=2)
+              length=200, command=self.on_render_option_change).grid(row=1, column=3, padx=5, pady=2)
         
         # スタイルオプション
         style_frame = Frame(param_frame)
         style_frame.grid(row=2, column=0, columnspan=4, sticky=tk.W, padx=5, pady=5)
         
         Label(style_frame, text="スタイル:").pack(side=tk.LEFT, padx=5)
-        Radiobutton(style_frame, text="輪郭のみ", variable=self.style_option, value=0).pack(side=tk.LEFT, padx=10)
-        Radiobutton(style_frame, text="塗りつぶし", variable=self.style_option, value=1).pack(side=tk.LEFT, padx=10)
-        Radiobutton(style_frame, text="テクスチャ付き", variable=self.style_option, value=2).pack(side=tk.LEFT, padx=10)
+        Radiobutton(style_frame, text="輪郭のみ", variable=self.style_option, value=0, command=self.on_render_option_change).pack(side=tk.LEFT, padx=10)
+        Radiobutton(style_frame, text="塗りつぶし", variable=self.style_option, value=1, command=self.on_render_option_change).pack(side=tk.LEFT, padx=10)
+        Radiobutton(style_frame, text="テクスチャ付き", variable=self.style_option, value=2, command=self.on_render_option_change).pack(side=tk.LEFT, padx=10)
         
         # ステータスバー
         self.status_label = Label(self.root, text="画像を選択してください", bd=1, relief=tk.SUNKEN, anchor=tk.W)
@@ -115,6 +118,8 @@ class AdvancedImageToCharacterApp:
         
         if file_path:
             self.input_image_path = file_path
+            self._contour_cache_key = None
+            self._contour_cache = None
             self.display_input_image()
             self.convert_btn.config(state=tk.NORMAL)
             self.status_label.config(text=f"選択された画像: {os.path.basename(file_path)}")
@@ -155,99 +160,47 @@ class AdvancedImageToCharacterApp:
         self.save_btn.config(state=tk.NORMAL)
         self.status_label.config(text="変換完了")
     
+    def on_render_option_change(self, *args):
+        """単純化レベル・線の太さ・スタイルの変更時に、キャッシュ済みの輪郭から再描画する"""
+        if self._contour_cache is None or self.output_image is None:
+            return
+        self.output_image = self.generate_character_from_image(self.input_image_path)
+        self.display_output_image()
+    
+    def _build_pipeline(self):
+        """現在のパラメータでパイプライン（advanced_version.pyのプリセット）を作成"""
+        return advanced_preset(
+            self.canny_threshold1.get(),
+            self.canny_threshold2.get(),
+            self.contour_simplification.get(),
+            self.line_thickness.get(),
+            self.style_option.get(),
+        )
+    
+    def extract_main_contour(self, image_path, pipeline):
+        """輪郭の選択までを実行し、結果をキャッシュする（画像・しきい値が同じなら再利用）"""
+        key = (image_path, self.canny_threshold1.get(), self.canny_threshold2.get())
+        if key == self._contour_cache_key:
+            return self._contour_cache
+        
+        context = pipeline.run(image_path, until="contours")
+        if context is not None:
+            self.processed_edges = context["edges"]
+        
+        self._contour_cache_key = key
+        self._contour_cache = context
+        return context
+    
     def generate_character_from_image(self, image_path):
-        # 画像を読み込み
-        img = cv2.imread(image_path)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # エッジ検出（パラメータ調整可能）
-        edges = cv2.Canny(gray, self.canny_threshold1.get(), self.canny_threshold2.get())
-        self.processed_edges = edges.copy()
-        
-        # 輪郭検出
-        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        self.contours = contours
-        
-        # 最も大きい輪郭を取得
-        if contours:
-            main_contour = max(contours, key=cv2.contourArea)
-            
-            # 輪郭を単純化（パラメータ調整可能）
-            epsilon = (self.contour_simplification.get() / 1000) * cv2.arcLength(main_contour, True)
-            approx_contour = cv2.approxPolyDP(main_contour, epsilon, True)
-            
-            # 象形文字のような画像を生成
-            canvas_size = (500, 500)
-            character_img = Image.new('RGB', canvas_size, color='white')
-            draw = ImageDraw.Draw(character_img)
-            
-            # 輪郭の座標を正規化して描画
-            h, w = edges.shape
-            scale_x = canvas_size[0] / w
-            scale_y = canvas_size[1] / h
-            
-            # 中心に配置するためのオフセットを計算
-            x_min = min(point[0][0] for point in approx_contour)
-            y_min = min(point[0][1] for point in approx_contour)
-            x_max = max(point[0][0] for point in approx_contour)
-            y_max = max(point[0][1] for point in approx_contour)
-            
-            contour_width = x_max - x_min
-            contour_height = y_max - y_min
-            
-            offset_x = (w - contour_width) // 2 - x_min
-            offset_y = (h - contour_height) // 2 - y_min
-            
-            # 輪郭を描画
-            points = []
-            for point in approx_contour:
-                x = int((point[0][0] + offset_x) * scale_x)
-                y = int((point[0][1] + offset_y) * scale_y)
-                points.append((x, y))
-            
-            # スタイルに応じて描画
-            style = self.style_option.get()
-            
-            if style == 0:  # 輪郭のみ
-                for i in range(len(points)):
-                    start = points[i]
-                    end = points[(i + 1) % len(points)]
-                    draw.line([start, end], fill='black', width=self.line_thickness.get())
-            
-            elif style == 1:  # 塗りつぶし
-                draw.polygon(points, outline='black', fill='black')
-            
-            elif style == 2:  # テクスチャ付き
-                # まず輪郭を描画
-                for i in range(len(points)):
-                    start = points[i]
-                    end = points[(i + 1) % len(points)]
-                    draw.line([start, end], fill='black', width=self.line_thickness.get())
-                
-                # テクスチャ効果（ノイズや筆のストロークを模倣）
-                texture_img = character_img.copy()
-                draw_texture = ImageDraw.Draw(texture_img)
-                
-                # ポリゴン内部に短い線をランダムに描画してテクスチャを作成
-                import random
-                for _ in range(50):
-                    x1 = random.randint(min(p[0] for p in points), max(p[0] for p in points))
-                    y1 = random.randint(min(p[1] for p in points), max(p[1] for p in points))
-                    x2 = x1 + random.randint(-30, 30)
-                    y2 = y1 + random.randint(-30, 30)
-                    draw_texture.line([(x1, y1), (x2, y2)], fill='black', width=1)
-                
-                # 元の画像とテクスチャをブレンド
-                character_img = Image.blend(character_img, texture_img, 0.3)
-                
-                # 少しぼかして古い象形文字のような効果を追加
-                character_img = character_img.filter(ImageFilter.GaussianBlur(0.5))
-            
-            return character_img
-        else:
-            # 輪郭が見つからない場合は元の画像をグレースケールで返す
-            pil_img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-            return pil_img
+        pipeline = self._build_pipeline()
+        extracted = self.extract_main_contour(image_path, pipeline)
+        if extracted is None:
+            return None
+        
+        # 単純化・描画だけを実行（単純化ピラミッドはキャッシュに残るので approxPolyDP の再実行は不要）
+        context = pipeline.run(context=dict(extracted), start_at="simplifier")
+        extracted["pyramid"] = context.get("pyramid")
+        return context["output_image"]
     
     def display_output_image(self):
         if self.output_image:
@@ -265,11 +218,17 @@ class AdvancedImageToCharacterApp:
         file_path = filedialog.asksaveasfilename(
             title="象形文字を保存",
             defaultextension=".png",
-            filetypes=[("PNG files", "*.png"), ("All files", "*.*")]
+            filetypes=SAVE_FILETYPES
         )
         
         if file_path:
-            self.output_image.save(file_path)
+            try:
+                # .svg / .pdf は輪郭から直接ベクター形式で保存する
+                if not save_vector(file_path, self.output_image):
+                    self.output_image.save(file_path)
+            except ValueError as e:
+                self.status_label.config(text=str(e))
+                return
             self.status_label.config(text=f"画像を保存しました: {os.path.basename(file_path)}")
 
 def main():
@@ -0,0 +1,186 @@
+"""アニメーションGIF・WebP、複数ページのTIFFの変換
+
+cv2.imread は最初のフレームしか読まないため、複数フレームの画像はPILでフレームごとに
+読み、各フレームを並列に象形文字へ変換して、元と同じ表示時間のアニメーションにまとめる。
+直前のフレームと同じ内容のフレームは変換せず、前のフレームの結果を使い回す。
+
+使い方:
+    python animation.py 入力.gif 出力.gif --workers 4
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from concurrency import BATCH, apply_policy, cpu_count
+from conversion_jobs import check_cancelled
+from pipeline import main_preset
+
+MULTI_FRAME_EXTENSIONS = (".gif", ".webp", ".tif", ".tiff")
+# 表示時間が記録されていないフレームの表示時間（ミリ秒）
+DEFAULT_DURATION_MS = 100
+
+# フレームごとの変換は main.py と同じプリセットで行う（説明は最初のフレームだけ生成する）
+FRAME_PIPELINE = main_preset()
+
+_frame_executor = None
+_frame_executor_lock = threading.Lock()
+
+
+def get_frame_executor():
+    """フレームの変換に共有するスレッドプール（バッチの複数のワーカーから使ってもスレッド数が増えない）"""
+    global _frame_executor
+    with _frame_executor_lock:
+        if _frame_executor is None:
+            _frame_executor = ThreadPoolExecutor(max_workers=cpu_count(), thread_name_prefix="frames")
+        return _frame_executor
+
+
+def frame_count(path):
+    """画像のフレーム数（読めない・複数フレームに対応しない形式は 1）"""
+    if not path.lower().endswith(MULTI_FRAME_EXTENSIONS):
+        return 1
+    from PIL import Image
+
+    try:
+        with Image.open(path) as img:
+            return getattr(img, "n_frames", 1)
+    except Exception:
+        return 1
+
+
+def is_multi_frame(path):
+    return frame_count(path) > 1
+
+
+def iter_frames(path):
+    """フレームを順にデコードし、(BGR画像, 表示時間ミリ秒) を返す"""
+    import cv2
+    import numpy as np
+    from PIL import Image, ImageSequence
+
+    with Image.open(path) as img:
+        for frame in ImageSequence.Iterator(img):
+            duration = frame.info.get("duration") or DEFAULT_DURATION_MS
+            rgb = np.asarray(frame.convert("RGB"))
+            yield cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR), duration
+
+
+def _convert_frame(path, image, token=None):
+    """1フレームを読み込み済みの画像から変換し、コンテキストを返す"""
+    import cv2
+
+    check_cancelled(token)
+    context = {
+        "path": path,
+        "name": os.path.splitext(os.path.basename(path))[0],
+        "image": image,
+        "gray": cv2.cvtColor(image, cv2.COLOR_BGR2GRAY),
+        "shape": image.shape[:2],
+    }
+    context = FRAME_PIPELINE.run(context=context, token=token, start_at="edges", until="renderer")
+    if context is not None:
+        # 全フレーム分を持ち続けないよう、描画の済んだ元の画像は捨てる
+        context.pop("image", None)
+        context.pop("gray", None)
+    return context
+
+
+def convert_frames(path, executor=None, workers=None, token=None, first=None):
+    """複数フレームの画像の各フレームを変換する
+
+    executor も workers も省略すると、共有のスレッドプール（get_frame_executor）で変換する。
+    token がキャンセルされると、まだ始まっていないフレームの変換を取り消して ConversionCancelled を送出する。
+    first に最初のフレームの変換済みのコンテキスト（output_image を含む）を渡すと、
+    最初のフレームは変換し直さずにそれを使う。
+
+    戻り値は {"frames": [象形文字画像], "durations": [ミリ秒], "contexts": [フレームのコンテキスト],
+    "reused": 使い回したフレーム数}。直前と同じ内容のフレームは同じコンテキストを指す。
+    """
+    own_executor = executor is None and workers is not None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frames")
+    elif executor is None:
+        executor = get_frame_executor()
+
+    # デコードは順に行い、デコードできたフレームから並列に変換する
+    futures = []
+    durations = []
+    reused = 0
+    previous_digest = None
+    try:
+        for image, duration in iter_frames(path):
+            check_cancelled(token)
+            digest = hashlib.blake2b(image.tobytes(), digest_size=16).digest()
+            if digest == previous_digest:
+                # 直前と同じフレームは変換せず、結果を使い回す
+                futures.append(futures[-1])
+                reused += 1
+            elif not futures and first is not None:
+                # 最初のフレームは呼び出し側で変換済み
+                futures.append(Future())
+                futures[-1].set_result(first)
+                previous_digest = digest
+            else:
+                futures.append(executor.submit(_convert_frame, path, image, token))
+                previous_digest = digest
+            durations.append(duration)
+        contexts = [future.result() for future in futures]
+    except BaseException:
+        # キャンセル・失敗したら残りのフレームは変換しない
+        for future in futures:
+            future.cancel()
+        raise
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    return {
+        "frames": [context["output_image"] for context in contexts],
+        "durations": durations,
+        "contexts": contexts,
+        "reused": reused,
+    }
+
+
+def save_animation(path, frames, durations):
+    """象形文字のフレームをアニメーションGIF（.webp ならWebP）として保存する
+
+    輪郭が無く元の画像のままのフレームは、最初のフレームの大きさに合わせて中央に置く。
+    """
+    from PIL import Image
+
+    size = next((frame.size for frame in frames if "glyph" in frame.info), frames[0].size)
+    fitted = []
+    for frame in frames:
+        if frame.size != size:
+            thumbnail = frame.convert("RGB")
+            thumbnail.thumbnail(size)
+            frame = Image.new("RGB", size, "white")
+            frame.paste(thumbnail, ((size[0] - thumbnail.width) // 2, (size[1] - thumbnail.height) // 2))
+        fitted.append(frame.convert("RGB"))
+    fitted[0].save(path, save_all=True, append_images=fitted[1:], duration=durations, loop=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="アニメーション画像をフレームごとに象形文字へ変換")
+    parser.add_argument("input", help="アニメーションGIF・WebP、または複数ページのTIFF")
+    parser.add_argument("output", help="保存先（.gif または .webp）")
+    parser.add_argument("--workers", type=int, default=None, help="同時に変換するフレーム数（既定はCPUコア数）")
+    args = parser.parse_args()
+
+    # フレームごとに1スレッド、OpenCVはスレッドごとに1つ
+    apply_policy(BATCH)
+    start = time.perf_counter()
+    converted = convert_frames(args.input, workers=args.workers)
+    save_animation(args.output, converted["frames"], converted["durations"])
+    print(f"{len(converted['frames'])}フレームを変換しました（同じフレームの再利用: {converted['reused']}）: "
+          f"{args.output}, {time.perf_counter() - start:.2f}秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""zip / tar アーカイブの画像の読み込みと、tar への結果の書き出し
+
+数GBのアーカイブを展開してから変換する代わりに、メンバーを1つずつメモリに読み、
+ImageLoader にバイト列のまま渡して cv2.imdecode でデコードする。
+tar は先頭から順に読む（ストリームのまま読めるため、gz / bz2 / xz 圧縮も展開不要）。
+
+結果も一時ファイルを作らず、PNGをメモリ上でエンコードして tar に直接追記できる。
+"""
+import io
+import os
+import time
+import tarfile
+import zipfile
+import threading
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+TAR_OUTPUT_EXTENSIONS = (".tar", ".tar.gz", ".tgz")
+
+
+def is_archive(path):
+    return os.path.isfile(path) and path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def is_tar_output(path):
+    return path.lower().endswith(TAR_OUTPUT_EXTENSIONS)
+
+
+def _is_image(name, extensions):
+    base = os.path.basename(name)
+    return name.lower().endswith(extensions) and not base.startswith(".")
+
+
+def iter_archive(path, extensions):
+    """アーカイブの画像のメンバーを (メンバー名, 中身のバイト列) で順に返す"""
+    if path.lower().endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _is_image(info.filename, extensions):
+                    yield info.filename, archive.read(info)
+        return
+    # "r|*" は先頭から順に読むストリームのモード（シークしない）
+    with tarfile.open(path, mode="r|*") as archive:
+        for member in archive:
+            if member.isfile() and _is_image(member.name, extensions):
+                yield member.name, archive.extractfile(member).read()
+
+
+def safe_member_name(name):
+    """メンバー名を出力用の相対パスにする（絶対パスやドライブ名、.. は取り除く）"""
+    parts = [part for part in name.replace("\\", "/").split("/")
+             if part not in ("", ".", "..") and not part.endswith(":")]
+    return "/".join(parts)
+
+
+class DirectorySink:
+    """結果をフォルダに保存する（メンバー名のフォルダ構成を保つ）"""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+    def write(self, name, data):
+        path = os.path.join(self.output_dir, *name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def close(self):
+        pass
+
+
+class TarSink:
+    """結果を tar に順に追記する（複数のワーカーから呼んでよい）
+
+    書き込みはストリームのモードで行うため、出力先はパイプでもよい。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        mode = "w|gz" if path.lower().endswith((".tar.gz", ".tgz")) else "w|"
+        self._lock = threading.Lock()
+        self._archive = tarfile.open(path, mode=mode)
+
+    def write(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        with self._lock:
+            self._archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        with self._lock:
+            self._archive.close()
+
+
+def open_sink(output):
+    """出力先が .tar / .tar.gz / .tgz なら TarSink、それ以外はフォルダ"""
+    return TarSink(output) if is_tar_output(output) else DirectorySink(output)
+
+
+def encode_png(image):
+    """PIL画像をPNGのバイト列にする"""
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
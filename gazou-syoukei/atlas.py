@@ -0,0 +1,173 @@
+"""象形文字のアトラス（スプライトシート）の書き出し
+
+多数の象形文字を数枚の大きな画像（ページ）にまとめ、各象形文字の位置と説明文を
+JSONのインデックスに書き出す。Webのフロントエンドで象形文字ごとにPNGを
+読み込む代わりに、ページ画像とインデックスだけを読めば済む。
+
+- grid: 全ての象形文字を同じ大きさのマス目に並べる
+- packed: 象形文字の余白を切り詰め、高さの揃った段に左から詰めていく（シェルフ詰め）
+
+バッチの途中でも、ページが埋まるたびにページ画像（atlas_0.png）とそのページの
+インデックス（atlas_0.json）を書き出し、メモリには書き出し中のページの分だけを持つ。
+最後に全ページのインデックスを1つにまとめた atlas.json を書き出す。
+
+インデックスの形式:
+    {"cell_size": 128, "page_size": 2048, "layout": "grid", "pages": ["atlas_0.png", ...],
+     "glyphs": [{"name": ..., "page": 0, "x": 0, "y": 0, "width": 128, "height": 128,
+                 "description": ...}, ...]}
+"""
+import os
+import json
+import threading
+
+GRID = "grid"
+PACKED = "packed"
+
+DEFAULT_CELL_SIZE = 128
+DEFAULT_PAGE_SIZE = 2048
+# packed で象形文字の間に空ける余白（ピクセル）
+PADDING = 2
+
+
+class AtlasWriter:
+    """象形文字を順にページへ詰めて書き出す（追加は複数のワーカーから呼んでよい）"""
+
+    def __init__(self, output_dir, prefix="atlas", cell_size=DEFAULT_CELL_SIZE, page_size=DEFAULT_PAGE_SIZE,
+                 layout=GRID):
+        if layout not in (GRID, PACKED):
+            raise ValueError(f"不明なレイアウトです: {layout}")
+        if cell_size > page_size:
+            raise ValueError("マスの大きさがページより大きいです")
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.cell_size = cell_size
+        self.page_size = page_size
+        self.layout = layout
+        self.index_path = os.path.join(output_dir, f"{prefix}.json")
+
+        self._lock = threading.Lock()
+        self._pages = []
+        # 書き出し中のページの象形文字
+        self._glyphs = []
+        self.glyph_count = 0
+        self._page = None
+        # 次に置く位置と、現在の段の高さ
+        self._x = self._y = self._shelf_height = 0
+        os.makedirs(output_dir, exist_ok=True)
+
+    def add(self, name, image, description=None):
+        """象形文字の画像（cell_size の正方形に収まるよう縮小する）を追加する"""
+        cell = self._fit(image)
+        with self._lock:
+            x, y = self._place(cell.size)
+            self._page.paste(cell, (x, y))
+            self._glyphs.append({
+                "name": name,
+                "page": len(self._pages),
+                "x": x,
+                "y": y,
+                "width": cell.width,
+                "height": cell.height,
+                "description": description,
+            })
+            self.glyph_count += 1
+
+    def _fit(self, image):
+        from PIL import Image, ImageChops
+
+        image = image.convert("RGB")
+        if self.layout == PACKED:
+            # 白い余白を切り詰める（何も描かれていなければそのまま）
+            bbox = ImageChops.difference(image, Image.new("RGB", image.size, "white")).getbbox()
+            if bbox is not None:
+                image = image.crop(bbox)
+        if image.width > self.cell_size or image.height > self.cell_size:
+            image = image.copy()
+            image.thumbnail((self.cell_size, self.cell_size))
+        if self.layout == GRID and image.size != (self.cell_size, self.cell_size):
+            # マスの中央に置く
+            cell = Image.new("RGB", (self.cell_size, self.cell_size), "white")
+            cell.paste(image, ((self.cell_size - image.width) // 2, (self.cell_size - image.height) // 2))
+            image = cell
+        return image
+
+    def _place(self, size):
+        """画像を置く位置を決める（ページが足りなければ書き出して次のページにする。ロック内で呼ぶ）"""
+        from PIL import Image
+
+        width, height = size
+        padding = PADDING if self.layout == PACKED else 0
+        if self._page is not None and self._x + width > self.page_size:
+            # 段が埋まったので次の段へ
+            self._x = 0
+            self._y += self._shelf_height + padding
+            self._shelf_height = 0
+        if self._page is not None and self._y + height > self.page_size:
+            self._flush_page()
+        if self._page is None:
+            self._page = Image.new("RGB", (self.page_size, self.page_size), "white")
+            self._x = self._y = self._shelf_height = 0
+        position = (self._x, self._y)
+        self._x += width + padding
+        self._shelf_height = max(self._shelf_height, height)
+        return position
+
+    def _flush_page(self):
+        """現在のページを書き出す（最後のページは使った高さまで切り詰める。ロック内で呼ぶ）"""
+        if self._page is None:
+            return
+        used_height = min(self.page_size, self._y + self._shelf_height)
+        page = self._page if used_height == self.page_size else self._page.crop((0, 0, self.page_size, used_height))
+        file_name = f"{self.prefix}_{len(self._pages)}.png"
+        page.save(os.path.join(self.output_dir, file_name))
+        self._write_json(self._page_index_path(len(self._pages)), self._header([file_name], self._glyphs))
+        self._pages.append(file_name)
+        self._page = None
+        self._glyphs = []
+
+    def _page_index_path(self, page):
+        return os.path.join(self.output_dir, f"{self.prefix}_{page}.json")
+
+    def _header(self, pages, glyphs):
+        return {
+            "cell_size": self.cell_size,
+            "page_size": self.page_size,
+            "layout": self.layout,
+            "pages": pages,
+            "glyphs": glyphs,
+        }
+
+    def _write_json(self, path, index):
+        # 一時ファイルに書いてから置き換える（途中で止まっても壊れたインデックスを残さない）
+        temporary = path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(temporary, path)
+
+    def close(self):
+        """最後のページを書き出し、全ページのインデックスをまとめる"""
+        with self._lock:
+            self._flush_page()
+            temporary = self.index_path + ".tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                # ページごとのインデックスを順に読んで書き足す（全件をメモリに持たない）
+                header = json.dumps(self._header(self._pages, []), ensure_ascii=False)
+                f.write(header[:-len("[]}")] + "[")
+                first = True
+                for page in range(len(self._pages)):
+                    with open(self._page_index_path(page), "r", encoding="utf-8") as page_file:
+                        for glyph in json.load(page_file)["glyphs"]:
+                            f.write(("" if first else ", ") + json.dumps(glyph, ensure_ascii=False))
+                            first = False
+                f.write("]}")
+            os.replace(temporary, self.index_path)
+
+    @property
+    def page_count(self):
+        return len(self._pages)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,745 @@
+"""フォルダ内の画像をまとめて象形文字に変換するバッチ処理
+
+画像ヘッダーの縦横サイズから1枚あたりのメモリ使用量を見積もり、
+メモリ予算の範囲内でだけ変換を開始する。実際のRSSを見ながら
+同時実行数を増減させるため、2GBのコンテナでも入力に関わらず安全に動く。
+
+使い方:
+    python batch.py 入力フォルダ 出力フォルダ
+    python batch.py 入力フォルダ 出力フォルダ --memory-budget 1536 --workers 4
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from concurrency import BATCH, apply_policy, cpu_count
+from archive_io import encode_png, is_archive, is_tar_output, iter_archive, open_sink, safe_member_name
+from animation import convert_frames, frame_count, save_animation
+from atlas import AtlasWriter
+from batch_requests import RequestFileWriter
+from dedupe import DEFAULT_THRESHOLD, HashStore, plan_dedupe
+from export import ColumnarWriter, make_row
+from glyph_store import GlyphStore
+from vector_export import PdfWriter, glyph_of, save_svg
+from descriptions import BATCH_SIZE as DESCRIPTION_BATCH_SIZE, get_description_service
+from openai_client import get_client
+from pipeline import main_preset, render_contour, render_sizes
+from simplification import SimplificationPyramid
+from shape_index import ShapeIndex, compute_descriptor
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tif", ".tiff")
+
+# 既定のメモリ予算（MB）
+DEFAULT_MEMORY_BUDGET_MB = int(os.environ.get("BATCH_MEMORY_BUDGET_MB", "1536"))
+
+# 1画素あたりの作業メモリ（BGR 3 + グレー 1 + エッジ 1 + RGBコピー 3 バイト）と余裕分
+BYTES_PER_PIXEL = 8
+ESTIMATE_MARGIN = 1.25
+# 1枚あたりの固定オーバーヘッド（出力キャンバス・輪郭など）
+PER_IMAGE_OVERHEAD = 4 * 1024 * 1024
+
+# RSSがこの割合を超えたら同時実行数を減らし、下回ったら増やす
+HIGH_WATERMARK = 0.85
+LOW_WATERMARK = 0.6
+
+# RSSを確認する間隔（秒）
+RSS_CHECK_INTERVAL = 0.5
+
+# convert_image が None を返した（画像を読み込めなかった）場合の失敗の理由
+UNREADABLE = "画像を読み込めませんでした"
+
+# 輪郭の抽出には main.py と同じプリセットを使う（説明は convert_image で別に生成する）
+CONTOUR_PIPELINE = main_preset()
+
+
+def list_images(folder):
+    """フォルダ内の画像ファイルのパスを名前順で返す"""
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def current_rss():
+    """現在のプロセスの常駐メモリ（バイト）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        import resource
+        # Linux以外ではピーク値しか取れない（macOSはバイト単位）
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    return psutil.Process().memory_info().rss
+
+
+def read_image_size(path):
+    """画像をデコードせずにヘッダーから縦横サイズを読む（path はファイルオブジェクトでもよい）"""
+    from PIL import Image
+
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def estimate_memory(path):
+    """1枚の変換に必要なメモリを見積もる（バイト）
+
+    複数フレームの画像は、変換待ちのフレーム（BGR）を全て持つ場合を見込む。
+    """
+    size = read_image_size(path)
+    if size is None:
+        # ヘッダーが読めない場合は圧縮率を10倍と仮定
+        return int(os.path.getsize(path) * 10 * BYTES_PER_PIXEL / 3) + PER_IMAGE_OVERHEAD
+    width, height = size
+    frames = frame_count(path)
+    return (int(width * height * BYTES_PER_PIXEL * ESTIMATE_MARGIN) + (frames - 1) * width * height * 3
+            + PER_IMAGE_OVERHEAD * frames)
+
+
+def estimate_member_memory(member):
+    """アーカイブのメンバー (名前, バイト列) の変換に必要なメモリを見積もる（バイト）"""
+    import io
+
+    _, data = member
+    size = read_image_size(io.BytesIO(data))
+    if size is None:
+        return int(len(data) * 10 * BYTES_PER_PIXEL / 3) + PER_IMAGE_OVERHEAD
+    width, height = size
+    return int(width * height * BYTES_PER_PIXEL * ESTIMATE_MARGIN) + PER_IMAGE_OVERHEAD
+
+
+def extract_main_contour(image_path, data=None):
+    """画像から最も大きい輪郭を抽出する（main.pyと同じ処理）
+
+    読み込めない場合は None を返す。輪郭が無い場合は main_contour が None になり、
+    代わりに元の画像（BGR）が image に入る。data（ファイルの中身）を指定すると
+    image_path は名前としてだけ使い、ファイルは開かない。
+    """
+    context = None
+    if data is not None:
+        context = {"path": image_path, "name": os.path.splitext(os.path.basename(image_path))[0], "data": data}
+    context = CONTOUR_PIPELINE.run(image_path, context=context, until="simplifier")
+    if context is None:
+        return None
+    if context["main_contour"] is None:
+        return {"shape": context["shape"], "main_contour": None, "image": context["image"],
+                "contour_count": context["contour_count"], "timings": context["timings"]}
+    return {
+        "shape": context["shape"],
+        "main_contour": context["main_contour"],
+        "approx_contour": context["approx_contour"],
+        "contour_features": context["contour_features"],
+        "contour_count": context["contour_count"],
+        "timings": context["timings"],
+        "image": None,
+    }
+
+
+def convert_image(image_path, client=None, token=None, detail_levels=(), describe=True, sizes=(), data=None):
+    """1枚の画像を象形文字画像と説明文に変換する
+
+    describe=False の場合は説明文を生成しない（後でまとめて生成する場合）。
+    data を指定すると、ファイルを開かずにそのバイト列をデコードする（アーカイブのメンバーなど）。
+    戻り値は辞書（読み込めない場合は None）:
+        image: 象形文字画像, description: 説明文（describe=False なら None）,
+        variants: {単純化レベル: 画像}（detail_levels 指定時）,
+        sizes: {一辺のピクセル数: 画像}（sizes 指定時、線の太さは大きさに比例）,
+        contour_features: 輪郭の特徴, descriptor: 形状記述子（shape_index.py）,
+        approx_contour: 単純化した輪郭, description_source: 説明の取得元,
+        contour_count: 輪郭の数, timings: {段階名: 処理時間（ミリ秒）}, shape: 元画像の大きさ,
+        animation: 複数フレームの画像ならフレームごとの変換結果（animation.convert_frames）、それ以外は None
+    最初のフレームの結果を image・説明文などに使う。
+    """
+    import cv2
+    from PIL import Image
+
+    extracted = extract_main_contour(image_path, data)
+    if extracted is None:
+        return None
+
+    file_name_without_ext = os.path.splitext(os.path.basename(image_path))[0]
+    service = get_description_service()
+    timings = extracted["timings"]
+    animated = data is None and frame_count(image_path) > 1
+
+    def convert_animation(output_image):
+        # 最初のフレームはここで描画した画像を使い、残りのフレームだけを変換する
+        if not animated:
+            return None
+        start = time.perf_counter()
+        animation = convert_frames(image_path, token=token, first={"output_image": output_image})
+        timings["frames"] = (time.perf_counter() - start) * 1000
+        return animation
+
+    if extracted["main_contour"] is None:
+        start = time.perf_counter()
+        pil_img = Image.fromarray(cv2.cvtColor(extracted["image"], cv2.COLOR_BGR2RGB))
+        timings["renderer"] = (time.perf_counter() - start) * 1000
+        animation = convert_animation(pil_img)
+        description = source = None
+        if describe:
+            start = time.perf_counter()
+            description, source = service.describe_simple(client, file_name_without_ext, token)
+            timings["describer"] = (time.perf_counter() - start) * 1000
+        return {"image": pil_img, "description": description, "description_source": source,
+                "variants": {}, "sizes": {}, "contour_features": None, "approx_contour": None, "descriptor": None,
+                "contour_count": extracted["contour_count"], "timings": timings, "shape": extracted["shape"],
+                "animation": animation}
+
+    approx_contour = extracted["approx_contour"]
+    description = source = None
+    if describe:
+        start = time.perf_counter()
+        description, source = service.describe_character(
+            client, extracted["contour_features"], file_name_without_ext, token)
+        timings["describer"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    image = render_contour(approx_contour, extracted["shape"])
+    # 追加の大きさは同じ輪郭の中央寄せを使い回して描画する
+    sized = render_sizes(approx_contour, extracted["shape"], sizes) if sizes else {}
+    timings["renderer"] = (time.perf_counter() - start) * 1000
+    animation = convert_animation(image)
+
+    variants = {}
+    if detail_levels:
+        # 輪郭1本から全レベルをしきい値の切り出しだけで作成
+        pyramid = SimplificationPyramid(extracted["main_contour"])
+        for level, contour in zip(detail_levels, pyramid.levels([level / 1000 for level in detail_levels])):
+            variants[level] = render_contour(contour, extracted["shape"])
+
+    return {
+        "image": image,
+        "description": description,
+        "description_source": source,
+        "variants": variants,
+        "sizes": sized,
+        "contour_features": extracted["contour_features"],
+        "approx_contour": approx_contour,
+        "descriptor": compute_descriptor(approx_contour),
+        "contour_count": extracted["contour_count"],
+        "timings": timings,
+        "shape": extracted["shape"],
+        "animation": animation,
+    }
+
+
+class MemoryBudgetScheduler:
+    """メモリ予算に基づいて変換の開始を制御するスケジューラー
+
+    各ジョブは見積もりメモリを予約してから開始し、終了時に解放する。
+    予約の合計とプロセスのRSSの両方が予算に収まる場合だけ新しいジョブを開始する。
+    予算を超える大きな画像は、他のジョブが無い状態で1枚だけ実行する。
+    """
+
+    def __init__(self, memory_budget, max_workers=None, estimate_fn=estimate_memory, rss_fn=current_rss):
+        self.memory_budget = memory_budget
+        self.max_workers = max_workers or cpu_count()
+        self.concurrency = self.max_workers
+        self.estimate_fn = estimate_fn
+        self.rss_fn = rss_fn
+
+        self._condition = threading.Condition()
+        self._reserved = 0
+        self._running = 0
+        self._last_rss_check = 0.0
+        self._rss = 0
+        self.stats = {
+            "peak_rss": 0,
+            "peak_reserved": 0,
+            "concurrency_changes": 0,
+            "min_concurrency": self.concurrency,
+        }
+
+    def _observe_rss(self):
+        """RSSを確認し、同時実行数を調整する（ロック内で呼ぶ）"""
+        now = time.monotonic()
+        if now - self._last_rss_check < RSS_CHECK_INTERVAL:
+            return
+        self._last_rss_check = now
+        self._rss = self.rss_fn()
+        self.stats["peak_rss"] = max(self.stats["peak_rss"], self._rss)
+
+        previous = self.concurrency
+        if self._rss > self.memory_budget * HIGH_WATERMARK:
+            self.concurrency = max(1, min(self.concurrency, self._running) - 1)
+        elif self._rss < self.memory_budget * LOW_WATERMARK and self.concurrency < self.max_workers:
+            self.concurrency += 1
+        if self.concurrency != previous:
+            self.stats["concurrency_changes"] += 1
+            self.stats["min_concurrency"] = min(self.stats["min_concurrency"], self.concurrency)
+            print(f"同時実行数を{previous}から{self.concurrency}に変更しました（RSS: {self._rss / 1024 / 1024:.0f}MB）")
+
+    def _can_admit(self, estimate):
+        if self._running == 0:
+            # 何も実行していなければ、予算を超える画像でも1枚だけは実行する
+            return True
+        if self._running >= self.concurrency:
+            return False
+        return (self._reserved + estimate <= self.memory_budget
+                and self._rss + estimate <= self.memory_budget)
+
+    def _acquire(self, estimate):
+        with self._condition:
+            self._observe_rss()
+            while not self._can_admit(estimate):
+                self._condition.wait(timeout=RSS_CHECK_INTERVAL)
+                self._observe_rss()
+            self._running += 1
+            self._reserved += estimate
+            self.stats["peak_reserved"] = max(self.stats["peak_reserved"], self._reserved)
+
+    def _release(self, estimate):
+        with self._condition:
+            self._running -= 1
+            self._reserved -= estimate
+            self._condition.notify_all()
+
+    def run(self, items, fn, on_result=None):
+        """items の各要素に fn を適用する（on_result(item, result, error) で結果を受け取る）
+
+        on_result は予約したメモリを解放する前に呼ぶ（結果の画像を保存し終えるまで予算に含める）。
+        on_result が例外を送出した場合は、その例外を error として on_result をもう一度呼び、失敗として扱わせる。
+        """
+        def task(item, estimate):
+            try:
+                try:
+                    result, error = fn(item), None
+                except Exception as e:
+                    result, error = None, e
+                if on_result:
+                    self._report(on_result, item, result, error)
+            finally:
+                self._release(estimate)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="batch") as executor:
+            for item in items:
+                estimate = self.estimate_fn(item)
+                self._acquire(estimate)
+                executor.submit(task, item, estimate)
+        return self.stats
+
+    @staticmethod
+    def _report(on_result, item, result, error):
+        try:
+            on_result(item, result, error)
+            return
+        except Exception as e:
+            if error is not None:
+                print(f"失敗した変換の記録中にエラーが発生しました: {e}")
+                return
+            error = e
+        try:
+            on_result(item, None, error)
+        except Exception as e:
+            print(f"失敗した変換の記録中にエラーが発生しました: {e}")
+
+
+def promote_stored_duplicates(paths, duplicates, result_prefix):
+    """過去のバッチの結果に一致した重複画像を、元の結果ごとに1枚だけ変換する画像に移す
+
+    過去の結果はファイルしか残っておらず、エクスポートやストアに登録する輪郭が無いため、
+    最初の1枚を変換し直して代表にし、残りはその結果を使い回す。
+    戻り値は (変換する画像のリスト, {重複画像: 使い回す結果の場所})。
+    """
+    in_batch = {result_prefix(path) for path in paths}
+    paths = list(paths)
+    promoted = {}
+    remaining = {}
+    for path, source in duplicates.items():
+        if source in in_batch:
+            remaining[path] = source
+        elif source in promoted:
+            remaining[path] = result_prefix(promoted[source])
+        else:
+            promoted[source] = path
+            paths.append(path)
+    return paths, remaining
+
+
+def copy_duplicate_results(duplicates, result_prefix, detail_levels=(), sizes=()):
+    """重複画像に、代表画像の変換結果（PNG・説明文・SVG・単純化レベル別・大きさ別のPNG）をコピーする"""
+    copied = 0
+    suffixes = ([".png", ".txt", ".svg", ".gif"] + [f"_d{level}.png" for level in detail_levels]
+                + [f"_{size}px.png" for size in sizes])
+    for path, source in duplicates.items():
+        target = result_prefix(path)
+        if not os.path.exists(source + ".png"):
+            # 代表画像の変換に失敗した場合
+            print(f"重複元の結果がありません: {path}")
+            continue
+        for suffix in suffixes:
+            if source != target and os.path.exists(source + suffix):
+                shutil.copyfile(source + suffix, target + suffix)
+        copied += 1
+    return copied
+
+
+def run_batch(input_dir, output_dir, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, workers=None, use_api=True,
+              detail_levels=(), index_path=None, dedupe=False, dedupe_store=None,
+              dedupe_threshold=DEFAULT_THRESHOLD, describe_batch=0, describe_offline=None, export_path=None,
+              glyph_store_path=None, write_png=True, svg=False, pdf_path=None, sizes=(),
+              atlas_layout=None, atlas_cell_size=128):
+    """フォルダ内の画像を変換し、PNGと説明文を出力フォルダに保存する
+
+    index_path を指定すると、形状記述子のインデックスを保存する（既存なら追記）。
+    dedupe を指定すると、知覚ハッシュがほぼ同じ画像は変換せず結果をコピーする。
+    重複画像はインデックス・エクスポート・ストア・PDF・アトラスにも代表画像の結果で登録する。
+    dedupe_store（SQLite）を指定すると、過去のバッチの結果も使い回す。
+    describe_batch に2以上を指定すると、その枚数分の説明を1回のAPIリクエストでまとめて生成する。
+    describe_offline にJSONLファイルを指定すると、APIは呼ばずにプロンプトを書き出し、
+    説明文はローカルの説明で仮置きする（後で batch_requests.py で取り込む。重複画像の説明文も置き換わる）。
+    取り込みでは書き換えられないため、export_path・atlas_layout とは併用できない。
+    export_path を指定すると、特徴・頂点・説明文・パラメータ・処理時間を
+    列指向のファイル（export.py）に追記する。
+    glyph_store_path を指定すると、輪郭の頂点をベクターストア（glyph_store.py）に追記する。
+    write_png=False の場合、ストアに保存した象形文字のPNGは書き出さない（輪郭が無い画像は書き出す）。
+    svg を指定すると象形文字ごとにSVGを、pdf_path を指定すると全ての象形文字を
+    1ページずつ並べたPDFを書き出す（輪郭が無い画像は含めない）。
+    sizes を指定すると、一辺がそのピクセル数の画像も 画像名_64px.png のように書き出す
+    （1回の変換から描画し、PNGのエンコードは並列に行う）。
+    atlas_layout（"grid" / "packed"）を指定すると、象形文字をアトラス（atlas_*.png と atlas.json）にまとめる。
+    """
+    if describe_offline and (export_path or atlas_layout):
+        raise ValueError("オフラインで生成する説明文はエクスポート・アトラスに取り込めないため併用できません")
+    os.makedirs(output_dir, exist_ok=True)
+    paths = list_images(input_dir)
+    all_count = len(paths)
+
+    def result_prefix(path):
+        return os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0])
+
+    hash_store = None
+    duplicates = {}
+    hashes = {}
+    hash_elapsed = 0.0
+    if dedupe or dedupe_store:
+        hash_store = HashStore(dedupe_store, dedupe_threshold)
+        hash_start = time.perf_counter()
+        # 知覚ハッシュは最初のフレームしか見ないため、複数フレームの画像は重複排除の対象にしない
+        animated = {path for path in paths if frame_count(path) > 1}
+        paths, duplicates, hashes = plan_dedupe([path for path in paths if path not in animated],
+                                                hash_store, result_prefix)
+        paths += sorted(animated)
+        if index_path or export_path or glyph_store_path or pdf_path or atlas_layout:
+            paths, duplicates = promote_stored_duplicates(paths, duplicates, result_prefix)
+        hash_elapsed = time.perf_counter() - hash_start
+        print(f"重複排除: {all_count}枚中{len(duplicates)}枚が重複（ハッシュ計算: {hash_elapsed:.2f}秒）")
+    # 代表画像ごとの重複画像（代表の結果を重複画像の名前でも書き出し先に登録する）
+    canonical = {result_prefix(path): path for path in paths}
+    duplicates_of = {}
+    for path, source in duplicates.items():
+        if source in canonical:
+            duplicates_of.setdefault(canonical[source], []).append(path)
+    client = get_client() if use_api else None
+    scheduler = MemoryBudgetScheduler(memory_budget_mb * 1024 * 1024, workers)
+
+    lock = threading.Lock()
+    counts = {"done": 0, "failed": 0}
+    shape_index = None
+    if index_path:
+        shape_index = ShapeIndex.load(index_path) if os.path.exists(index_path) else ShapeIndex()
+
+    request_writer = RequestFileWriter(describe_offline) if describe_offline else None
+    batch_describe = request_writer is None and use_api and client is not None and describe_batch > 1
+    pending_descriptions = []
+    exporter = ColumnarWriter(export_path) if export_path else None
+    export_params = dict(CONTOUR_PIPELINE.params(), preset="main")
+    glyph_store = GlyphStore(glyph_store_path) if glyph_store_path else None
+    pdf_writer = PdfWriter(pdf_path) if pdf_path else None
+    atlas = AtlasWriter(output_dir, cell_size=atlas_cell_size, layout=atlas_layout) if atlas_layout else None
+    encoder = ThreadPoolExecutor(max_workers=scheduler.max_workers, thread_name_prefix="encode") if sizes else None
+
+    def record_result(path, result, description, source):
+        """説明文が決まった結果をエクスポートとアトラスに追加する（重複画像の分も）"""
+        entries = [path] + duplicates_of.get(path, [])
+        if exporter is not None:
+            for entry in entries:
+                exporter.add(make_row(entry, result["contour_features"], result["approx_contour"], description,
+                                      source, export_params, result["timings"], result["contour_count"]))
+        if atlas is not None:
+            glyph = glyph_of(result["image"])
+            image = result["image"]
+            if glyph is not None:
+                # マスの大きさで描き直す（縮小するより線がつぶれない）
+                image = render_sizes(glyph["contour"], glyph["shape"], [atlas_cell_size])[atlas_cell_size]
+            for entry in entries:
+                atlas.add(os.path.splitext(os.path.basename(entry))[0], image, description)
+
+    def write_descriptions(entries):
+        items = [(result["contour_features"], name) for _, _, result, name in entries]
+        described = get_description_service().describe_many(client, items, batch_size=describe_batch)
+        for (path, prefix, result, _), (description, source) in zip(entries, described):
+            with open(prefix + ".txt", "w", encoding="utf-8") as f:
+                f.write(description)
+            record_result(path, result, description, source)
+
+    def on_result(path, result, error):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with lock:
+            if error is not None or result is None:
+                counts["failed"] += 1
+                print(f"変換に失敗しました: {path}: {error or UNREADABLE}")
+                return
+            if shape_index is not None and result["descriptor"] is not None:
+                for entry in [path] + duplicates_of.get(path, []):
+                    shape_index.add(entry, result["descriptor"])
+        stored = False
+        if glyph_store is not None and result["approx_contour"] is not None:
+            for entry in [path] + duplicates_of.get(path, []):
+                glyph_store.add(result["approx_contour"], result["shape"],
+                                os.path.splitext(os.path.basename(entry))[0])
+            stored = True
+        if write_png or not stored:
+            result["image"].save(os.path.join(output_dir, f"{name}.png"))
+        glyph = glyph_of(result["image"])
+        if glyph is not None:
+            if svg:
+                save_svg(os.path.join(output_dir, f"{name}.svg"), glyph)
+            if pdf_writer is not None:
+                with lock:
+                    for _ in [path] + duplicates_of.get(path, []):
+                        pdf_writer.add_page(glyph)
+        # 大きさ別の画像は並列にエンコードし、その間に残りの結果を保存する
+        encoded = [encoder.submit(image.save, os.path.join(output_dir, f"{name}_{size}px.png"))
+                   for size, image in result["sizes"].items()] if encoder is not None else []
+        for level, variant in result["variants"].items():
+            variant.save(os.path.join(output_dir, f"{name}_d{level}.png"))
+        if result["animation"] is not None:
+            save_animation(os.path.join(output_dir, f"{name}.gif"),
+                           result["animation"]["frames"], result["animation"]["durations"])
+        if request_writer is not None:
+            # 重複画像には代表画像の説明文をコピーするため、取り込み時に一緒に置き換える
+            request_writer.add(name, result["contour_features"], name,
+                               [os.path.splitext(os.path.basename(entry))[0] for entry in duplicates_of.get(path, [])])
+            description, source = get_description_service().describe_any(None, result["contour_features"], name)
+            with open(os.path.join(output_dir, f"{name}.txt"), "w", encoding="utf-8") as f:
+                f.write(description)
+            record_result(path, result, description, source)
+        elif batch_describe:
+            # 説明はまとめて生成する（揃った分はこのワーカーで依頼する）
+            with lock:
+                pending_descriptions.append((path, result_prefix(path), result, name))
+                entries = None
+                if len(pending_descriptions) >= describe_batch:
+                    entries = pending_descriptions[:]
+                    pending_descriptions.clear()
+            if entries:
+                write_descriptions(entries)
+        else:
+            with open(os.path.join(output_dir, f"{name}.txt"), "w", encoding="utf-8") as f:
+                f.write(result["description"])
+            record_result(path, result, result["description"], result["description_source"])
+        for future in encoded:
+            future.result()
+        # 保存が終わってからストアに登録する（途中で落ちても壊れた結果を使い回さない）
+        if hash_store is not None and path in hashes:
+            hash_store.add(hashes[path], result_prefix(path))
+        with lock:
+            counts["done"] += 1
+
+    print(f"{len(paths)}枚の画像を変換します（メモリ予算: {memory_budget_mb}MB, 最大ワーカー数: {scheduler.max_workers}）")
+    start = time.perf_counter()
+    # バッチではワーカー1つにつきOpenCVは1スレッド
+    apply_policy(BATCH)
+    stats = scheduler.run(
+        paths,
+        lambda path: convert_image(path, client, detail_levels=detail_levels, describe=not batch_describe and request_writer is None,
+                                   sizes=sizes),
+        on_result,
+    )
+    if pending_descriptions:
+        write_descriptions(pending_descriptions)
+    if request_writer is not None:
+        request_writer.close()
+        print(f"説明生成のリクエストを{request_writer.count}件書き出しました: {describe_offline}")
+    if glyph_store is not None:
+        print(f"輪郭をストアに保存しました: {glyph_store_path}（{len(glyph_store)}件）")
+        glyph_store.close()
+    if encoder is not None:
+        encoder.shutdown()
+    if atlas is not None:
+        atlas.close()
+        print(f"{atlas.glyph_count}個の象形文字を{atlas.page_count}ページのアトラスにまとめました: {atlas.index_path}")
+    if pdf_writer is not None:
+        pdf_writer.close()
+        print(f"{pdf_writer.page_count}ページのPDFを書き出しました: {pdf_path}")
+    if exporter is not None:
+        exporter.close()
+        print(f"変換結果を{exporter.rows_written}行エクスポートしました: {export_path}")
+    elapsed = time.perf_counter() - start
+    if shape_index is not None:
+        shape_index.save(index_path)
+        print(f"形状インデックスを保存しました: {index_path}（{len(shape_index)}件）")
+
+    if hash_store is not None:
+        counts["deduplicated"] = copy_duplicate_results(duplicates, result_prefix, detail_levels, sizes)
+        hash_store.close()
+        ratio = len(duplicates) / all_count if all_count else 0.0
+        per_image = elapsed / len(paths) if paths else 0.0
+        saved = max(0.0, per_image * len(duplicates) - hash_elapsed)
+        print(f"重複排除率: {ratio:.1%}（{counts['deduplicated']}枚の結果をコピー）, "
+              f"推定短縮時間: {saved:.1f}秒")
+
+    print(f"完了: {counts['done']}枚, 失敗: {counts['failed']}枚, 時間: {elapsed:.1f}秒")
+    print(f"ピークRSS: {stats['peak_rss'] / 1024 / 1024:.0f}MB, "
+          f"予約のピーク: {stats['peak_reserved'] / 1024 / 1024:.0f}MB, "
+          f"同時実行数の変更: {stats['concurrency_changes']}回（最小{stats['min_concurrency']}）")
+    print(f"説明生成: {get_description_service().metrics()}")
+    # 予算切れで待つのをやめ、まだ始まっていない説明の生成は取り消す
+    get_description_service().shutdown()
+    return counts
+
+
+def iter_sources(source):
+    """アーカイブのメンバー、またはフォルダの画像を (名前, バイト列) で順に返す"""
+    if is_archive(source):
+        yield from iter_archive(source, IMAGE_EXTENSIONS)
+        return
+    for path in list_images(source):
+        with open(path, "rb") as f:
+            yield os.path.basename(path), f.read()
+
+
+def run_archive(source, output, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, workers=None, use_api=True,
+                detail_levels=(), sizes=()):
+    """アーカイブ（またはフォルダ）の画像を展開せずに変換し、フォルダまたは tar に書き出す
+
+    メンバーはメモリ予算の範囲で1つずつ読み、ファイルには展開しない。
+    出力が .tar / .tar.gz の場合はPNG・説明文を一時ファイルなしで tar に追記し、
+    最後に各画像の特徴と説明の取得元を manifest.jsonl として追加する。
+    """
+    sink = open_sink(output)
+    client = get_client() if use_api else None
+    scheduler = MemoryBudgetScheduler(memory_budget_mb * 1024 * 1024, workers, estimate_fn=estimate_member_memory)
+    lock = threading.Lock()
+    counts = {"done": 0, "failed": 0}
+    manifest = []
+
+    def convert(member):
+        name, data = member
+        return convert_image(name, client, detail_levels=detail_levels, sizes=sizes, data=data)
+
+    def on_result(member, result, error):
+        name = member[0]
+        if error is not None or result is None:
+            with lock:
+                counts["failed"] += 1
+            print(f"変換に失敗しました: {name}: {error or UNREADABLE}")
+            return
+        base = safe_member_name(os.path.splitext(name)[0])
+        sink.write(f"{base}.png", encode_png(result["image"]))
+        for level, variant in result["variants"].items():
+            sink.write(f"{base}_d{level}.png", encode_png(variant))
+        for size, image in result["sizes"].items():
+            sink.write(f"{base}_{size}px.png", encode_png(image))
+        sink.write(f"{base}.txt", result["description"].encode("utf-8"))
+        features = result["contour_features"]
+        with lock:
+            counts["done"] += 1
+            manifest.append({
+                "name": base,
+                "source": name,
+                "description_source": result["description_source"],
+                "contour_features": None if features is None else {
+                    "points_count": int(features["points_count"]),
+                    "is_closed": bool(features["is_closed"]),
+                    "area": float(features["area"]),
+                    "perimeter": float(features["perimeter"]),
+                    "is_convex": bool(features["is_convex"]),
+                },
+            })
+
+    target = "tar" if is_tar_output(output) else "フォルダ"
+    print(f"{source} を変換して{target}に書き出します: {output}")
+    start = time.perf_counter()
+    apply_policy(BATCH)
+    # メンバーはスケジューラーが予算を確保してから読む（アーカイブ全体をメモリに載せない）
+    stats = scheduler.run(iter_sources(source), convert, on_result)
+    manifest_data = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in manifest)
+    sink.write("manifest.jsonl", manifest_data.encode("utf-8"))
+    sink.close()
+    elapsed = time.perf_counter() - start
+    print(f"完了: {counts['done']}枚, 失敗: {counts['failed']}枚, 時間: {elapsed:.1f}秒, "
+          f"ピークRSS: {stats['peak_rss'] / 1024 / 1024:.0f}MB")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="画像フォルダを象形文字に一括変換")
+    parser.add_argument("input_dir", help="入力画像のフォルダ、または zip / tar アーカイブ")
+    parser.add_argument("output_dir", help="変換結果の保存先フォルダ、または .tar / .tar.gz")
+    parser.add_argument("--memory-budget", type=int, default=DEFAULT_MEMORY_BUDGET_MB, help="メモリ予算（MB）")
+    parser.add_argument("--workers", type=int, default=None, help="最大ワーカー数（既定はCPUコア数）")
+    parser.add_argument("--no-api", action="store_true", help="ChatGPT APIを使わずローカルの説明を使う")
+    parser.add_argument("--detail-levels", default="",
+                        help="追加で出力する単純化レベル（カンマ区切り、例: 5,10,30）")
+    parser.add_argument("--index", default=None, help="形状記述子のインデックスの保存先（.npz）")
+    parser.add_argument("--dedupe", action="store_true", help="ほぼ同じ画像は変換せず結果をコピーする")
+    parser.add_argument("--dedupe-store", default=None,
+                        help="重複排除のハッシュの保存先（.sqlite、過去のバッチの結果も使い回す）")
+    parser.add_argument("--dedupe-threshold", type=int, default=DEFAULT_THRESHOLD,
+                        help="重複とみなすハミング距離（64ビット中）")
+    parser.add_argument("--describe-batch", type=int, default=0,
+                        help=f"説明をまとめて生成する枚数（例: {DESCRIPTION_BATCH_SIZE}、0なら1枚ずつ）")
+    parser.add_argument("--describe-offline", default=None,
+                        help="説明生成のリクエストをJSONLに書き出す（batch_requests.py で投入・取り込み）")
+    parser.add_argument("--export", default=None,
+                        help="特徴・頂点・説明文・処理時間を列指向のファイルに追記する（.npz）")
+    parser.add_argument("--glyph-store", default=None,
+                        help="輪郭の頂点をベクターストアに追記する（glyph_store.py で任意の大きさに描画）")
+    parser.add_argument("--no-png", action="store_true",
+                        help="ストアに保存した象形文字のPNGを書き出さない（--glyph-store と併用）")
+    parser.add_argument("--sizes", default="",
+                        help="追加で出力する画像の大きさ（一辺のピクセル数、カンマ区切り、例: 64,256,1024）")
+    parser.add_argument("--atlas", default=None, choices=("grid", "packed"),
+                        help="象形文字をアトラス画像とJSONのインデックスにまとめる")
+    parser.add_argument("--atlas-cell-size", type=int, default=128, help="アトラスの1マスの大きさ（ピクセル）")
+    parser.add_argument("--svg", action="store_true", help="象形文字ごとにSVGも書き出す")
+    parser.add_argument("--pdf", default=None, help="全ての象形文字を1つの複数ページのPDFに書き出す")
+    args = parser.parse_args()
+    if args.no_png and not args.glyph_store:
+        parser.error("--no-png は --glyph-store と併用してください")
+    if args.no_png and (args.dedupe or args.dedupe_store):
+        parser.error("重複排除は結果のPNGをコピーするため --no-png と併用できません")
+    if args.describe_offline and (args.export or args.atlas):
+        parser.error("--describe-offline の説明文は取り込み時に --export・--atlas へ反映できないため併用できません")
+
+    detail_levels = tuple(int(level) for level in args.detail_levels.split(",") if level.strip())
+    sizes = tuple(int(size) for size in args.sizes.split(",") if size.strip())
+    if is_archive(args.input_dir) or is_tar_output(args.output_dir):
+        # アーカイブの入出力では画像ごとの変換と保存だけを行う
+        unsupported = [option for option, value in (
+            ("--index", args.index), ("--dedupe", args.dedupe or args.dedupe_store),
+            ("--describe-batch", args.describe_batch), ("--describe-offline", args.describe_offline),
+            ("--export", args.export), ("--glyph-store", args.glyph_store), ("--atlas", args.atlas),
+            ("--svg", args.svg), ("--pdf", args.pdf)) if value]
+        if unsupported:
+            parser.error(f"アーカイブの入出力では使えません: {', '.join(unsupported)}")
+        run_archive(args.input_dir, args.output_dir, args.memory_budget, args.workers,
+                    use_api=not args.no_api, detail_levels=detail_levels, sizes=sizes)
+        return 0
+    run_batch(args.input_dir, args.output_dir, args.memory_budget, args.workers,
+              use_api=not args.no_api, detail_levels=detail_levels, index_path=args.index,
+              dedupe=args.dedupe, dedupe_store=args.dedupe_store, dedupe_threshold=args.dedupe_threshold,
+              describe_batch=args.describe_batch, describe_offline=args.describe_offline,
+              export_path=args.export, glyph_store_path=args.glyph_store, write_png=not args.no_png,
+              svg=args.svg, pdf_path=args.pdf, sizes=sizes,
+              atlas_layout=args.atlas, atlas_cell_size=args.atlas_cell_size)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
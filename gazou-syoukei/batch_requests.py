@@ -0,0 +1,272 @@
+"""説明文のオフライン一括生成（JSONLのリクエストファイル）
+
+夜間バッチのように応答の速さが不要な場合、画像処理の間はAPIを呼ばず、
+説明生成のプロンプトをJSONLのリクエストファイルに書き出しておく。
+後からBatch APIに投入し（またはローカルで代わりに処理し）、
+結果ファイルを取り込んで出力フォルダの説明文を置き換える。
+
+使い方:
+    python batch.py 入力フォルダ 出力フォルダ --describe-offline requests.jsonl
+    python batch_requests.py submit requests.jsonl
+    python batch_requests.py status requests.jsonl            # 完了していれば結果をダウンロード
+    python batch_requests.py submit requests.jsonl --local    # APIを使わずローカルで処理
+    python batch_requests.py ingest requests.results.jsonl 出力フォルダ
+"""
+import os
+import sys
+import json
+import argparse
+import threading
+
+from descriptions import (
+    MAX_TOKENS, MODEL, SYSTEM_PROMPT, TEMPERATURE,
+    LocalDescriptionEngine, build_character_prompt, build_simple_prompt,
+)
+
+ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+
+
+def _sidecar_path(request_path, suffix):
+    base, _ = os.path.splitext(request_path)
+    return f"{base}.{suffix}"
+
+
+def features_path(request_path):
+    """ローカル処理用に輪郭の特徴を保存するファイル"""
+    return _sidecar_path(request_path, "features.jsonl")
+
+
+def state_path(request_path):
+    """投入したバッチのIDなどを保存するファイル"""
+    return _sidecar_path(request_path, "batch.json")
+
+
+def results_path(request_path):
+    """結果ファイルの既定の保存先"""
+    return _sidecar_path(request_path, "results.jsonl")
+
+
+def build_request(custom_id, contour_features, image_name):
+    """1画像分のBatch APIのリクエスト行を作成"""
+    if contour_features is None:
+        prompt = build_simple_prompt(image_name)
+    else:
+        prompt = build_character_prompt(contour_features, image_name)
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": ENDPOINT,
+        "body": {
+            "model": MODEL,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            "max_tokens": MAX_TOKENS,
+            "temperature": TEMPERATURE,
+        },
+    }
+
+
+def _json_features(contour_features):
+    if contour_features is None:
+        return None
+    return {
+        "points_count": int(contour_features["points_count"]),
+        "is_closed": bool(contour_features["is_closed"]),
+        "area": float(contour_features["area"]),
+        "perimeter": float(contour_features["perimeter"]),
+        "is_convex": bool(contour_features["is_convex"]),
+    }
+
+
+class RequestFileWriter:
+    """リクエストファイルを作成し1行ずつ書き込む（複数のワーカーから呼んでよい）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._requests = open(path, "w", encoding="utf-8")
+        self._features = open(features_path(path), "w", encoding="utf-8")
+        self.count = 0
+
+    def add(self, custom_id, contour_features, image_name, duplicates=()):
+        """duplicates には、同じ説明文を書き込む重複画像の出力名を指定する"""
+        request = json.dumps(build_request(custom_id, contour_features, image_name), ensure_ascii=False)
+        features = json.dumps({"custom_id": custom_id, "image_name": image_name,
+                               "contour_features": _json_features(contour_features),
+                               "duplicates": list(duplicates)}, ensure_ascii=False)
+        with self._lock:
+            self._requests.write(request + "\n")
+            self._features.write(features + "\n")
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._requests.close()
+            self._features.close()
+
+
+def _read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _result_line(custom_id, content):
+    """Batch APIの結果ファイルと同じ形式の1行"""
+    return {
+        "id": f"local-{custom_id}",
+        "custom_id": custom_id,
+        "response": {
+            "status_code": 200,
+            "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]},
+        },
+        "error": None,
+    }
+
+
+def process_locally(request_path, output_path=None):
+    """Batch APIの代わりにローカルエンジンで処理し、同じ形式の結果ファイルを作る"""
+    output_path = output_path or results_path(request_path)
+    engine = LocalDescriptionEngine()
+    count = 0
+    with open(output_path, "w", encoding="utf-8") as f:
+        for entry in _read_jsonl(features_path(request_path)):
+            if entry["contour_features"] is None:
+                content = engine.describe_simple(entry["image_name"])
+            else:
+                content = engine.describe(entry["contour_features"], entry["image_name"])
+            f.write(json.dumps(_result_line(entry["custom_id"], content), ensure_ascii=False) + "\n")
+            count += 1
+    print(f"ローカルで{count}件の説明を生成しました: {output_path}")
+    return output_path
+
+
+def submit(client, request_path):
+    """リクエストファイルをアップロードしてバッチを作成し、IDを保存する"""
+    with open(request_path, "rb") as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=ENDPOINT,
+        completion_window=COMPLETION_WINDOW,
+    )
+    with open(state_path(request_path), "w", encoding="utf-8") as f:
+        json.dump({"batch_id": batch.id, "input_file_id": uploaded.id}, f)
+    print(f"バッチを投入しました: {batch.id}（状態: {batch.status}）")
+    return batch.id
+
+
+def fetch_results(client, request_path, output_path=None):
+    """バッチの状態を確認し、完了していれば結果ファイルをダウンロードする
+
+    ダウンロードした場合は保存先を、まだ完了していない場合は None を返す。
+    """
+    with open(state_path(request_path), "r", encoding="utf-8") as f:
+        state = json.load(f)
+    batch = client.batches.retrieve(state["batch_id"])
+    counts = getattr(batch, "request_counts", None)
+    if counts is not None:
+        print(f"バッチ {batch.id}: {batch.status}（完了 {counts.completed}/{counts.total}, 失敗 {counts.failed}）")
+    else:
+        print(f"バッチ {batch.id}: {batch.status}")
+    if batch.status != "completed" or not batch.output_file_id:
+        return None
+
+    output_path = output_path or results_path(request_path)
+    content = client.files.content(batch.output_file_id)
+    with open(output_path, "wb") as f:
+        f.write(content.read())
+    print(f"結果をダウンロードしました: {output_path}")
+    return output_path
+
+
+def _duplicates_for(results_file, request_path=None):
+    """{custom_id: [重複画像の出力名]} を特徴のファイルから読む
+
+    request_path を省略した場合は、結果ファイルの既定の名前（リクエスト名.results.jsonl）から探す。
+    """
+    if request_path is not None:
+        path = features_path(request_path)
+    elif results_file.endswith(".results.jsonl"):
+        path = results_file[:-len(".results.jsonl")] + ".features.jsonl"
+    else:
+        return {}
+    if not os.path.exists(path):
+        return {}
+    return {entry["custom_id"]: entry.get("duplicates", []) for entry in _read_jsonl(path)}
+
+
+def ingest(results_file, output_dir, request_path=None):
+    """結果ファイルの説明文を、custom_id に対応する出力フォルダの説明文に書き込む
+
+    重複排除で結果をコピーした画像の説明文も同じ内容で置き換える。
+    失敗した行の説明文は書き換えない（画像処理時のローカルの説明が残る）。
+    """
+    duplicates = _duplicates_for(results_file, request_path)
+    written = failed = 0
+    for entry in _read_jsonl(results_file):
+        custom_id = entry.get("custom_id")
+        response = entry.get("response") or {}
+        try:
+            if entry.get("error") or response.get("status_code") != 200:
+                raise ValueError(entry.get("error") or response.get("status_code"))
+            content = response["body"]["choices"][0]["message"]["content"].strip()
+        except (KeyError, IndexError, TypeError, ValueError, AttributeError) as e:
+            print(f"結果を取り込めませんでした: {custom_id}: {e}")
+            failed += 1
+            continue
+        # custom_id は出力フォルダからの相対名（フォルダの外には書き込まない）
+        for name in [custom_id] + duplicates.get(custom_id, []):
+            target = os.path.join(output_dir, os.path.basename(str(name)) + ".txt")
+            with open(target, "w", encoding="utf-8") as f:
+                f.write(content)
+        written += 1
+    print(f"{written}件の説明文を取り込みました（失敗: {failed}件）")
+    return written, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="説明文のオフライン一括生成")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = commands.add_parser("submit", help="リクエストファイルをBatch APIに投入する")
+    submit_parser.add_argument("requests", help="batch.py --describe-offline で作成したファイル")
+    submit_parser.add_argument("--local", action="store_true", help="APIを使わずローカルで処理する")
+
+    status_parser = commands.add_parser("status", help="バッチの状態を確認し、完了していれば結果を保存する")
+    status_parser.add_argument("requests")
+    status_parser.add_argument("--output", default=None, help="結果ファイルの保存先")
+
+    ingest_parser = commands.add_parser("ingest", help="結果ファイルを出力フォルダに取り込む")
+    ingest_parser.add_argument("results", help="結果ファイル（JSONL）")
+    ingest_parser.add_argument("output_dir", help="batch.py の出力フォルダ")
+    ingest_parser.add_argument("--requests", default=None,
+                               help="リクエストファイル（重複画像の説明文も置き換える。既定は結果ファイルの名前から探す）")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        ingest(args.results, args.output_dir, args.requests)
+        return 0
+    if args.command == "submit" and args.local:
+        process_locally(args.requests)
+        return 0
+
+    from openai_client import get_client
+
+    client = get_client()
+    if client is None:
+        print("APIキーが設定されていません（--local でローカル処理できます）")
+        return 1
+    if args.command == "submit":
+        submit(client, args.requests)
+        return 0
+    return 0 if fetch_results(client, args.requests, args.output) else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""スレッド数ポリシーごとの変換スループットを計測するベンチマーク
+
+使い方:
+    python benchmark_threads.py                 # 合成画像で計測
+    python benchmark_threads.py 画像フォルダ     # フォルダ内の画像で計測
+    python benchmark_threads.py --count 64 --workers 8
+"""
+import os
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from concurrency import (
+    SINGLE_IMAGE, cpu_count, apply_policy, opencv_threads, make_executor,
+)
+from pipeline import main_preset
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif")
+
+# main.py と同じ変換（説明の生成はAPIの待ち時間になるため計測しない）
+BENCHMARK_PIPELINE = main_preset()
+
+
+def make_synthetic_images(count, size=(1080, 1920)):
+    """楕円を描いた合成画像を作成（PNGにエンコードしたバイト列のリスト）"""
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        img = rng.integers(0, 40, size=(size[0], size[1], 3), dtype=np.uint8)
+        for _ in range(5):
+            center = (int(rng.integers(0, size[1])), int(rng.integers(0, size[0])))
+            axes = (int(rng.integers(50, 400)), int(rng.integers(50, 400)))
+            color = tuple(int(c) for c in rng.integers(80, 255, size=3))
+            cv2.ellipse(img, center, axes, float(rng.integers(0, 180)), 0, 360, color, -1)
+        images.append(cv2.imencode(".png", img)[1].tobytes())
+    return images
+
+
+def load_images(folder):
+    """フォルダ内の画像ファイルの中身を読み込む（デコードは変換の中で行う）"""
+    images = []
+    for name in sorted(os.listdir(folder)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(folder, name), "rb") as f:
+                images.append(f.read())
+    return images
+
+
+def convert(data):
+    """main.py の変換パイプライン（デコード → Canny → 輪郭 → 単純化 → 描画）を実行し、頂点数を返す"""
+    context = BENCHMARK_PIPELINE.run(context={"path": "<benchmark>", "name": "benchmark", "data": data},
+                                     until="renderer")
+    if context is None or context.get("approx_contour") is None:
+        return 0
+    return len(context["approx_contour"])
+
+
+def run_serial(images):
+    for img in images:
+        convert(img)
+
+
+def run_pool(images, kind, workers):
+    with make_executor(kind, workers) as executor:
+        list(executor.map(convert, images, chunksize=max(1, len(images) // (workers * 4))))
+
+
+def benchmark(images, workers):
+    """各ポリシーで処理時間を計測"""
+    cores = cpu_count()
+    cases = [
+        ("単一画像ポリシー（OpenCV全コア・逐次）", lambda: run_serial(images), cores),
+        ("スレッドプール（OpenCV既定スレッド・過剰）", lambda: run_pool(images, "thread", workers), cores),
+        ("スレッドプール（1スレッド/ワーカー）", lambda: run_pool(images, "thread", workers), 1),
+        ("プロセスプール（1スレッド/ワーカー）", lambda: run_pool(images, "process", workers), 1),
+    ]
+
+    apply_policy(SINGLE_IMAGE)
+    results = []
+    for name, run, cv_threads in cases:
+        with opencv_threads(cv_threads):
+            # ウォームアップ
+            convert(images[0])
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+        results.append((name, elapsed, len(images) / elapsed))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenCVスレッド数ポリシーのベンチマーク")
+    parser.add_argument("folder", nargs="?", help="計測に使う画像フォルダ（省略時は合成画像）")
+    parser.add_argument("--count", type=int, default=32, help="合成画像の枚数")
+    parser.add_argument("--workers", type=int, default=cpu_count(), help="バッチのワーカー数")
+    args = parser.parse_args()
+
+    images = load_images(args.folder) if args.folder else make_synthetic_images(args.count)
+    if not images:
+        print("画像が見つかりませんでした")
+        return 1
+
+    print(f"画像数: {len(images)}, CPUコア数: {cpu_count()}, ワーカー数: {args.workers}")
+    print(f"{'ポリシー':<40} {'時間(秒)':>10} {'枚/秒':>10}")
+    for name, elapsed, throughput in benchmark(images, args.workers):
+        print(f"{name:<40} {elapsed:>10.2f} {throughput:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""API呼び出し用のサーキットブレーカー
+
+連続して失敗した場合は一定時間APIを呼ばずに即座にフォールバックさせ、
+クールダウン後は少数の試行（ハーフオープン）で復旧を確認する。
+試行が probe_timeout_seconds を過ぎても終わらない場合は失敗とみなして再び開く。
+"""
+import time
+import threading
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """ブレーカーが開いているため、呼び出しを行わなかった"""
+
+
+class CircuitBreaker:
+    """連続失敗回数で開閉するサーキットブレーカー"""
+
+    def __init__(self, failure_threshold=5, cooldown_seconds=30.0, half_open_max_calls=1, probe_timeout_seconds=None,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.half_open_max_calls = half_open_max_calls
+        # 省略時はクールダウンと同じ時間
+        self.probe_timeout_seconds = cooldown_seconds if probe_timeout_seconds is None else probe_timeout_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._probe_started_at = 0.0
+        self._metrics = {
+            "opened": 0,
+            "short_circuited": 0,
+            "probes": 0,
+            "probe_timeouts": 0,
+        }
+
+    @property
+    def state(self):
+        """現在の状態（クールダウン経過済みならハーフオープン）"""
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def _refresh_state(self):
+        now = self._clock()
+        if self._state == OPEN and now - self._opened_at >= self.cooldown_seconds:
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+        elif (self._state == HALF_OPEN and self._half_open_calls > 0
+              and now - self._probe_started_at >= self.probe_timeout_seconds):
+            # 応答の無い試行で枠が埋まったままにならないよう、失敗とみなして再び開く
+            self._metrics["probe_timeouts"] += 1
+            self._open()
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._metrics["opened"] += 1
+        print(f"サーキットブレーカーが開きました（{self.cooldown_seconds}秒間APIを呼び出しません）")
+
+    def allow_request(self):
+        """APIを呼び出してよいか判定する（Falseならフォールバックする）"""
+        with self._lock:
+            self._refresh_state()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                self._probe_started_at = self._clock()
+                self._metrics["probes"] += 1
+                return True
+            self._metrics["short_circuited"] += 1
+            return False
+
+    def record_success(self):
+        """呼び出し成功を記録"""
+        with self._lock:
+            if self._state != CLOSED:
+                print("サーキットブレーカーが閉じました（APIが復旧しました）")
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._half_open_calls = 0
+
+    def release(self):
+        """成否の分からないまま終わった呼び出し（キャンセルなど）の試行の枠を返す"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_failure(self):
+        """呼び出し失敗（エラー・タイムアウト）を記録"""
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN:
+                # 試行が失敗したので再びクールダウン
+                self._open()
+            elif self._state == CLOSED and self._consecutive_failures >= self.failure_threshold:
+                self._open()
+
+    def metrics(self):
+        """状態と集計値を返す"""
+        with self._lock:
+            self._refresh_state()
+            metrics = dict(self._metrics)
+            metrics["state"] = self._state
+            metrics["consecutive_failures"] = self._consecutive_failures
+            return metrics
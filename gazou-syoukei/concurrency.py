@@ -0,0 +1,117 @@
+"""OpenCV・BLASのスレッド数の管理
+
+OpenCVは Canny や cvtColor の内部で独自のスレッドプールを使うため、
+複数の変換を同時に走らせるとコア数を超えるスレッドが奪い合いになる。
+実行方法に応じて以下のポリシーを適用する。
+
+- 単一画像: OpenCVに全コアを割り当てる
+- バッチ: ワーカー1つにつきOpenCV・BLASは1スレッド
+"""
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+SINGLE_IMAGE = "single"
+BATCH = "batch"
+
+# BLAS/OpenMP のスレッド数を指定する環境変数
+BLAS_THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+_cv2_lock = threading.Lock()
+
+
+def cpu_count():
+    """利用可能なCPUコア数"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def set_blas_threads(threads):
+    """BLASのスレッド数を設定する
+
+    環境変数は numpy 読み込み前にしか効かないため、読み込み済みの場合は
+    threadpoolctl（インストールされていれば）で実行時に制限する。
+    """
+    for name in BLAS_THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(limits=threads)
+
+
+def set_opencv_threads(threads):
+    """OpenCVの内部スレッド数を設定する（プロセス全体に効く）"""
+    import cv2
+    cv2.setNumThreads(threads)
+
+
+def policy_threads(policy):
+    """ポリシーごとのOpenCV・BLASのスレッド数"""
+    if policy == SINGLE_IMAGE:
+        return cpu_count()
+    if policy == BATCH:
+        return 1
+    raise ValueError(f"不明なポリシーです: {policy}")
+
+
+def apply_policy(policy):
+    """現在のプロセスにポリシーを適用する"""
+    threads = policy_threads(policy)
+    set_blas_threads(threads)
+    set_opencv_threads(threads)
+    return threads
+
+
+def _process_worker_initializer(threads):
+    """プロセスワーカーの初期化（OpenCV・BLASのスレッド数を制限する）
+
+    fork で起動したワーカーは親プロセスで読み込み済みの cv2・numpy を引き継ぐため、
+    環境変数はワーカーで新たに読み込むライブラリにしか効かない。読み込み済みのものは
+    cv2.setNumThreads と set_blas_threads（threadpoolctl）で実行時に制限する。
+    """
+    set_blas_threads(threads)
+    set_opencv_threads(threads)
+
+
+@contextmanager
+def opencv_threads(threads):
+    """一時的にOpenCVのスレッド数を変更する"""
+    import cv2
+    with _cv2_lock:
+        previous = cv2.getNumThreads()
+        cv2.setNumThreads(threads)
+    try:
+        yield
+    finally:
+        with _cv2_lock:
+            cv2.setNumThreads(previous)
+
+
+def make_executor(kind="thread", max_workers=None):
+    """バッチ用のエグゼキューターをポリシー付きで作成する
+
+    kind は "thread" または "process"。
+    スレッドプールではOpenCVの設定がプロセス全体で共有されるため、
+    呼び出し側で opencv_threads(1) の範囲内で使うこと。
+    """
+    max_workers = max_workers or cpu_count()
+    if kind == "process":
+        return ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_process_worker_initializer,
+            initargs=(policy_threads(BATCH),),
+        )
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="convert")
+    raise ValueError(f"不明なエグゼキューターの種類です: {kind}")
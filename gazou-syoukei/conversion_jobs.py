@@ -0,0 +1,103 @@
+"""キャンセル可能な変換ジョブ
+
+新しい変換を開始すると、実行中の古い変換はキャンセルされる（世代トークン）。
+古い変換はOpenCVの各段階の境目で停止し、実行中のAPIリクエストは中断され、
+遅れて届いた結果は破棄される。
+"""
+import threading
+
+
+class ConversionCancelled(Exception):
+    """変換がキャンセルされた（新しい変換に置き換えられた）"""
+
+
+def check_cancelled(token):
+    """token が指定されていてキャンセル済みなら ConversionCancelled を送出する"""
+    if token is not None:
+        token.check()
+
+
+class CancelToken:
+    """変換1回分のキャンセル状態を表すトークン"""
+
+    def __init__(self, generation):
+        self.generation = generation
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._abort_callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """キャンセルし、登録された中断処理（APIリクエストのクローズなど）を呼ぶ"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = self._abort_callbacks
+            self._abort_callbacks = []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"中断処理でエラーが発生しました: {e}")
+
+    def check(self):
+        """キャンセル済みなら ConversionCancelled を送出する（段階の境目で呼ぶ）"""
+        if self._event.is_set():
+            raise ConversionCancelled(f"変換（世代{self.generation}）はキャンセルされました")
+
+    def wait(self, timeout):
+        """キャンセルされるか timeout 秒経過するまで待つ（キャンセル時はTrue）"""
+        return self._event.wait(timeout)
+
+    def add_abort_callback(self, callback):
+        """キャンセル時に呼ぶ中断処理を登録する（キャンセル済みなら即座に呼ぶ）"""
+        with self._lock:
+            if not self._event.is_set():
+                self._abort_callbacks.append(callback)
+                return
+        callback()
+
+    def remove_abort_callback(self, callback):
+        with self._lock:
+            if callback in self._abort_callbacks:
+                self._abort_callbacks.remove(callback)
+
+
+class ConversionJobs:
+    """最新の変換だけを有効にするジョブ管理"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._current = None
+
+    def start(self, target, *args):
+        """古い変換をキャンセルし、新しい世代で target(token, *args) を別スレッドで実行する"""
+        with self._lock:
+            self._generation += 1
+            previous = self._current
+            token = CancelToken(self._generation)
+            self._current = token
+        if previous is not None:
+            previous.cancel()
+            print(f"変換（世代{previous.generation}）を新しい変換で置き換えました")
+
+        threading.Thread(target=target, args=(token,) + args, daemon=True).start()
+        return token
+
+    def is_current(self, token):
+        """token が最新の変換かどうか（古い結果を破棄する判定に使う）"""
+        with self._lock:
+            return token is self._current and not token.cancelled
+
+    def cancel_all(self):
+        """実行中の変換をキャンセルする"""
+        with self._lock:
+            current = self._current
+            self._current = None
+        if current is not None:
+            current.cancel()
@@ -0,0 +1,150 @@
+"""知覚ハッシュによる入力画像の重複排除
+
+縮小デコードした画像から dHash（64ビット）を計算し、ハミング距離が
+しきい値以下の画像を「ほぼ同じ画像」とみなす。重複した画像は変換せず、
+既に変換済みの結果を使い回す。過去のバッチの結果はSQLiteのストアに保存する。
+"""
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+HASH_SIZE = 8
+
+# ハミング距離がこの値以下なら重複とみなす（64ビット中）
+DEFAULT_THRESHOLD = 4
+
+# 縮小した画像の明るさの幅がこの値未満なら、ほぼ一様な画像としてハッシュを求めない
+MIN_CONTRAST = 2
+
+
+def dhash(path, hash_size=HASH_SIZE):
+    """画像の dHash を計算する（JPEGはdraftで縮小デコード）
+
+    真っ白・真っ黒などほぼ一様な画像は、内容に関係なく全てのビットが0になって
+    互いに一致してしまうため None を返す（重複排除の対象にしない）。
+    """
+    from PIL import Image
+
+    with Image.open(path) as img:
+        img.draft("L", (hash_size * 8, hash_size * 8))
+        small = img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    if pixels.max() - pixels.min() < MIN_CONTRAST:
+        return None
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hamming_distances(hashes, value):
+    """ハッシュ配列と1つのハッシュのハミング距離をまとめて計算する"""
+    return np.bitwise_count(hashes ^ np.uint64(value))
+
+
+class HashStore:
+    """変換済み画像のハッシュと結果の場所を保存するストア
+
+    path を省略するとメモリ上だけで管理する（1回のバッチ内の重複排除）。
+    """
+
+    def __init__(self, path=None, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._hashes = np.zeros(1024, dtype=np.uint64)
+        self._results = []
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS hashes (hash TEXT NOT NULL, result TEXT NOT NULL)")
+            for value, result in self._db.execute("SELECT hash, result FROM hashes"):
+                self._append(int(value, 16), result)
+
+    def __len__(self):
+        return len(self._results)
+
+    def _append(self, value, result):
+        count = len(self._results)
+        if count == len(self._hashes):
+            hashes = np.zeros(count * 2, dtype=np.uint64)
+            hashes[:count] = self._hashes
+            self._hashes = hashes
+        self._hashes[count] = value
+        self._results.append(result)
+
+    def find(self, value):
+        """しきい値以内で最も近い登録済みの結果を返す（無ければ None）"""
+        with self._lock:
+            count = len(self._results)
+            if count == 0:
+                return None
+            distances = hamming_distances(self._hashes[:count], value)
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= self.threshold:
+                return self._results[nearest]
+            return None
+
+    def add(self, value, result):
+        """ハッシュと結果の場所を登録する"""
+        with self._lock:
+            self._append(value, result)
+            if self._db is not None:
+                self._db.execute("INSERT INTO hashes (hash, result) VALUES (?, ?)", (f"{value:016x}", result))
+
+    def commit(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self.commit()
+            self._db.close()
+            self._db = None
+
+
+def _safe_hash(hash_fn, path):
+    try:
+        return hash_fn(path)
+    except Exception as e:
+        print(f"ハッシュの計算に失敗しました: {path}: {e}")
+        return None
+
+
+def plan_dedupe(paths, store, result_fn, hash_fn=dhash, workers=4):
+    """変換する画像と、既存の結果を使い回す画像に振り分ける
+
+    result_fn(path) は画像の結果の場所（拡張子なしの出力パス）を返す関数。
+    戻り値は (変換する画像のリスト, {重複画像: 使い回す結果の場所}, {画像: ハッシュ})。
+    バッチ内で先に出てきた画像を代表とし、ストアに一致するものは過去の結果を使う。
+    ハッシュを求められない画像（読めない・ほぼ一様）は全て変換する。
+    """
+    unique = []
+    duplicates = {}
+    hashes = {}
+    batch_store = HashStore(threshold=store.threshold)
+
+    # ハッシュの計算（縮小デコード）は並列に行い、振り分けは入力順に行う
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dhash") as executor:
+        values = list(executor.map(lambda path: _safe_hash(hash_fn, path), paths))
+
+    for path, value in zip(paths, values):
+        if value is None:
+            unique.append(path)
+            continue
+        hashes[path] = value
+
+        existing = batch_store.find(value)
+        if existing is None:
+            existing = store.find(value)
+            if existing is not None and not os.path.exists(existing + ".png"):
+                # 過去の結果が削除されている場合は変換し直す
+                existing = None
+        if existing is not None:
+            duplicates[path] = existing
+            continue
+        batch_store.add(value, result_fn(path))
+        unique.append(path)
+
+    return unique, duplicates, hashes
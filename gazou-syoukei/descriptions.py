@@ -0,0 +1,596 @@
+"""象形文字の説明文生成
+
+ChatGPT APIによる説明生成と、APIが遅い・使えない場合に使うオフラインの
+テンプレート説明エンジンをまとめたモジュール。
+"""
+import os
+import re
+import json
+import math
+import time
+import zlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from circuit_breaker import OPEN, CircuitBreaker, CircuitOpenError
+from conversion_jobs import ConversionCancelled
+
+MODEL = "gpt-3.5-turbo"
+MAX_TOKENS = 200
+TEMPERATURE = 0.7
+
+SYSTEM_PROMPT = "あなたは古代文字の専門家です。象形文字の特徴から、その意味や用途を説明してください。"
+
+# APIの応答を待つ上限（ミリ秒）。これを超えるとローカルの説明を返す
+LATENCY_BUDGET_MS = int(os.environ.get("DESCRIPTION_LATENCY_BUDGET_MS", "3000"))
+
+# 予算内に最初のトークンが届いたストリームを、予算を過ぎても待つ上限（ミリ秒）。
+# これを過ぎても終わらなければローカルの説明に切り替える（p99 は 予算 + この値 で頭打ち）
+STREAM_GRACE_MS = int(os.environ.get("DESCRIPTION_STREAM_GRACE_MS", "2000"))
+
+# キャンセルを確認する間隔（秒）
+CANCEL_POLL_SECONDS = 0.05
+
+# 説明文キャッシュの最大件数
+CACHE_SIZE = 1024
+
+# まとめて1回のリクエストで説明を生成する画像の数
+BATCH_SIZE = int(os.environ.get("DESCRIPTION_BATCH_SIZE", "8"))
+
+# サーキットブレーカー設定（連続失敗回数・APIを止める秒数）
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("DESCRIPTION_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.environ.get("DESCRIPTION_BREAKER_COOLDOWN", "30"))
+
+
+def build_character_prompt(contour_features, image_name):
+    """輪郭の特徴から説明生成用のプロンプトを作成"""
+    return f"""
+            以下の特徴を持つ輪郭から生成された象形文字について、古代文字のような説明を100文字程度で作成してください。
+            説明は「この象形文字は...」で始めてください。
+
+            - 画像名: {image_name}
+            - 点の数: {contour_features['points_count']}
+            - 閉じた形状: {'はい' if contour_features['is_closed'] else 'いいえ'}
+            - 面積: {contour_features['area']:.2f}
+            - 周囲長: {contour_features['perimeter']:.2f}
+            - 凸形状: {'はい' if contour_features['is_convex'] else 'いいえ'}
+            """
+
+
+def build_simple_prompt(image_name):
+    """輪郭が見つからない場合のプロンプトを作成"""
+    return f"""
+            「{image_name}」という名前の画像から生成された象形文字について、古代文字のような説明を100文字程度で作成してください。
+            説明は「この象形文字は...」で始めてください。
+            """
+
+
+def _feature_lines(contour_features):
+    return (f"点の数: {contour_features['points_count']}, "
+            f"閉じた形状: {'はい' if contour_features['is_closed'] else 'いいえ'}, "
+            f"面積: {contour_features['area']:.2f}, "
+            f"周囲長: {contour_features['perimeter']:.2f}, "
+            f"凸形状: {'はい' if contour_features['is_convex'] else 'いいえ'}")
+
+
+def build_batch_prompt(items):
+    """複数の画像の説明をまとめて依頼するプロンプトを作成
+
+    items は (contour_features または None, 画像名) のリスト。
+    応答は番号付きのJSON配列で返すよう指示する。
+    """
+    lines = []
+    for number, (contour_features, image_name) in enumerate(items, 1):
+        if contour_features is None:
+            lines.append(f"{number}. 画像名: {image_name}（輪郭なし）")
+        else:
+            lines.append(f"{number}. 画像名: {image_name}, {_feature_lines(contour_features)}")
+    entries = "\n".join(lines)
+    return f"""
+            以下の{len(items)}個の象形文字それぞれについて、古代文字のような説明を100文字程度で作成してください。
+            各説明は「この象形文字は...」で始めてください。
+            回答は次の形式のJSON配列のみとし、他の文章は含めないでください。
+            [{{"id": 1, "description": "この象形文字は..."}}, ...]
+
+{entries}
+            """
+
+
+def parse_batch_response(text, count):
+    """まとめて依頼した応答を解析し、{番号(0始まり): 説明文} を返す
+
+    コードブロックや前後の文章が付いていても、JSON配列の部分を取り出して解析する。
+    配列全体が壊れている場合は個々のオブジェクトを拾い、取れなかった番号は含めない。
+    """
+    text = text.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+
+    items = None
+    start, end = text.find("["), text.rfind("]")
+    if start != -1 and end > start:
+        try:
+            items = json.loads(text[start:end + 1])
+        except ValueError:
+            items = None
+    if not isinstance(items, list):
+        items = []
+        for match in re.finditer(r"\{[^{}]*\}", text):
+            try:
+                items.append(json.loads(match.group(0)))
+            except ValueError:
+                continue
+
+    results = {}
+    for position, item in enumerate(items):
+        if isinstance(item, str):
+            index, description = position, item
+        elif isinstance(item, dict):
+            description = item.get("description")
+            try:
+                index = int(item.get("id", position + 1)) - 1
+            except (TypeError, ValueError):
+                index = position
+        else:
+            continue
+        if isinstance(description, str) and description.strip() and 0 <= index < count:
+            results.setdefault(index, description.strip())
+    return results
+
+
+def fallback_description(image_name):
+    """従来の固定の説明文"""
+    return f"この象形文字は{image_name}を表しています。古代の人々はこの形を使って重要な概念を表現していました。"
+
+
+class LocalDescriptionEngine:
+    """輪郭の特徴からテンプレートを組み合わせて説明文を作るオフラインエンジン
+
+    同じ入力には常に同じ説明を返す（画像名と特徴のハッシュで候補を選ぶ）。
+    """
+
+    SHAPE_PHRASES = {
+        "round": ["丸みを帯びた輪郭は", "円に近いなめらかな形は", "柔らかく閉じた曲線は"],
+        "angular": ["角ばった鋭い輪郭は", "いくつもの角を持つ形は", "折れ曲がる力強い線は"],
+        "simple": ["わずかな線で描かれた素朴な形は", "簡潔な数本の線は", "単純で均整のとれた形は"],
+        "complex": ["細かく入り組んだ輪郭は", "複雑に折り重なる線は", "多くの点を結んだ精緻な形は"],
+    }
+    CONVEX_PHRASES = {
+        True: ["満ち足りた姿や守られたものを", "完全さや調和を", "一つにまとまった力を"],
+        False: ["動きや変化を", "分かれ道や選択を", "内に秘めた奥行きを"],
+    }
+    SIZE_PHRASES = {
+        "large": ["大きく描かれ、", "画面いっぱいに広がり、", "堂々とした大きさで、"],
+        "small": ["小さく控えめに描かれ、", "慎ましい大きさで、", "凝縮された姿で、"],
+    }
+    USAGE_PHRASES = [
+        "祭祀の記録に用いられたと考えられます。",
+        "人々の暮らしの中で標として使われました。",
+        "石碑や土器に刻まれて伝えられてきました。",
+        "季節の移ろいを記す暦にも現れます。",
+        "名を記す際の印としても重宝されました。",
+    ]
+    SIMPLE_PHRASES = [
+        "輪郭ははっきりしませんが、その姿を写し取ろうとした古い記号です。",
+        "形を定めきれない揺らぎそのものが意味を持つと考えられていました。",
+        "ぼんやりとした面の広がりで、対象の気配を表しています。",
+    ]
+
+    def _pick(self, candidates, seed, salt):
+        index = zlib.crc32(f"{seed}:{salt}".encode("utf-8")) % len(candidates)
+        return candidates[index]
+
+    def classify(self, contour_features):
+        """特徴量から形の分類を行う"""
+        points = contour_features.get("points_count", 0)
+        area = float(contour_features.get("area", 0.0))
+        perimeter = float(contour_features.get("perimeter", 0.0))
+
+        # 円形度（1に近いほど円）
+        circularity = 4 * math.pi * area / (perimeter * perimeter) if perimeter > 0 else 0.0
+
+        if points <= 4:
+            shape = "simple"
+        elif points >= 20:
+            shape = "complex"
+        elif circularity >= 0.6:
+            shape = "round"
+        else:
+            shape = "angular"
+
+        size = "large" if area >= 10000 else "small"
+        return shape, size, bool(contour_features.get("is_convex", False))
+
+    def describe(self, contour_features, image_name):
+        """輪郭の特徴から説明文を生成"""
+        shape, size, is_convex = self.classify(contour_features)
+        seed = f"{image_name}:{contour_features.get('points_count', 0)}:{int(contour_features.get('area', 0))}"
+
+        return (
+            f"この象形文字は{image_name}を表しています。"
+            f"{self._pick(self.SIZE_PHRASES[size], seed, 'size')}"
+            f"{self._pick(self.SHAPE_PHRASES[shape], seed, 'shape')}"
+            f"{self._pick(self.CONVEX_PHRASES[is_convex], seed, 'convex')}象徴し、"
+            f"{self._pick(self.USAGE_PHRASES, seed, 'usage')}"
+        )
+
+    def describe_simple(self, image_name):
+        """輪郭が見つからない場合の説明文を生成"""
+        return (
+            f"この象形文字は{image_name}を表しています。"
+            f"{self._pick(self.SIMPLE_PHRASES, image_name, 'simple')}"
+        )
+
+
+class DescriptionService:
+    """ChatGPT APIとローカルエンジンを組み合わせた説明生成サービス
+
+    APIの応答が latency_budget_ms 以内に返らない場合はローカルの説明を返し、
+    backfill が有効なら遅れて届いたAPIの応答をキャッシュに格納する。
+    エラーやタイムアウトが続いた場合はサーキットブレーカーが開き、
+    クールダウンの間はAPIを呼ばずにローカルの説明を返す。予算を過ぎて待つのをやめた
+    リクエストは、まだ始まっていなければ取り消し、遅れて失敗した場合だけ失敗に数える。
+    """
+
+    def __init__(self, latency_budget_ms=LATENCY_BUDGET_MS, backfill=True, max_workers=4, cache_size=CACHE_SIZE, breaker=None,
+                 stream_grace_ms=STREAM_GRACE_MS):
+        self.latency_budget_ms = latency_budget_ms
+        self.stream_grace_ms = stream_grace_ms
+        self.backfill = backfill
+        self.local_engine = LocalDescriptionEngine()
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=BREAKER_FAILURE_THRESHOLD,
+            cooldown_seconds=BREAKER_COOLDOWN_SECONDS,
+        )
+        self._max_workers = max_workers
+        self._executor = None
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self._metrics = {
+            "api": 0,
+            "cache": 0,
+            "local": 0,
+            "hedged": 0,
+            "api_error": 0,
+            "backfilled": 0,
+            "short_circuited": 0,
+            "batch_requests": 0,
+            "batch_missing": 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._metrics[name] += 1
+
+    def metrics(self):
+        """集計値とサーキットブレーカーの状態を返す"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["breaker"] = self.breaker.metrics()
+        return metrics
+
+    def _cache_get(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        return None
+
+    def _cache_put(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def _submit(self, *args):
+        """API呼び出しをワーカーに渡す"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="description")
+            return self._executor.submit(self._call_api, *args)
+
+    def shutdown(self):
+        """まだ始まっていないAPI呼び出しを取り消す（バッチの終了時。次の呼び出しでワーカーを作り直す）"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _call_api(self, client, prompt, token=None, max_tokens=MAX_TOKENS, on_delta=None):
+        """APIを呼び出す（ストリーミングで受信し、キャンセル時は接続を閉じて中断する）
+
+        on_delta を指定すると、受信したトークンの断片をその都度渡す。
+        待っている間にブレーカーが開いた場合は、呼び出さずに CircuitOpenError を送出する。
+        """
+        if self.breaker.state == OPEN:
+            raise CircuitOpenError("サーキットブレーカーが開いているため呼び出しません")
+        stream = client.chat.completions.create(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=TEMPERATURE,
+            stream=True
+        )
+        if token is not None:
+            token.add_abort_callback(stream.close)
+        try:
+            parts = []
+            for chunk in stream:
+                if token is not None:
+                    token.check()
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    if on_delta is not None:
+                        on_delta(chunk.choices[0].delta.content)
+            return "".join(parts).strip()
+        finally:
+            if token is not None:
+                token.remove_abort_callback(stream.close)
+            stream.close()
+
+    def _wait(self, future, token, started=None):
+        """予算内でAPIの応答を待つ（キャンセルされたら ConversionCancelled）
+
+        started（threading.Event）を指定した場合、予算内に最初のトークンが届いていれば
+        表示中のストリームを途中で切り替えないよう、予算を過ぎても stream_grace_ms までは待つ。
+        """
+        if token is None and started is None:
+            return future.result(timeout=self.latency_budget_ms / 1000)
+
+        deadline = time.monotonic() + self.latency_budget_ms / 1000
+        stream_deadline = deadline + self.stream_grace_ms / 1000
+        while True:
+            now = time.monotonic()
+            # 最初のトークンが予算内に届いたかは、予算を過ぎた時点で判定する
+            if now >= deadline and started is not None and started.is_set():
+                remaining = stream_deadline - now
+            else:
+                remaining = deadline - now
+            if remaining <= 0:
+                raise FutureTimeoutError()
+            try:
+                return future.result(timeout=min(remaining, CANCEL_POLL_SECONDS))
+            except FutureTimeoutError:
+                if token is not None and token.cancelled:
+                    future.cancel()
+                    raise ConversionCancelled("説明の生成はキャンセルされました")
+
+    def _settle(self, future, token, on_success=None):
+        """予算切れで待つのをやめたリクエストの成否を、終わった時点でブレーカーに記録する
+
+        遅れても成功したリクエストは失敗に数えない。on_success には応答の本文を渡す。
+        """
+        if future.cancelled() or (token is not None and token.cancelled):
+            self.breaker.release()
+            return
+        if isinstance(future.exception(), CircuitOpenError):
+            self._count("short_circuited")
+            return
+        if future.exception() is not None:
+            self.breaker.record_failure()
+            return
+        self.breaker.record_success()
+        if on_success is not None:
+            on_success(future.result())
+
+    def _backfill(self, key, description):
+        self._cache_put(key, description)
+        self._count("backfilled")
+
+    def _backfill_batch(self, keys, text):
+        for index, description in parse_batch_response(text, len(keys)).items():
+            self._backfill(keys[index], description)
+
+    def _generate(self, client, prompt, key, local_fn, token=None, on_delta=None):
+        """キャッシュ → API（予算内） → ローカル の順で説明文を得る
+
+        戻り値は (説明文, 取得元) で、取得元は "cache" / "api" / "local" のいずれか。
+        token がキャンセルされた場合は実行中のリクエストを中断し ConversionCancelled を送出する。
+        on_delta を指定すると、APIから受信した断片を届いた順に渡す
+        （予算切れでローカルの説明に切り替えた後は渡さない）。
+        """
+        cached = self._cache_get(key)
+        if cached is not None:
+            self._count("cache")
+            return cached, "cache"
+
+        if client is None:
+            self._count("local")
+            return local_fn(), "local"
+
+        # ブレーカーが開いている間はAPIを呼ばない
+        if not self.breaker.allow_request():
+            self._count("short_circuited")
+            return local_fn(), "local"
+
+        started = None
+        stream_fn = None
+        if on_delta is not None:
+            started = threading.Event()
+            delivering = threading.Event()
+            delivering.set()
+
+            def stream_fn(text):
+                started.set()
+                if delivering.is_set():
+                    on_delta(text)
+
+        future = self._submit(client, prompt, token, MAX_TOKENS, stream_fn)
+        try:
+            description = self._wait(future, token, started)
+        except ConversionCancelled:
+            # 成否が分からないので失敗には数えず、ハーフオープンの試行の枠だけを返す
+            self.breaker.release()
+            raise
+        except FutureTimeoutError:
+            if on_delta is not None:
+                delivering.clear()
+            print(f"API応答が{self.latency_budget_ms}ms（受信中のストリームは+{self.stream_grace_ms}ms）を"
+                  f"超えたため、ローカルの説明を使用します")
+            self._count("hedged")
+            # まだ始まっていない呼び出しは取り消す（障害時に待ち行列が溜まらないように）
+            future.cancel()
+            # 失敗かどうかは応答が終わってから決める（遅れて成功した場合は失敗に数えない）
+            on_success = (lambda description: self._backfill(key, description)) if self.backfill else None
+            future.add_done_callback(lambda f: self._settle(f, token, on_success))
+            return local_fn(), "local"
+        except CircuitOpenError:
+            self._count("short_circuited")
+            return local_fn(), "local"
+        except Exception as e:
+            if token is not None and token.cancelled:
+                # キャンセルで接続を閉じたことによるエラー
+                self.breaker.release()
+                raise ConversionCancelled("説明の生成はキャンセルされました") from e
+            print(f"OpenAI API 呼び出し中にエラーが発生しました: {str(e)}")
+            self._count("api_error")
+            self.breaker.record_failure()
+            return local_fn(), "local"
+
+        self.breaker.record_success()
+        self._cache_put(key, description)
+        self._count("api")
+        return description, "api"
+
+    def _character_key(self, contour_features, image_name):
+        return (
+            "character",
+            image_name,
+            contour_features["points_count"],
+            round(float(contour_features["area"]), 1),
+            round(float(contour_features["perimeter"]), 1),
+            bool(contour_features["is_convex"]),
+        )
+
+    def describe_character(self, client, contour_features, image_name, token=None, on_delta=None):
+        """輪郭の特徴から象形文字の説明を生成"""
+        return self._generate(
+            client,
+            build_character_prompt(contour_features, image_name),
+            self._character_key(contour_features, image_name),
+            lambda: self.local_engine.describe(contour_features, image_name),
+            token,
+            on_delta,
+        )
+
+    def describe_any(self, client, contour_features, image_name, token=None, on_delta=None):
+        """contour_features が None なら簡単な説明、そうでなければ輪郭の説明を生成"""
+        if contour_features is None:
+            return self.describe_simple(client, image_name, token, on_delta)
+        return self.describe_character(client, contour_features, image_name, token, on_delta)
+
+    def describe_many(self, client, items, token=None, batch_size=BATCH_SIZE):
+        """複数の画像の説明を、batch_size 件ずつ1回のリクエストにまとめて生成する
+
+        items は (contour_features または None, 画像名) のリストで、
+        戻り値は items と同じ順の (説明文, 取得元) のリスト。
+        キャッシュにあるものは送らず、応答に含まれなかったものは1件ずつ生成し直す。
+        リクエスト自体が失敗した場合はローカルの説明を使う。
+        """
+        results = [None] * len(items)
+        pending = []
+        for position, (contour_features, image_name) in enumerate(items):
+            key = (("simple", image_name) if contour_features is None
+                   else self._character_key(contour_features, image_name))
+            cached = self._cache_get(key)
+            if cached is not None:
+                self._count("cache")
+                results[position] = (cached, "cache")
+            else:
+                pending.append((position, key))
+
+        for start in range(0, len(pending), max(1, batch_size)):
+            chunk = pending[start:start + max(1, batch_size)]
+            if len(chunk) == 1:
+                # 1件だけならまとめる意味がないので通常のリクエストにする
+                position = chunk[0][0]
+                results[position] = self.describe_any(client, *items[position], token)
+                continue
+            chunk_items = [items[position] for position, _ in chunk]
+            parsed = self._request_batch(client, chunk_items, [key for _, key in chunk], token)
+            for offset, (position, key) in enumerate(chunk):
+                contour_features, image_name = items[position]
+                if parsed is None:
+                    local = (self.local_engine.describe_simple(image_name) if contour_features is None
+                             else self.local_engine.describe(contour_features, image_name))
+                    self._count("local")
+                    results[position] = (local, "local")
+                elif offset in parsed:
+                    self._cache_put(key, parsed[offset])
+                    self._count("api")
+                    results[position] = (parsed[offset], "api")
+                else:
+                    # 応答から抜けた分だけ1件ずつ生成し直す
+                    self._count("batch_missing")
+                    results[position] = self.describe_any(client, contour_features, image_name, token)
+        return results
+
+    def _request_batch(self, client, items, keys, token=None):
+        """まとめてAPIに依頼し、{番号: 説明文} を返す（APIを使えない・失敗した・予算内に返らない場合は None）
+
+        1件ずつの場合と同じく latency_budget_ms を過ぎたら待たずに None を返し、
+        遅れて届いた応答は keys（items と同じ順のキャッシュのキー）でキャッシュに格納する。
+        """
+        if client is None:
+            return None
+        if not self.breaker.allow_request():
+            self._count("short_circuited")
+            return None
+        self._count("batch_requests")
+        future = self._submit(client, build_batch_prompt(items), token, MAX_TOKENS * len(items))
+        try:
+            text = self._wait(future, token)
+        except FutureTimeoutError:
+            print(f"API応答が{self.latency_budget_ms}msを超えたため、{len(items)}件ともローカルの説明を使用します")
+            self._count("hedged")
+            future.cancel()
+            on_success = (lambda text: self._backfill_batch(keys, text)) if self.backfill else None
+            future.add_done_callback(lambda f: self._settle(f, token, on_success))
+            return None
+        except ConversionCancelled:
+            self.breaker.release()
+            raise
+        except CircuitOpenError:
+            self._count("short_circuited")
+            return None
+        except Exception as e:
+            if token is not None and token.cancelled:
+                self.breaker.release()
+                raise ConversionCancelled("説明の生成はキャンセルされました") from e
+            print(f"OpenAI API 呼び出し中にエラーが発生しました: {str(e)}")
+            self._count("api_error")
+            self.breaker.record_failure()
+            return None
+        self.breaker.record_success()
+        return parse_batch_response(text, len(items))
+
+    def describe_simple(self, client, image_name, token=None, on_delta=None):
+        """輪郭が見つからない場合の簡単な説明を生成"""
+        return self._generate(
+            client,
+            build_simple_prompt(image_name),
+            ("simple", image_name),
+            lambda: self.local_engine.describe_simple(image_name),
+            token,
+            on_delta,
+        )
+
+
+_service_lock = threading.Lock()
+_service = None
+
+
+def get_description_service():
+    """共有の説明生成サービスを取得"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = DescriptionService()
+        return _service
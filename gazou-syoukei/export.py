@@ -0,0 +1,205 @@
+"""変換結果の列指向エクスポート
+
+画像ごとの輪郭の特徴・単純化した輪郭の頂点・説明文・パラメータ・段階ごとの処理時間を
+1つのNPZ（zip）ファイルに列ごとに保存する。行はバッファに溜め、ROW_GROUP_SIZE 行ごとに
+「列名/行グループ番号.npy」というメンバーとして追記するため、バッチの途中でも書き出せる。
+
+文字列の列は、UTF-8のバイト列を連結した配列と各行の終端位置の配列（文字列テーブル）、
+頂点は全行分を連結した (N, 2) の配列と各行の終端位置の配列で保存する。
+集計は必要な列のメンバーだけを読めばよく、画像ごとのファイルを開く必要はない。
+
+    from export import read_column
+    areas = read_column("glyphs.npz", "area")
+"""
+import os
+import zipfile
+import threading
+
+import numpy as np
+
+# 1つの行グループの行数
+ROW_GROUP_SIZE = 4096
+
+# 数値の列と型
+NUMERIC_COLUMNS = {
+    "points_count": np.int32,
+    "contour_count": np.int32,
+    "area": np.float64,
+    "perimeter": np.float64,
+    "is_convex": np.bool_,
+    "is_closed": np.bool_,
+    "has_contour": np.bool_,
+    "threshold1": np.int16,
+    "threshold2": np.int16,
+    "simplification": np.float32,
+}
+
+# 文字列の列
+STRING_COLUMNS = ("name", "path", "description", "description_source", "preset")
+
+# 段階ごとの処理時間（ミリ秒）の列
+TIMING_COLUMNS = ("loader_ms", "edges_ms", "contours_ms", "simplifier_ms", "renderer_ms", "describer_ms")
+
+# 頂点の列（可変長）
+VERTEX_COLUMN = "vertices"
+
+
+def _encode_strings(values):
+    """文字列のリストを (連結したUTF-8バイト列, 各行の終端位置) にする"""
+    encoded = [(value or "").encode("utf-8") for value in values]
+    offsets = np.cumsum([len(item) for item in encoded], dtype=np.int64)
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _decode_strings(data, offsets):
+    raw = data.tobytes()
+    starts = np.concatenate([[0], offsets[:-1]])
+    return [raw[start:end].decode("utf-8") for start, end in zip(starts, offsets)]
+
+
+def _member(column, part, group):
+    return f"{column}/{part}{group:06d}.npy"
+
+
+class ColumnarWriter:
+    """変換結果を行グループ単位で追記するライター（複数のワーカーから呼んでよい）
+
+    既存のファイルに続けて書き込む場合は、行グループ番号を引き継ぐ。
+    """
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE):
+        self.path = path
+        self.row_group_size = row_group_size
+        self._lock = threading.Lock()
+        self._rows = []
+        self._next_group = _group_count(path) if os.path.exists(path) else 0
+        self.rows_written = 0
+
+    def add(self, row):
+        """1行（列名 → 値の辞書）を追加する。足りない列は既定値になる"""
+        with self._lock:
+            self._rows.append(row)
+            if len(self._rows) < self.row_group_size:
+                return
+            rows = self._rows
+            self._rows = []
+            self._write_group(rows)
+
+    def flush(self):
+        with self._lock:
+            rows = self._rows
+            self._rows = []
+            if rows:
+                self._write_group(rows)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_group(self, rows):
+        """行グループを1つ書き出す（ロック内で呼ぶ）"""
+        group = self._next_group
+        arrays = {}
+        for column, dtype in NUMERIC_COLUMNS.items():
+            arrays[_member(column, "", group)] = np.array(
+                [row.get(column) or 0 for row in rows], dtype=dtype)
+        for column in TIMING_COLUMNS:
+            arrays[_member(column, "", group)] = np.array(
+                [row.get("timings", {}).get(column[:-3], np.nan) for row in rows], dtype=np.float32)
+        for column in STRING_COLUMNS:
+            data, offsets = _encode_strings([row.get(column) for row in rows])
+            arrays[_member(column, "data", group)] = data
+            arrays[_member(column, "offsets", group)] = offsets
+
+        vertices = [np.asarray(row["vertices"], dtype=np.int32).reshape(-1, 2)
+                    if row.get("vertices") is not None else np.zeros((0, 2), dtype=np.int32)
+                    for row in rows]
+        arrays[_member(VERTEX_COLUMN, "data", group)] = np.concatenate(vertices)
+        arrays[_member(VERTEX_COLUMN, "offsets", group)] = np.cumsum(
+            [len(item) for item in vertices], dtype=np.int64)
+
+        with zipfile.ZipFile(self.path, mode="a", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name, array in arrays.items():
+                with archive.open(name, mode="w", force_zip64=True) as f:
+                    np.lib.format.write_array(f, array, allow_pickle=False)
+        self._next_group += 1
+        self.rows_written += len(rows)
+
+
+def _group_count(path):
+    with zipfile.ZipFile(path) as archive:
+        return sum(1 for name in archive.namelist() if name.startswith("points_count/"))
+
+
+def _read_parts(archive, column, part):
+    names = sorted(name for name in archive.namelist() if name.startswith(f"{column}/{part}"))
+    arrays = []
+    for name in names:
+        with archive.open(name) as f:
+            arrays.append(np.lib.format.read_array(f, allow_pickle=False))
+    return arrays
+
+
+def read_column(path, column):
+    """1つの列を全ての行グループから読む
+
+    数値の列はNumPy配列、文字列の列は文字列のリスト、
+    頂点の列は (連結した頂点, 各行の開始位置) を返す。
+    """
+    with zipfile.ZipFile(path) as archive:
+        if column in STRING_COLUMNS or column == VERTEX_COLUMN:
+            data_parts = _read_parts(archive, column, "data")
+            offset_parts = _read_parts(archive, column, "offsets")
+            if column in STRING_COLUMNS:
+                values = []
+                for data, offsets in zip(data_parts, offset_parts):
+                    values.extend(_decode_strings(data, offsets))
+                return values
+            # 行グループごとの終端位置を、ファイル全体での開始位置に直す
+            starts = []
+            base = 0
+            for data, offsets in zip(data_parts, offset_parts):
+                starts.append(base + np.concatenate([[0], offsets[:-1]]))
+                base += len(data)
+            if not data_parts:
+                return np.zeros((0, 2), dtype=np.int32), np.zeros(0, dtype=np.int64)
+            starts.append([base])
+            return np.concatenate(data_parts), np.concatenate(starts).astype(np.int64)
+        parts = _read_parts(archive, column, "")
+        if not parts:
+            raise KeyError(column)
+        return np.concatenate(parts)
+
+
+def read_vertices(path, row):
+    """1行分の頂点を (N, 2) の配列で返す"""
+    vertices, starts = read_column(path, VERTEX_COLUMN)
+    return vertices[starts[row]:starts[row + 1]]
+
+
+def make_row(path, contour_features=None, approx_contour=None, description=None, description_source=None,
+             params=None, timings=None, contour_count=0):
+    """変換結果からエクスポート用の1行を作る"""
+    features = contour_features or {}
+    row = {
+        "name": os.path.splitext(os.path.basename(path))[0],
+        "path": path,
+        "description": description,
+        "description_source": description_source,
+        "has_contour": contour_features is not None,
+        "points_count": features.get("points_count", 0),
+        "area": features.get("area", 0.0),
+        "perimeter": features.get("perimeter", 0.0),
+        "is_convex": bool(features.get("is_convex", False)),
+        "is_closed": bool(features.get("is_closed", False)),
+        "contour_count": contour_count,
+        "vertices": None if approx_contour is None else np.asarray(approx_contour).reshape(-1, 2),
+        "timings": timings or {},
+    }
+    row.update(params or {})
+    return row
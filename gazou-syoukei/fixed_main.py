@@ -1,14 +1,16 @@
 import cv2
-import numpy as np
-from PIL import Image, ImageDraw
+from PIL import Image
 import tkinter as tk
 from tkinter import filedialog, Button, Label, Canvas, messagebox, Entry, StringVar
 from PIL import ImageTk
 import os
 import traceback
-import json
-import threading
-from openai import OpenAI
+import openai_client
+from descriptions import get_description_service, fallback_description
+from conversion_jobs import ConversionJobs, ConversionCancelled
+from streaming_text import StreamingText
+from pipeline import fixed_main_preset, Describer
+from vector_export import SAVE_FILETYPES, save_vector
 
 class ImageToCharacterApp:
     def __init__(self, root):
@@ -24,6 +26,10 @@ class ImageToCharacterApp:
         # OpenAIクライアント
         self.client = None
         
+        # 変換ジョブ（新しい変換が古い変換を置き換える）
+        self.jobs = ConversionJobs()
+        self.pipeline = fixed_main_preset(Describer(self.generate_character_description, self.generate_simple_description))
+        
         # APIキーの読み込み
         self.load_api_key()
         
@@ -113,17 +119,10 @@ class ImageToCharacterApp:
     
     def load_api_key(self):
         try:
-            # スクリプトのディレクトリを取得
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            api_key_path = os.path.join(script_dir, "api_key.json")
-            
-            if os.path.exists(api_key_path):
-                with open(api_key_path, "r") as f:
-                    data = json.load(f)
-                    self.api_key.set(data.get("api_key", ""))
-                    if self.api_key.get():
-                        self.client = OpenAI(api_key=self.api_key.get())
-                        print("OpenAIクライアントを初期化しました")
+            # 環境変数 → api_key.json の順でAPIキーを解決し、共有クライアントを取得
+            self.api_key.set(openai_client.resolve_api_key())
+            if self.api_key.get():
+                self.client = openai_client.get_client(self.api_key.get())
         except Exception as e:
             print(f"APIキーの読み込みエラー: {str(e)}")
     
@@ -131,15 +130,9 @@ class ImageToCharacterApp:
         try:
             api_key = self.api_key.get()
             if api_key:
-                # スクリプトのディレクトリを取得
-                script_dir = os.path.dirname(os.path.abspath(__file__))
-                api_key_path = os.path.join(script_dir, "api_key.json")
-                
-                with open(api_key_path, "w") as f:
-                    json.dump({"api_key": api_key}, f)
-                self.client = OpenAI(api_key=api_key)
+                # 保存して共有クライアントを更新（キーが変わらなければ再利用）
+                self.client = openai_client.save_api_key(api_key)
                 messagebox.showinfo("成功", "APIキーが保存されました")
-                print("OpenAIクライアントを初期化しました")
             else:
                 messagebox.showwarning("警告", "APIキーが入力されていません")
         except Exception as e:
@@ -208,8 +201,8 @@ class ImageToCharacterApp:
             self.process_text.delete(1.0, tk.END)
             self.update_process_text("画像処理を開始します...")
             
-            # 非同期で処理を実行
-            threading.Thread(target=self._process_image, daemon=True).start()
+            # 非同期で処理を実行（実行中の変換があればキャンセルして置き換える）
+            self.jobs.start(self._process_image, self.input_image_path)
             
             # 画像に変換ボタンを有効化
             self.image_convert_btn.config(state=tk.NORMAL)
@@ -241,34 +234,51 @@ class ImageToCharacterApp:
         # UIスレッドで実行
         self.root.after(0, _update)
     
-    def _process_image(self):
+    def _process_image(self, token, image_path):
         try:
             print("画像処理を開始します")
+            # 説明文は届いた断片から順に説明欄へ表示する（更新は一定間隔でまとめる）
+            stream = StreamingText(self.root, self.description_text, lambda: self.jobs.is_current(token))
+            self.root.after(0, stream.start)
             # 画像から特徴を抽出し、象形文字を生成
-            self.output_image, self.character_description = self.generate_character_from_image(self.input_image_path)
+            try:
+                output_image, character_description = self.generate_character_from_image(
+                    image_path, token, on_delta=stream.push)
+            finally:
+                stream.close()
             
-            self.update_process_text(f"生成された画像: {self.output_image is not None}")
-            print(f"生成された output_image: {self.output_image is not None}")
-            print(f"output_image の種類: {type(self.output_image) if self.output_image else 'None'}")
+            self.update_process_text(f"生成された画像: {output_image is not None}")
+            print(f"生成された output_image: {output_image is not None}")
+            print(f"output_image の種類: {type(output_image) if output_image else 'None'}")
             
             # output_imageがNoneの場合は、空白の画像を生成
-            if self.output_image is None:
+            if output_image is None:
                 self.update_process_text("画像生成に失敗したため、空白の画像を生成します")
                 print("output_imageがNoneのため、空白の画像を生成します")
-                self.output_image = Image.new('RGB', (500, 500), color='white')
-                self.character_description = "画像の生成に失敗しました。別の画像を試してください。"
-            
-            # UIスレッドで結果を表示
-            self.root.after(0, self._update_ui_after_processing)
+                output_image = Image.new('RGB', (500, 500), color='white')
+                character_description = "画像の生成に失敗しました。別の画像を試してください。"
+        except ConversionCancelled as e:
+            print(e)
+            return
         except Exception as e:
             error_msg = f"画像処理中にエラーが発生しました: {str(e)}"
             self.update_process_text(error_msg)
             print(error_msg)
             print(traceback.format_exc())
             # エラーが発生しても空白の画像を生成
-            self.output_image = Image.new('RGB', (500, 500), color='white')
-            self.character_description = f"エラーが発生しました: {str(e)}"
-            self.root.after(0, self._update_ui_after_processing)
+            output_image = Image.new('RGB', (500, 500), color='white')
+            character_description = f"エラーが発生しました: {str(e)}"
+        
+        # UIスレッドで結果を反映（古い変換の結果は破棄）
+        self.root.after(0, lambda: self._apply_result(token, output_image, character_description))
+    
+    def _apply_result(self, token, output_image, character_description):
+        if not self.jobs.is_current(token):
+            print("古い変換の結果を破棄しました")
+            return
+        self.output_image = output_image
+        self.character_description = character_description
+        self._update_ui_after_processing()
     
     def _update_ui_after_processing(self):
         print("_update_ui_after_processing メソッドが呼び出されました")
@@ -303,137 +313,23 @@ class ImageToCharacterApp:
         self.status_label.config(text="エラーが発生しました")
         messagebox.showerror("エラー", f"変換中にエラーが発生しました: {error_message}")
     
-    def generate_character_from_image(self, image_path):
+    def generate_character_from_image(self, image_path, token=None, on_delta=None):
         try:
-            # 画像を読み込み
+            # 変換は共通のパイプライン（fixed_main.pyのプリセット: Canny 30/100、全ての輪郭、
+            # 二値化での再検出、面積100以下の輪郭は除外）で行う。各段階の境目でキャンセルを確認する
             self.update_process_text(f"画像を読み込み中: {image_path}")
             print(f"画像を読み込み中: {image_path}")
-            img = cv2.imread(image_path)
-            if img is None:
+            context = self.pipeline.run(image_path, token=token, on_delta=on_delta, on_stage=self._report_stage)
+            if context is None:
                 self.update_process_text("画像の読み込みに失敗しました")
                 print("画像の読み込みに失敗しました")
                 return None, ""
             
-            self.update_process_text(f"画像サイズ: {img.shape}")
-            print(f"画像サイズ: {img.shape}")
-            
-            # グレースケール変換
-            self.update_process_text("グレースケールに変換中...")
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-            # エッジ検出
-            self.update_process_text("エッジ検出を実行中...")
-            edges = cv2.Canny(gray, 30, 100)  # しきい値を調整
-            self.update_process_text("エッジ検出完了")
-            
-            # 輪郭検出
-            self.update_process_text("輪郭検出を実行中...")
-            contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-            self.update_process_text(f"検出された輪郭の数: {len(contours)}")
-            
-            # 輪郭がない場合は別の方法を試す
-            if not contours:
-                self.update_process_text("輪郭が検出されませんでした。別の方法を試します...")
-                # 閾値処理を試す
-                _, thresh = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
-                contours, _ = cv2.findContours(thresh, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-                self.update_process_text(f"閾値処理後の輪郭の数: {len(contours)}")
-            
-            # 最も大きい輪郭を取得
-            if contours:
-                # 面積でフィルタリング（小さすぎる輪郭を除外）
-                filtered_contours = [cnt for cnt in contours if cv2.contourArea(cnt) > 100]
-                
-                if filtered_contours:
-                    main_contour = max(filtered_contours, key=cv2.contourArea)
-                    self.update_process_text(f"メイン輪郭の面積: {cv2.contourArea(main_contour):.2f}")
-                    
-                    # 輪郭を単純化
-                    epsilon = 0.01 * cv2.arcLength(main_contour, True)
-                    approx_contour = cv2.approxPolyDP(main_contour, epsilon, True)
-                    self.update_process_text(f"単純化後の輪郭のポイント数: {len(approx_contour)}")
-                    
-                    # 輪郭の特徴を抽出
-                    contour_features = {
-                        "points_count": len(approx_contour),
-                        "is_closed": True,
-                        "area": cv2.contourArea(main_contour),
-                        "perimeter": cv2.arcLength(main_contour, True),
-                        "is_convex": cv2.isContourConvex(approx_contour)
-                    }
-                    
-                    # 画像ファイル名から対象物を推測
-                    file_name = os.path.basename(image_path)
-                    file_name_without_ext = os.path.splitext(file_name)[0]
-                    self.update_process_text(f"画像ファイル名: {file_name_without_ext}")
-                    
-                    # ChatGPT APIを使用して象形文字の説明を生成
-                    self.update_process_text("ChatGPT APIを使用して説明を生成中...")
-                    print("ChatGPT APIを使用して説明を生成します...")
-                    description = self.generate_character_description(contour_features, file_name_without_ext)
-                    self.update_process_text(f"説明の生成完了: {description[:30]}...")
-                    print(f"説明の生成完了: {description[:30]}...")
-                    
-                    # 象形文字のような画像を生成
-                    self.update_process_text("象形文字画像の生成を開始します")
-                    # 白い背景に黒い線で描画
-                    canvas_size = (500, 500)
-                    character_img = Image.new('RGB', canvas_size, color='white')
-                    draw = ImageDraw.Draw(character_img)
-                    self.update_process_text("キャンバスの作成完了")
-                    
-                    # 輪郭の座標を正規化して描画
-                    h, w = gray.shape
-                    scale_x = canvas_size[0] / w
-                    scale_y = canvas_size[1] / h
-                    
-                    # 中心に配置するためのオフセットを計算
-                    x_min = min(point[0][0] for point in approx_contour)
-                    y_min = min(point[0][1] for point in approx_contour)
-                    x_max = max(point[0][0] for point in approx_contour)
-                    y_max = max(point[0][1] for point in approx_contour)
-                    
-                    contour_width = x_max - x_min
-                    contour_height = y_max - y_min
-                    
-                    offset_x = (w - contour_width) // 2 - x_min
-                    offset_y = (h - contour_height) // 2 - y_min
-                    
-                    # 輪郭を描画
-                    points = []
-                    for point in approx_contour:
-                        x = int((point[0][0] + offset_x) * scale_x)
-                        y = int((point[0][1] + offset_y) * scale_y)
-                        points.append((x, y))
-                    
-                    self.update_process_text(f"描画するポイント数: {len(points)}")
-                    
-                    # 線を太くして象形文字らしく
-                    for i in range(len(points)):
-                        start = points[i]
-                        end = points[(i + 1) % len(points)]
-                        draw.line([start, end], fill='black', width=5)
-                    
-                    self.update_process_text("象形文字の生成が完了しました")
-                    print(f"character_img の種類: {type(character_img)}")
-                    print(f"character_img のサイズ: {character_img.size}")
-                    return character_img, description
-                else:
-                    self.update_process_text("有効な輪郭が見つかりませんでした")
-            
-            # 輪郭が見つからない場合は元の画像をグレースケールで返す
-            self.update_process_text("輪郭が見つからないため、元の画像を処理します")
-            # 画像を二値化して象形文字風に
-            _, binary = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
-            pil_img = Image.fromarray(binary)
-            
-            # 簡単な説明を生成
-            file_name = os.path.basename(image_path)
-            file_name_without_ext = os.path.splitext(file_name)[0]
-            description = self.generate_simple_description(file_name_without_ext)
-            
-            return pil_img, description
+            print(f"説明の生成完了: {context['description'][:30]}...")
+            return context["output_image"], context["description"]
             
+        except ConversionCancelled:
+            raise
         except Exception as e:
             error_msg = f"画像処理中にエラーが発生しました: {str(e)}"
             self.update_process_text(error_msg)
@@ -441,7 +337,28 @@ class ImageToCharacterApp:
             print(traceback.format_exc())
             return None, ""
     
-    def generate_character_description(self, contour_features, image_name):
+    def _report_stage(self, stage, context):
+        """パイプラインの各段階の終了時に処理状況を表示"""
+        if stage == "loader":
+            self.update_process_text(f"画像サイズ: {context['image'].shape}")
+        elif stage == "edges":
+            self.update_process_text("エッジ検出完了")
+        elif stage == "contours":
+            if context.get("used_threshold_fallback"):
+                self.update_process_text("輪郭が検出されなかったため、閾値処理で検出し直しました")
+            self.update_process_text(f"検出された輪郭の数: {context['contour_count']}")
+            if context["main_contour"] is None:
+                self.update_process_text("有効な輪郭が見つからないため、元の画像を二値化して使用します")
+            else:
+                self.update_process_text(f"メイン輪郭の面積: {cv2.contourArea(context['main_contour']):.2f}")
+        elif stage == "simplifier" and context["approx_contour"] is not None:
+            self.update_process_text(f"単純化後の輪郭のポイント数: {len(context['approx_contour'])}")
+        elif stage == "renderer":
+            self.update_process_text("象形文字の生成が完了しました")
+        elif stage == "describer":
+            self.update_process_text(f"説明の生成完了: {context['description'][:30]}...")
+    
+    def generate_character_description(self, contour_features, image_name, token=None, on_delta=None):
         try:
             self.update_process_text("説明生成メソッドを呼び出し中...")
             print("generate_character_description メソッドが呼び出されました")
@@ -449,93 +366,46 @@ class ImageToCharacterApp:
                 self.update_process_text("OpenAI クライアントが初期化されていません")
                 print("OpenAI クライアントが初期化されていません")
                 return "OpenAI APIクライアントが初期化されていません。APIキーを設定してください。"
-                
-            # OpenAI APIを使用して象形文字の説明を生成
-            prompt = f"""
-            以下の特徴を持つ輪郭から生成された象形文字について、古代文字のような説明を100文字程度で作成してください。
-            説明は「この象形文字は...」で始めてください。
-
-            - 画像名: {image_name}
-            - 点の数: {contour_features['points_count']}
-            - 閉じた形状: {'はい' if contour_features['is_closed'] else 'いいえ'}
-            - 面積: {contour_features['area']:.2f}
-            - 周囲長: {contour_features['perimeter']:.2f}
-            - 凸形状: {'はい' if contour_features['is_convex'] else 'いいえ'}
-            """
             
-            self.update_process_text("OpenAI API リクエストを送信中...")
+            self.update_process_text("ChatGPT APIに接続中...")
             print("OpenAI API リクエストを送信します...")
-            try:
-                self.update_process_text("ChatGPT APIに接続中...")
-                response = self.client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "あなたは古代文字の専門家です。象形文字の特徴から、その意味や用途を説明してください。"},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=200,
-                    temperature=0.7
-                )
-                
-                description = response.choices[0].message.content.strip()
-                self.update_process_text(f"ChatGPTからの応答を受信しました")
+            # 応答が遅い場合・エラーの場合はローカルエンジンの説明が返る
+            description, source = get_description_service().describe_character(
+                self.client, contour_features, image_name, token, on_delta)
+            if source == "local":
+                breaker_state = get_description_service().metrics()["breaker"]["state"]
+                self.update_process_text(f"ローカルの説明を使用します（API状態: {breaker_state}）: {description[:30]}...")
+            else:
+                self.update_process_text(f"ChatGPTからの応答を受信しました（{source}）")
                 self.update_process_text(f"生成された説明: {description[:50]}...")
-                print(f"生成された説明: {description}")
-                return description
-            except Exception as api_error:
-                error_msg = f"OpenAI API 呼び出し中にエラーが発生しました: {str(api_error)}"
-                self.update_process_text(error_msg)
-                print(error_msg)
-                print(traceback.format_exc())
-                # APIエラーが発生しても説明を返す
-                fallback_msg = f"この象形文字は{image_name}を表しています。古代の人々はこの形を使って重要な概念を表現していました。"
-                self.update_process_text(f"デフォルトの説明を使用します: {fallback_msg[:30]}...")
-                return fallback_msg
+            print(f"生成された説明: {description}")
+            return description
             
+        except ConversionCancelled:
+            raise
         except Exception as e:
             error_msg = f"説明の生成中にエラーが発生しました: {str(e)}"
             self.update_process_text(error_msg)
             print(error_msg)
             print(traceback.format_exc())
             # エラーが発生しても説明を返す
-            return f"この象形文字は{image_name}を表しています。古代の人々はこの形を使って重要な概念を表現していました。"
+            return fallback_description(image_name)
     
-    def generate_simple_description(self, image_name):
+    def generate_simple_description(self, image_name, token=None, on_delta=None):
         try:
             self.update_process_text("簡易説明生成メソッドを呼び出し中...")
             if not self.client:
                 self.update_process_text("OpenAI クライアントが初期化されていません")
                 return "OpenAI APIクライアントが初期化されていません。APIキーを設定してください。"
-                
-            # 輪郭が見つからない場合の簡単な説明
-            prompt = f"""
-            「{image_name}」という名前の画像から生成された象形文字について、古代文字のような説明を100文字程度で作成してください。
-            説明は「この象形文字は...」で始めてください。
-            """
             
             self.update_process_text("OpenAI API リクエストを送信中（簡易説明）...")
-            try:
-                response = self.client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "あなたは古代文字の専門家です。象形文字の特徴から、その意味や用途を説明してください。"},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=200,
-                    temperature=0.7
-                )
-                
-                description = response.choices[0].message.content.strip()
-                self.update_process_text(f"簡易説明の生成完了: {description[:30]}...")
-                print(f"生成された説明: {description}")
-                return description
-            except Exception as api_error:
-                error_msg = f"OpenAI API 呼び出し中にエラーが発生しました: {str(api_error)}"
-                self.update_process_text(error_msg)
-                print(error_msg)
-                # APIエラーが発生しても説明を返す
-                return f"この象形文字は{image_name}を表しています。古代の人々はこの形を使って重要な概念を表現していました。"
+            description, source = get_description_service().describe_simple(self.client, image_name, token, on_delta)
+            self.update_process_text(f"簡易説明の生成完了（{source}）: {description[:30]}...")
+            print(f"生成された説明: {description}")
+            return description
                 
+        except ConversionCancelled:
+            raise
         except Exception as e:
             error_msg = f"説明の生成中にエラーが発生しました: {str(e)}"
             self.update_process_text(error_msg)
@@ -567,14 +437,16 @@ class ImageToCharacterApp:
             file_path = filedialog.asksaveasfilename(
                 title="象形文字を保存",
                 defaultextension=".png",
-                filetypes=[("PNG files", "*.png"), ("All files", "*.*")]
+                filetypes=SAVE_FILETYPES
             )
             
             print(f"選択されたファイルパス: {file_path}")
             
             if file_path:
                 print(f"画像を保存します: {file_path}")
-                self.output_image.save(file_path)
+                # .svg / .pdf は輪郭から直接ベクター形式で保存する
+                if not save_vector(file_path, self.output_image):
+                    self.output_image.save(file_path)
                 self.status_label.config(text=f"画像を保存しました: {os.path.basename(file_path)}")
                 print("画像の保存が完了しました")
             else:
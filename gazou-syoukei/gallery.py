@@ -0,0 +1,312 @@
+"""フォルダ内の画像を一覧表示するギャラリー
+
+表示中の行のサムネイルだけをバックグラウンドで縮小デコードし、
+スクロールで見えなくなったセルは破棄する（仮想化）。
+2万枚のフォルダでも最初の画面はすぐに表示され、メモリは
+表示中のサムネイルと小さなLRUキャッシュ分に抑えられる。
+"""
+import os
+import threading
+import tkinter as tk
+from tkinter import Button, Label, Canvas, Frame, Scrollbar
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tif", ".tiff")
+
+THUMBNAIL_SIZE = 128
+CELL_PADDING = 8
+LABEL_HEIGHT = 18
+
+# 画面外のサムネイルを保持しておく件数
+LRU_SIZE = 200
+
+# サムネイルのデコードに使うスレッド数
+DECODE_WORKERS = 4
+
+# スクロールに備えて、表示範囲の下に余分に作っておく行数
+OVERSCAN_ROWS = 1
+
+
+def list_images(folder):
+    """フォルダ内の画像ファイルのパスを名前順で返す"""
+    with os.scandir(folder) as entries:
+        paths = [entry.path for entry in entries
+                 if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS)]
+    paths.sort()
+    return paths
+
+
+def visible_cells(top, height, cell_height, columns, count, overscan=OVERSCAN_ROWS):
+    """縦位置 top から高さ height の範囲に掛かるセルのインデックス範囲 [start, end) を返す"""
+    first_row = max(0, int(top // cell_height))
+    # 下端がセルの境目ちょうどなら、次の行は見えていない
+    end_row = -int(-(top + height) // cell_height) + overscan
+    start = min(count, first_row * columns)
+    end = min(count, max(end_row, first_row) * columns)
+    return start, end
+
+
+def decode_thumbnail(path, size=THUMBNAIL_SIZE):
+    """画像を縮小デコードしてサムネイルを作成（JPEGはdraftで縮小読み込み）"""
+    from PIL import Image
+
+    img = Image.open(path)
+    img.draft("RGB", (size, size))
+    img.thumbnail((size, size))
+    if img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGB")
+    img.load()
+    return img
+
+
+class GalleryWindow(tk.Toplevel):
+    """フォルダ内の画像を仮想化グリッドで表示するウィンドウ
+
+    on_queue にはキューに追加する画像パスのリストが渡される。
+    """
+
+    def __init__(self, master, folder, on_queue=None):
+        super().__init__(master)
+        self.title(f"ギャラリー: {os.path.basename(folder) or folder}")
+        self.geometry("900x700")
+
+        self.folder = folder
+        self.on_queue = on_queue
+        self.paths = list_images(folder)
+        self.selected = set()
+
+        self.columns = 1
+        self.cell_width = THUMBNAIL_SIZE + CELL_PADDING * 2
+        self.cell_height = THUMBNAIL_SIZE + LABEL_HEIGHT + CELL_PADDING * 2
+
+        # 表示中のセル（インデックス → キャンバス上のアイテムID）
+        self._cells = {}
+        # サムネイルのLRU（インデックス → PhotoImage）
+        self._thumbnails = OrderedDict()
+        # デコード中のジョブ（インデックス → Future）
+        self._pending = {}
+        self._executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="thumbnail")
+        self._lock = threading.Lock()
+        self._is_destroyed = False
+
+        self.setup_ui()
+        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+
+    def setup_ui(self):
+        button_frame = Frame(self)
+        button_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        self.queue_btn = Button(button_frame, text="選択した画像を変換", command=self.queue_selected)
+        self.queue_btn.pack(side=tk.LEFT, padx=5)
+        self.queue_btn.config(state=tk.DISABLED)
+
+        Button(button_frame, text="すべて変換", command=self.queue_all).pack(side=tk.LEFT, padx=5)
+        Button(button_frame, text="選択解除", command=self.clear_selection).pack(side=tk.LEFT, padx=5)
+
+        self.info_label = Label(button_frame, text=f"{len(self.paths)}枚の画像")
+        self.info_label.pack(side=tk.RIGHT, padx=5)
+
+        body = Frame(self)
+        body.pack(fill=tk.BOTH, expand=True)
+
+        self.canvas = Canvas(body, bg="white", highlightthickness=0)
+        self.scrollbar = Scrollbar(body, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.canvas.config(yscrollcommand=self._on_yscroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind("<Configure>", self._on_configure)
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<MouseWheel>", self._on_mousewheel)
+        self.canvas.bind("<Button-4>", lambda e: self._scroll_units(-1))
+        self.canvas.bind("<Button-5>", lambda e: self._scroll_units(1))
+
+    # --- スクロールとレイアウト ---
+
+    def _on_configure(self, event):
+        columns = max(1, event.width // self.cell_width)
+        if columns != self.columns:
+            self.columns = columns
+            self._clear_cells()
+        rows = (len(self.paths) + self.columns - 1) // self.columns
+        self.canvas.config(scrollregion=(0, 0, self.columns * self.cell_width, rows * self.cell_height))
+        self.refresh_visible()
+
+    def _on_scrollbar(self, *args):
+        self.canvas.yview(*args)
+        self.refresh_visible()
+
+    def _on_yscroll(self, first, last):
+        self.scrollbar.set(first, last)
+
+    def _on_mousewheel(self, event):
+        self._scroll_units(-1 if event.delta > 0 else 1)
+
+    def _scroll_units(self, units):
+        self.canvas.yview_scroll(units, "units")
+        self.refresh_visible()
+
+    def visible_range(self):
+        """表示中のセルのインデックス範囲を返す"""
+        return visible_cells(self.canvas.canvasy(0), self.canvas.winfo_height(),
+                             self.cell_height, self.columns, len(self.paths))
+
+    def refresh_visible(self):
+        """表示範囲のセルだけを作成し、範囲外のセルとデコード待ちを破棄する"""
+        if self._is_destroyed:
+            return
+        start, end = self.visible_range()
+        visible = set(range(start, end))
+
+        for index in list(self._cells):
+            if index not in visible:
+                self._remove_cell(index)
+
+        with self._lock:
+            for index in list(self._pending):
+                if index not in visible and self._pending[index].cancel():
+                    del self._pending[index]
+
+        for index in range(start, end):
+            if index not in self._cells:
+                self._create_cell(index)
+
+    # --- セル ---
+
+    def _cell_origin(self, index):
+        row, column = divmod(index, self.columns)
+        return column * self.cell_width, row * self.cell_height
+
+    def _create_cell(self, index):
+        x, y = self._cell_origin(index)
+        outline = "blue" if index in self.selected else "lightgray"
+        frame = self.canvas.create_rectangle(
+            x + 2, y + 2, x + self.cell_width - 2, y + self.cell_height - 2,
+            outline=outline, width=2)
+        name = os.path.basename(self.paths[index])
+        label = self.canvas.create_text(
+            x + self.cell_width // 2, y + CELL_PADDING + THUMBNAIL_SIZE + LABEL_HEIGHT // 2,
+            text=name if len(name) <= 18 else name[:15] + "...", font=("Arial", 9))
+        self._cells[index] = {"frame": frame, "label": label, "image": None}
+
+        photo = self._thumbnails.get(index)
+        if photo is not None:
+            self._thumbnails.move_to_end(index)
+            self._place_thumbnail(index, photo)
+        else:
+            self._request_thumbnail(index)
+
+    def _remove_cell(self, index):
+        cell = self._cells.pop(index)
+        for key in ("frame", "label", "image"):
+            if cell[key] is not None:
+                self.canvas.delete(cell[key])
+
+    def _clear_cells(self):
+        for index in list(self._cells):
+            self._remove_cell(index)
+
+    def _place_thumbnail(self, index, photo):
+        cell = self._cells.get(index)
+        if cell is None:
+            return
+        x, y = self._cell_origin(index)
+        if cell["image"] is not None:
+            self.canvas.delete(cell["image"])
+        cell["image"] = self.canvas.create_image(
+            x + self.cell_width // 2, y + CELL_PADDING + THUMBNAIL_SIZE // 2,
+            anchor=tk.CENTER, image=photo)
+
+    # --- サムネイルのデコード ---
+
+    def _request_thumbnail(self, index):
+        with self._lock:
+            if index in self._pending:
+                return
+            future = self._executor.submit(decode_thumbnail, self.paths[index])
+            self._pending[index] = future
+        future.add_done_callback(lambda f: self._on_decoded(index, f))
+
+    def _on_decoded(self, index, future):
+        # ワーカースレッドから呼ばれるので、PhotoImageの作成はUIスレッドで行う
+        with self._lock:
+            self._pending.pop(index, None)
+        if future.cancelled() or self._is_destroyed:
+            return
+        try:
+            img = future.result()
+        except Exception as e:
+            print(f"サムネイルの作成に失敗しました: {self.paths[index]}: {e}")
+            return
+        try:
+            self.after(0, lambda: self._store_thumbnail(index, img))
+        except (RuntimeError, tk.TclError):
+            pass  # ウィンドウが破棄済み
+
+    def _store_thumbnail(self, index, img):
+        if self._is_destroyed:
+            return
+        from PIL import ImageTk
+
+        photo = ImageTk.PhotoImage(img)
+        self._thumbnails[index] = photo
+        self._thumbnails.move_to_end(index)
+
+        # 表示中のセル + LRU_SIZE 件を超えたら、画面外の古いサムネイルから破棄
+        limit = len(self._cells) + LRU_SIZE
+        for old_index in list(self._thumbnails):
+            if len(self._thumbnails) <= limit:
+                break
+            if old_index not in self._cells:
+                del self._thumbnails[old_index]
+        self._place_thumbnail(index, photo)
+
+    # --- 選択とキュー ---
+
+    def _on_click(self, event):
+        x = self.canvas.canvasx(event.x)
+        y = self.canvas.canvasy(event.y)
+        column = int(x // self.cell_width)
+        if column >= self.columns:
+            return
+        index = int(y // self.cell_height) * self.columns + column
+        if index >= len(self.paths):
+            return
+
+        if index in self.selected:
+            self.selected.discard(index)
+        else:
+            self.selected.add(index)
+
+        cell = self._cells.get(index)
+        if cell is not None:
+            self.canvas.itemconfig(cell["frame"], outline="blue" if index in self.selected else "lightgray")
+        self._update_selection_info()
+
+    def _update_selection_info(self):
+        self.queue_btn.config(state=tk.NORMAL if self.selected else tk.DISABLED)
+        self.info_label.config(text=f"{len(self.paths)}枚の画像（{len(self.selected)}枚を選択中）")
+
+    def clear_selection(self):
+        for index in self.selected:
+            cell = self._cells.get(index)
+            if cell is not None:
+                self.canvas.itemconfig(cell["frame"], outline="lightgray")
+        self.selected.clear()
+        self._update_selection_info()
+
+    def queue_selected(self):
+        if self.on_queue and self.selected:
+            self.on_queue([self.paths[i] for i in sorted(self.selected)])
+            self.clear_selection()
+
+    def queue_all(self):
+        if self.on_queue and self.paths:
+            self.on_queue(list(self.paths))
+
+    def on_closing(self):
+        self._is_destroyed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._thumbnails.clear()
+        self.destroy()
@@ -0,0 +1,200 @@
+"""象形文字の輪郭をまとめて保存するベクターストア
+
+象形文字は単純化した輪郭（数十個の頂点）だけで描けるため、500x500のPNGを
+1枚ずつ保存する代わりに、頂点を1つの追記専用ファイルに保存する。
+
+- データファイル: 各輪郭の最初の頂点と、以降の頂点との差分を int16 の (x, y) で並べたもの
+- インデックス（.idx）: 輪郭ごとに (データ内の位置, 頂点数, 元画像の縦, 横) の固定長レコード
+- 名前（.names）: 輪郭ごとの画像名（1行に1つ）
+
+インデックスはメモリマップで開くため、何千万件あっても任意の輪郭の取得は
+インデックスとデータのスライス1回ずつで済む。画像は必要になった時に
+任意の大きさで描画する（render_contour と同じ描画なので、PNGと同じ見た目になる）。
+
+使い方:
+    python glyph_store.py glyphs.bin 0 --output glyph0.png --size 1000
+"""
+import os
+import sys
+import argparse
+import threading
+
+import numpy as np
+
+# インデックスのレコード（16バイト）
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("count", "<u4"), ("height", "<u2"), ("width", "<u2")])
+# 頂点1つ分のバイト数（int16 の x, y）
+VERTEX_BYTES = 4
+
+INT16_MIN = np.iinfo(np.int16).min
+INT16_MAX = np.iinfo(np.int16).max
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+def names_path(path):
+    return path + ".names"
+
+
+def encode_contour(contour):
+    """輪郭を (最初の頂点, 差分...) の int16 配列にする
+
+    差分が int16 に収まらない場合（32767ピクセルを超える画像）は ValueError。
+    """
+    points = np.asarray(contour, dtype=np.int64).reshape(-1, 2)
+    deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    if deltas.size and (deltas.min() < INT16_MIN or deltas.max() > INT16_MAX):
+        raise ValueError("輪郭の座標が大きすぎて保存できません")
+    return deltas.astype("<i2")
+
+
+def decode_contour(encoded):
+    """encode_contour の逆変換（OpenCVと同じ (N, 1, 2) の int32 配列を返す）"""
+    return np.cumsum(encoded, axis=0, dtype=np.int32).reshape(-1, 1, 2)
+
+
+class GlyphStore:
+    """輪郭の追記専用ストア（追加は複数のワーカーから呼んでよい）
+
+    readonly=False で開くと、前回の書き込みが途中で止まっていた場合に
+    インデックスに登録されていない末尾を切り詰めてから追記する。
+    """
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        self._index = None
+        self._data = None
+        self._data_file = None
+        self._index_file = None
+        self._names_file = None
+        if not readonly:
+            self._open_for_append()
+
+    def _open_for_append(self):
+        index_size = os.path.getsize(index_path(self.path)) if os.path.exists(index_path(self.path)) else 0
+        count = index_size // INDEX_DTYPE.itemsize
+        end = 0
+        if count:
+            last = np.fromfile(index_path(self.path), dtype=INDEX_DTYPE, count=1,
+                               offset=(count - 1) * INDEX_DTYPE.itemsize)[0]
+            end = int(last["offset"]) + int(last["count"]) * VERTEX_BYTES
+        self._index_file = open(index_path(self.path), "ab")
+        self._index_file.truncate(count * INDEX_DTYPE.itemsize)
+        self._data_file = open(self.path, "ab")
+        self._data_file.truncate(end)
+        # 名前の行数もインデックスの件数に揃える
+        names = []
+        if os.path.exists(names_path(self.path)):
+            with open(names_path(self.path), "r", encoding="utf-8") as f:
+                names = [line.rstrip("\n") for line in f]
+        if len(names) != count:
+            names = (names + [""] * count)[:count]
+            with open(names_path(self.path), "w", encoding="utf-8") as f:
+                f.writelines(name + "\n" for name in names)
+        self._names_file = open(names_path(self.path), "a", encoding="utf-8")
+        self._count = count
+        self._end = end
+
+    def add(self, contour, shape, name=""):
+        """輪郭と元画像の (縦, 横) を追加し、番号を返す"""
+        if self.readonly:
+            raise ValueError("読み取り専用で開いています")
+        encoded = encode_contour(contour)
+        height, width = shape[:2]
+        with self._lock:
+            record = np.array([(self._end, len(encoded), height, width)], dtype=INDEX_DTYPE)
+            # データを書いてからインデックスを書く（途中で落ちても範囲外を指さない）
+            self._data_file.write(encoded.tobytes())
+            self._data_file.flush()
+            self._index_file.write(record.tobytes())
+            self._index_file.flush()
+            self._names_file.write(name.replace("\n", " ") + "\n")
+            self._names_file.flush()
+            glyph_id = self._count
+            self._count += 1
+            self._end += len(encoded) * VERTEX_BYTES
+            # 追記したのでメモリマップは開き直す
+            self._index = self._data = None
+        return glyph_id
+
+    def _maps(self):
+        index, data = self._index, self._data
+        if index is None:
+            with self._lock:
+                if os.path.getsize(index_path(self.path)) == 0:
+                    return np.zeros(0, dtype=INDEX_DTYPE), np.zeros(0, dtype=np.uint8)
+                index = np.memmap(index_path(self.path), dtype=INDEX_DTYPE, mode="r")
+                data = (np.memmap(self.path, dtype=np.uint8, mode="r")
+                        if os.path.getsize(self.path) else np.zeros(0, dtype=np.uint8))
+                self._index, self._data = index, data
+        return index, data
+
+    def __len__(self):
+        return len(self._maps()[0])
+
+    def get(self, glyph_id):
+        """輪郭と元画像の (縦, 横) を返す"""
+        index, data = self._maps()
+        record = index[glyph_id]
+        start = int(record["offset"])
+        encoded = data[start:start + int(record["count"]) * VERTEX_BYTES].view("<i2").reshape(-1, 2)
+        return decode_contour(encoded), (int(record["height"]), int(record["width"]))
+
+    def render(self, glyph_id, canvas_size=(500, 500), line_width=5, style=0):
+        """輪郭を任意の大きさで描画する"""
+        from pipeline import render_contour
+
+        contour, shape = self.get(glyph_id)
+        return render_contour(contour, shape, canvas_size, line_width, style)
+
+    def names(self):
+        """番号順の画像名のリスト"""
+        with open(names_path(self.path), "r", encoding="utf-8") as f:
+            return [line.rstrip("\n") for line in f][:len(self)]
+
+    def close(self):
+        with self._lock:
+            for f in (self._data_file, self._index_file, self._names_file):
+                if f is not None:
+                    f.close()
+            self._data_file = self._index_file = self._names_file = None
+            self._index = self._data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ストアの象形文字を画像として書き出す")
+    parser.add_argument("store", help="batch.py --glyph-store で作成したファイル")
+    parser.add_argument("glyph", help="番号または画像名")
+    parser.add_argument("--output", default=None, help="保存先（既定は 画像名.png）")
+    parser.add_argument("--size", type=int, default=500, help="画像の一辺のピクセル数")
+    parser.add_argument("--line-width", type=int, default=5, help="線の太さ")
+    args = parser.parse_args()
+
+    with GlyphStore(args.store, readonly=True) as store:
+        names = store.names()
+        if args.glyph.isdigit():
+            glyph_id = int(args.glyph)
+        elif args.glyph in names:
+            glyph_id = names.index(args.glyph)
+        else:
+            print(f"見つかりません: {args.glyph}")
+            return 1
+        image = store.render(glyph_id, (args.size, args.size), args.line_width)
+        output = args.output or f"{names[glyph_id] or glyph_id}.png"
+        image.save(output)
+        print(f"{len(store)}件中 {glyph_id}番を保存しました: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,12 @@
-import cv2
-import numpy as np
-from PIL import Image, ImageDraw
+from PIL import Image
 import tkinter as tk
 from tkinter import filedialog, Button, Label, Canvas, messagebox, Entry, StringVar, Frame
 from PIL import ImageTk
 import os
-import base64
-import json
-from openai import OpenAI
+import openai_client
+from descriptions import get_description_service, fallback_description
+from pipeline import main_preset, Describer
+from vector_export import SAVE_FILETYPES, save_vector
 
 class ImageToCharacterApp:
     def __init__(self, root):
@@ -23,6 +22,12 @@ class ImageToCharacterApp:
         # OpenAIクライアント
         self.client = None
         
+        # main_backup.py は main.py と同じプリセットを使う（説明文はAPIの応答を待ってから表示する）
+        self.pipeline = main_preset(Describer(
+            lambda features, name, token, on_delta: self.generate_character_description(features, name),
+            lambda name, token, on_delta: self.generate_simple_description(name),
+        ))
+        
         # APIキーの読み込み
         self.load_api_key()
         
@@ -132,15 +137,10 @@ class ImageToCharacterApp:
     
     def load_api_key(self):
         try:
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            api_key_path = os.path.join(script_dir, "api_key.json")
-            
-            if os.path.exists(api_key_path):
-                with open(api_key_path, "r") as f:
-                    data = json.load(f)
-                    self.api_key.set(data.get("api_key", ""))
-                    if self.api_key.get():
-                        self.client = OpenAI(api_key=self.api_key.get())
+            # 環境変数 → api_key.json の順でAPIキーを解決し、共有クライアントを取得
+            self.api_key.set(openai_client.resolve_api_key())
+            if self.api_key.get():
+                self.client = openai_client.get_client(self.api_key.get())
         except Exception as e:
             print(f"APIキーの読み込みエラー: {str(e)}")
     
@@ -148,12 +148,8 @@ class ImageToCharacterApp:
         try:
             api_key = self.api_key.get()
             if api_key:
-                script_dir = os.path.dirname(os.path.abspath(__file__))
-                api_key_path = os.path.join(script_dir, "api_key.json")
-                
-                with open(api_key_path, "w") as f:
-                    json.dump({"api_key": api_key}, f)
-                self.client = OpenAI(api_key=api_key)
+                # 保存して共有クライアントを更新（キーが変わらなければ再利用）
+                self.client = openai_client.save_api_key(api_key)
                 messagebox.showinfo("成功", "APIキーが保存されました")
             else:
                 messagebox.showwarning("警告", "APIキーが入力されていません")
@@ -186,87 +182,11 @@ class ImageToCharacterApp:
         self.description_text.config(state=tk.DISABLED)
     
     def generate_character_from_image(self, image_path):
-        # 画像を読み込み
-        img = cv2.imread(image_path)
-        if img is None:
+        # 変換は共通のパイプライン（main.pyと同じプリセット: Canny 50/150、外側の輪郭）で行う
+        context = self.pipeline.run(image_path)
+        if context is None:
             return None, "画像の読み込みに失敗しました。"
-        
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # エッジ検出
-        edges = cv2.Canny(gray, 50, 150)
-        
-        # 輪郭検出
-        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        # 最も大きい輪郭を取得
-        if contours:
-            main_contour = max(contours, key=cv2.contourArea)
-            
-            # 輪郭を単純化
-            epsilon = 0.01 * cv2.arcLength(main_contour, True)
-            approx_contour = cv2.approxPolyDP(main_contour, epsilon, True)
-            
-            # 象形文字のような画像を生成
-            # 白い背景に黒い線で描画
-            canvas_size = (500, 500)
-            character_img = Image.new('RGB', canvas_size, color='white')
-            draw = ImageDraw.Draw(character_img)
-            
-            # 輪郭の座標を正規化して描画
-            h, w = edges.shape
-            scale_x = canvas_size[0] / w
-            scale_y = canvas_size[1] / h
-            
-            # 輪郭の特徴を抽出
-            contour_features = {
-                "points_count": len(approx_contour),
-                "is_closed": True,
-                "area": cv2.contourArea(main_contour),
-                "perimeter": cv2.arcLength(main_contour, True),
-                "is_convex": cv2.isContourConvex(approx_contour)
-            }
-            
-            # 画像ファイル名から対象物を推測
-            file_name = os.path.basename(image_path)
-            file_name_without_ext = os.path.splitext(file_name)[0]
-            
-            # ChatGPT APIを使用して象形文字の説明を生成
-            description = self.generate_character_description(contour_features, file_name_without_ext)
-            
-            # 中心に配置するためのオフセットを計算
-            x_min = min(point[0][0] for point in approx_contour)
-            y_min = min(point[0][1] for point in approx_contour)
-            x_max = max(point[0][0] for point in approx_contour)
-            y_max = max(point[0][1] for point in approx_contour)
-            
-            contour_width = x_max - x_min
-            contour_height = y_max - y_min
-            
-            offset_x = (w - contour_width) // 2 - x_min
-            offset_y = (h - contour_height) // 2 - y_min
-            
-            # 輪郭を描画
-            points = []
-            for point in approx_contour:
-                x = int((point[0][0] + offset_x) * scale_x)
-                y = int((point[0][1] + offset_y) * scale_y)
-                points.append((x, y))
-            
-            # 線を太くして象形文字らしく
-            for i in range(len(points)):
-                start = points[i]
-                end = points[(i + 1) % len(points)]
-                draw.line([start, end], fill='black', width=5)
-            
-            return character_img, description
-        else:
-            # 輪郭が見つからない場合は元の画像をグレースケールで返す
-            pil_img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-            file_name = os.path.basename(image_path)
-            file_name_without_ext = os.path.splitext(file_name)[0]
-            description = self.generate_simple_description(file_name_without_ext)
-            return pil_img, description
+        return context["output_image"], context["description"]
     
     def display_output_image(self):
         if self.output_image:
@@ -284,73 +204,42 @@ class ImageToCharacterApp:
         file_path = filedialog.asksaveasfilename(
             title="象形文字を保存",
             defaultextension=".png",
-            filetypes=[("PNG files", "*.png"), ("All files", "*.*")]
+            filetypes=SAVE_FILETYPES
         )
         
         if file_path:
-            self.output_image.save(file_path)
+            try:
+                # .svg / .pdf は輪郭から直接ベクター形式で保存する
+                if not save_vector(file_path, self.output_image):
+                    self.output_image.save(file_path)
+            except ValueError as e:
+                self.status_label.config(text=str(e))
+                return
             self.status_label.config(text=f"画像を保存しました: {os.path.basename(file_path)}")
 
     def generate_character_description(self, contour_features, image_name):
-        """ChatGPT APIを使用して象形文字の説明を生成"""
+        """ChatGPT APIを使用して象形文字の説明を生成（遅い場合はローカルの説明を返す）"""
         try:
             if not self.client:
                 return "OpenAI APIクライアントが初期化されていません。APIキーを設定してください。"
-                
-            # OpenAI APIを使用して象形文字の説明を生成
-            prompt = f"""
-            以下の特徴を持つ輪郭から生成された象形文字について、古代文字のような説明を100文字程度で作成してください。
-            説明は「この象形文字は...」で始めてください。
-
-            - 画像名: {image_name}
-            - 点の数: {contour_features['points_count']}
-            - 閉じた形状: {'はい' if contour_features['is_closed'] else 'いいえ'}
-            - 面積: {contour_features['area']:.2f}
-            - 周囲長: {contour_features['perimeter']:.2f}
-            - 凸形状: {'はい' if contour_features['is_convex'] else 'いいえ'}
-            """
             
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "あなたは古代文字の専門家です。象形文字の特徴から、その意味や用途を説明してください。"},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=200,
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content.strip()
+            description, source = get_description_service().describe_character(self.client, contour_features, image_name)
+            return description
             
         except Exception as e:
-            return f"この象形文字は{image_name}を表しています。古代の人々はこの形を使って重要な概念を表現していました。"
+            return fallback_description(image_name)
     
     def generate_simple_description(self, image_name):
         """輪郭が見つからない場合の簡単な説明を生成"""
         try:
             if not self.client:
                 return "OpenAI APIクライアントが初期化されていません。APIキーを設定してください。"
-                
-            # 輪郭が見つからない場合の簡単な説明
-            prompt = f"""
-            「{image_name}」という名前の画像から生成された象形文字について、古代文字のような説明を100文字程度で作成してください。
-            説明は「この象形文字は...」で始めてください。
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "あなたは古代文字の専門家です。象形文字の特徴から、その意味や用途を説明してください。"},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=200,
-                temperature=0.7
-            )
             
-            return response.choices[0].message.content.strip()
+            description, source = get_description_service().describe_simple(self.client, image_name)
+            return description
                 
         except Exception as e:
-            return f"この象形文字は{image_name}を表しています。古代の人々はこの形を使って重要な概念を表現していました。"
+            return fallback_description(image_name)
 
 def main():
     root = tk.Tk()
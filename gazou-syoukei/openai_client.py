@@ -0,0 +1,124 @@
+"""OpenAIクライアントの共有ファクトリ
+
+全ての説明生成呼び出し・スレッドで1つのクライアント（HTTPコネクションプール）を
+使い回し、リクエストごとのTLSハンドシェイクを避ける。
+"""
+import os
+import json
+import threading
+
+# APIキーの保存先（各アプリと共通）
+API_KEY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "api_key.json")
+
+# APIキーを読み込む環境変数名
+API_KEY_ENV = "OPENAI_API_KEY"
+
+# タイムアウト設定（秒）
+CONNECT_TIMEOUT = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", "5.0"))
+READ_TIMEOUT = float(os.environ.get("OPENAI_READ_TIMEOUT", "30.0"))
+WRITE_TIMEOUT = 10.0
+POOL_TIMEOUT = 5.0
+
+# コネクションプール設定
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 120.0
+
+# SDK側のリトライ回数（リトライの合計時間がタイムアウトを大きく超えないよう控えめに）
+MAX_RETRIES = 1
+
+_lock = threading.Lock()
+_client = None
+_client_key = None
+
+
+def load_api_key_from_file():
+    """api_key.jsonからAPIキーを読み込む（存在しない場合は空文字）"""
+    try:
+        if os.path.exists(API_KEY_FILE):
+            with open(API_KEY_FILE, "r") as f:
+                data = json.load(f)
+                return data.get("api_key", "")
+    except Exception as e:
+        print(f"APIキーの読み込みエラー: {str(e)}")
+    return ""
+
+
+def resolve_api_key(api_key=None):
+    """APIキーを 引数 → 環境変数 → api_key.json の順で解決する"""
+    if api_key:
+        return api_key
+    env_key = os.environ.get(API_KEY_ENV, "")
+    if env_key:
+        return env_key
+    return load_api_key_from_file()
+
+
+def save_api_key(api_key):
+    """APIキーをapi_key.jsonに保存し、共有クライアントを作り直す"""
+    with open(API_KEY_FILE, "w") as f:
+        json.dump({"api_key": api_key}, f)
+    return get_client(api_key)
+
+
+def _build_http_client():
+    """keep-alive付きのコネクションプールを持つHTTPクライアントを作成"""
+    import httpx
+    from openai import DefaultHttpxClient
+
+    return DefaultHttpxClient(
+        timeout=httpx.Timeout(
+            connect=CONNECT_TIMEOUT,
+            read=READ_TIMEOUT,
+            write=WRITE_TIMEOUT,
+            pool=POOL_TIMEOUT,
+        ),
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_client(api_key=None):
+    """共有OpenAIクライアントを取得する
+
+    キーが解決できない場合はNoneを返す。キーが変わった場合のみ作り直す。
+    """
+    global _client, _client_key
+
+    key = resolve_api_key(api_key)
+    if not key or key == "your-api-key-here":
+        return None
+
+    with _lock:
+        if _client is not None and _client_key == key:
+            return _client
+
+        from openai import OpenAI
+
+        # 古いクライアントは実行中のリクエストが終わり次第GCで解放される
+        client = OpenAI(
+            api_key=key,
+            http_client=_build_http_client(),
+            max_retries=MAX_RETRIES,
+        )
+        _client = client
+        _client_key = key
+        print("OpenAIクライアントを初期化しました")
+    return client
+
+
+def close_client():
+    """共有クライアントのコネクションプールを閉じる"""
+    global _client, _client_key
+    with _lock:
+        client = _client
+        _client = None
+        _client_key = None
+    if client is not None:
+        try:
+            client.close()
+        except Exception:
+            pass
@@ -0,0 +1,583 @@
+"""画像から象形文字への変換パイプライン
+
+読み込み → エッジ検出 → 輪郭の選択 → 単純化 → 描画 → 説明生成 の各段階を
+差し替え可能な部品として組み合わせる。各アプリ（main.py / fixed_main.py /
+main_backup.py / advanced_version.py）とバッチ処理は、しきい値や輪郭の取り方が
+違うだけの「プリセット」として同じエンジンを使うため、段階ごとの高速化は1か所で済む。
+
+段階ごとに実行方法（inline: 呼び出し元のスレッド / thread: スレッドプール /
+process: プロセスプール）を選べる。run_many() で複数の画像を流すと、
+段階ごとのプールの幅で同時実行数が決まり、画像間で段階が重なって実行される。
+
+各段階は変換の状態を表す辞書（コンテキスト）を受け取って更新し、返す。
+None を返した場合はそこで変換を打ち切る（画像を読み込めなかった場合など）。
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from conversion_jobs import check_cancelled
+
+INLINE = "inline"
+THREAD = "thread"
+PROCESS = "process"
+
+STAGE_NAMES = ("loader", "edges", "contours", "simplifier", "renderer", "describer")
+
+# プロセスに送らない実行時だけの値（キャンセルトークン・ストリーミングのコールバック）
+RUNTIME_KEYS = ("token", "on_delta")
+
+# プロセスとの受け渡しで、これ以上の大きさの配列（画像）は共有メモリに置く（バイト）
+SHARED_FRAME_MIN_BYTES = 64 * 1024
+
+# 輪郭の取り方（cv2 の定数は読み込みを遅らせるため名前で指定する）
+RETR_EXTERNAL = "external"
+RETR_LIST = "list"
+
+# テクスチャの線の最大の長さ（500x500のキャンバスでのピクセル数）
+TEXTURE_STROKE = 30
+
+# 描画スタイル（advanced_version.py の選択肢と同じ）
+STYLE_OUTLINE = 0
+STYLE_FILLED = 1
+STYLE_TEXTURED = 2
+
+
+def contour_features_of(main_contour, approx_contour):
+    """説明生成に使う輪郭の特徴"""
+    import cv2
+
+    return {
+        "points_count": len(approx_contour),
+        "is_closed": True,
+        "area": cv2.contourArea(main_contour),
+        "perimeter": cv2.arcLength(main_contour, True),
+        "is_convex": cv2.isContourConvex(approx_contour),
+    }
+
+
+def _center_contour(approx_contour, shape):
+    """輪郭を元画像の中央に寄せた座標（元画像のピクセル単位）"""
+    h, w = shape[:2]
+
+    # 中心に配置するためのオフセットを計算
+    x_min = min(point[0][0] for point in approx_contour)
+    y_min = min(point[0][1] for point in approx_contour)
+    x_max = max(point[0][0] for point in approx_contour)
+    y_max = max(point[0][1] for point in approx_contour)
+    offset_x = (w - (x_max - x_min)) // 2 - x_min
+    offset_y = (h - (y_max - y_min)) // 2 - y_min
+
+    return [(point[0][0] + offset_x, point[0][1] + offset_y) for point in approx_contour]
+
+
+def _scale_points(centered, shape, canvas_size):
+    h, w = shape[:2]
+    scale_x = canvas_size[0] / w
+    scale_y = canvas_size[1] / h
+    return [(int(x * scale_x), int(y * scale_y)) for x, y in centered]
+
+
+def normalize_contour(approx_contour, shape, canvas_size=(500, 500)):
+    """輪郭を元画像の中央に寄せ、キャンバスの座標に変換した点のリストを返す"""
+    return _scale_points(_center_contour(approx_contour, shape), shape, canvas_size)
+
+
+def render_contour(approx_contour, shape, canvas_size=(500, 500), line_width=5, style=STYLE_OUTLINE):
+    """単純化した輪郭を白いキャンバスの中央に黒で描画する
+
+    描画に使った輪郭とパラメータは画像の info["glyph"] に残す（ベクター形式での保存用）。
+    """
+    # 輪郭の座標を正規化して描画
+    points = normalize_contour(approx_contour, shape, canvas_size)
+    return _draw_points(points, approx_contour, shape, canvas_size, line_width, style)
+
+
+def scaled_line_width(line_width, size, base_size=500):
+    """キャンバスの大きさに合わせた線の太さ（base_size のときに line_width）"""
+    return max(1, round(line_width * size / base_size))
+
+
+def render_sizes(approx_contour, shape, sizes, line_width=5, style=STYLE_OUTLINE, base_size=500):
+    """1つの輪郭から複数の大きさの画像を描画する（{大きさ: 画像}）
+
+    中央寄せは1回だけ行い、大きさごとには座標の拡大と描画だけを行う。
+    線の太さ（テクスチャの線の長さも）は base_size のキャンバスでの値に比例させる。
+    """
+    centered = _center_contour(approx_contour, shape)
+    images = {}
+    for size in sizes:
+        canvas_size = (size, size)
+        points = _scale_points(centered, shape, canvas_size)
+        images[size] = _draw_points(points, approx_contour, shape, canvas_size,
+                                    scaled_line_width(line_width, size, base_size), style,
+                                    scaled_line_width(TEXTURE_STROKE, size, base_size))
+    return images
+
+
+def _draw_points(points, approx_contour, shape, canvas_size, line_width, style, texture_stroke=TEXTURE_STROKE):
+    from PIL import Image, ImageDraw, ImageFilter
+
+    character_img = Image.new('RGB', canvas_size, color='white')
+    draw = ImageDraw.Draw(character_img)
+    glyph = {"contour": approx_contour, "shape": shape, "canvas_size": canvas_size,
+             "line_width": line_width, "style": style}
+
+    if style == STYLE_FILLED:
+        draw.polygon(points, outline='black', fill='black')
+        character_img.info["glyph"] = glyph
+        return character_img
+
+    # 線を太くして象形文字らしく
+    for i in range(len(points)):
+        draw.line([points[i], points[(i + 1) % len(points)]], fill='black', width=line_width)
+
+    if style == STYLE_TEXTURED:
+        # テクスチャ効果（ノイズや筆のストロークを模倣）
+        import random
+
+        texture_img = character_img.copy()
+        draw_texture = ImageDraw.Draw(texture_img)
+        # ポリゴン内部に短い線をランダムに描画してテクスチャを作成
+        glyph["texture"] = []
+        for _ in range(50):
+            x1 = random.randint(min(p[0] for p in points), max(p[0] for p in points))
+            y1 = random.randint(min(p[1] for p in points), max(p[1] for p in points))
+            x2 = x1 + random.randint(-texture_stroke, texture_stroke)
+            y2 = y1 + random.randint(-texture_stroke, texture_stroke)
+            draw_texture.line([(x1, y1), (x2, y2)], fill='black', width=1)
+            glyph["texture"].append((x1, y1, x2, y2))
+        # 元の画像とテクスチャをブレンドし、少しぼかして古い象形文字のような効果を追加
+        character_img = Image.blend(character_img, texture_img, 0.3)
+        character_img = character_img.filter(ImageFilter.GaussianBlur(0.5))
+
+    character_img.info["glyph"] = glyph
+    return character_img
+
+
+class ImageLoader:
+    """画像を読み込み、グレースケール画像を作る
+
+    コンテキストに data（ファイルの中身のバイト列）があれば、ファイルを開かずにそれをデコードする
+    （アーカイブのメンバーなど）。
+    """
+
+    def __call__(self, context):
+        import cv2
+
+        data = context.pop("data", None)
+        if data is not None:
+            import numpy as np
+
+            img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        else:
+            img = cv2.imread(context["path"])
+        if img is None:
+            return None
+        context["image"] = img
+        context["gray"] = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        context["shape"] = context["gray"].shape
+        return context
+
+
+class CannyEdgeDetector:
+    """Cannyでエッジ画像を作る"""
+
+    def __init__(self, threshold1=50, threshold2=150):
+        self.threshold1 = threshold1
+        self.threshold2 = threshold2
+
+    def __call__(self, context):
+        import cv2
+
+        context["edges"] = cv2.Canny(context["gray"], self.threshold1, self.threshold2)
+        return context
+
+
+class ContourSelector:
+    """輪郭を検出し、最も大きいものを選ぶ
+
+    min_area より小さい輪郭は除外する。threshold_fallback を指定すると、
+    エッジから輪郭が見つからない場合にグレースケールの二値化から輪郭を探し直す。
+    keep_edges=False ならエッジ画像はここで手放す（メモリ節約）。
+    """
+
+    def __init__(self, mode=RETR_EXTERNAL, min_area=0, threshold_fallback=None, keep_edges=False):
+        self.mode = mode
+        self.min_area = min_area
+        self.threshold_fallback = threshold_fallback
+        self.keep_edges = keep_edges
+
+    def __call__(self, context):
+        import cv2
+
+        mode = cv2.RETR_LIST if self.mode == RETR_LIST else cv2.RETR_EXTERNAL
+        edges = context["edges"] if self.keep_edges else context.pop("edges")
+        contours, _ = cv2.findContours(edges, mode, cv2.CHAIN_APPROX_SIMPLE)
+        del edges
+
+        if not contours and self.threshold_fallback is not None:
+            _, thresh = cv2.threshold(context["gray"], self.threshold_fallback, 255, cv2.THRESH_BINARY)
+            contours, _ = cv2.findContours(thresh, mode, cv2.CHAIN_APPROX_SIMPLE)
+            context["used_threshold_fallback"] = True
+
+        context["contour_count"] = len(contours)
+        if self.min_area > 0:
+            contours = [cnt for cnt in contours if cv2.contourArea(cnt) > self.min_area]
+        context["main_contour"] = max(contours, key=cv2.contourArea) if contours else None
+        return context
+
+
+class Simplifier:
+    """輪郭を周囲長に対する割合 ratio で単純化し、特徴量を計算する
+
+    use_pyramid=True の場合は許容誤差ツリー（simplification.py）を作ってコンテキストに残し、
+    単純化レベルだけを変えて再実行するときは approxPolyDP をやり直さない。
+    """
+
+    def __init__(self, ratio=0.01, use_pyramid=False):
+        self.ratio = ratio
+        self.use_pyramid = use_pyramid
+
+    def __call__(self, context):
+        import cv2
+
+        main_contour = context.get("main_contour")
+        if main_contour is None:
+            context["approx_contour"] = None
+            context["contour_features"] = None
+            return context
+
+        if self.use_pyramid:
+            if context.get("pyramid") is None:
+                from simplification import SimplificationPyramid
+                context["pyramid"] = SimplificationPyramid(main_contour)
+            approx_contour = context["pyramid"].simplify_ratio(self.ratio)
+        else:
+            epsilon = self.ratio * cv2.arcLength(main_contour, True)
+            approx_contour = cv2.approxPolyDP(main_contour, epsilon, True)
+
+        context["approx_contour"] = approx_contour
+        context["contour_features"] = contour_features_of(main_contour, approx_contour)
+        return context
+
+
+class ContourRenderer:
+    """単純化した輪郭を描画する
+
+    輪郭が無い場合は no_contour に応じて、元の画像（"original"）か
+    グレースケールを二値化した画像（"binary"）を出力にする。
+    sizes を指定すると、同じ輪郭から一辺がそのピクセル数の画像も描画し、
+    output_images に {大きさ: 画像} で入れる（線の太さは canvas_size の幅に比例）。
+    """
+
+    def __init__(self, canvas_size=(500, 500), line_width=5, style=STYLE_OUTLINE, no_contour="original", sizes=()):
+        self.canvas_size = canvas_size
+        self.line_width = line_width
+        self.style = style
+        self.no_contour = no_contour
+        self.sizes = tuple(sizes)
+
+    def __call__(self, context):
+        import cv2
+        from PIL import Image
+
+        approx_contour = context.get("approx_contour")
+        if approx_contour is not None:
+            context["output_image"] = render_contour(
+                approx_contour, context["shape"], self.canvas_size, self.line_width, self.style)
+            if self.sizes:
+                context["output_images"] = render_sizes(
+                    approx_contour, context["shape"], self.sizes, self.line_width, self.style, self.canvas_size[0])
+        elif self.no_contour == "binary":
+            _, binary = cv2.threshold(context["gray"], 127, 255, cv2.THRESH_BINARY)
+            context["output_image"] = Image.fromarray(binary)
+        else:
+            context["output_image"] = Image.fromarray(cv2.cvtColor(context["image"], cv2.COLOR_BGR2RGB))
+        return context
+
+
+class Describer:
+    """説明文を生成する
+
+    describe_character(contour_features, 画像名, token, on_delta) と
+    describe_simple(画像名, token, on_delta) を指定すると、アプリ独自の処理
+    （ログ・エラー時の文言など）を使う。省略時は説明生成サービスを直接呼ぶ。
+    """
+
+    def __init__(self, describe_character=None, describe_simple=None, client=None):
+        self.describe_character = describe_character
+        self.describe_simple = describe_simple
+        self.client = client
+
+    def __call__(self, context):
+        features = context.get("contour_features")
+        name = context["name"]
+        token = context.get("token")
+        on_delta = context.get("on_delta")
+
+        if features is not None and self.describe_character is not None:
+            context["description"] = self.describe_character(features, name, token, on_delta)
+        elif features is None and self.describe_simple is not None:
+            context["description"] = self.describe_simple(name, token, on_delta)
+        else:
+            from descriptions import get_description_service
+            context["description"], context["description_source"] = get_description_service().describe_any(
+                self.client, features, name, token, on_delta)
+        return context
+
+
+def _is_frame(value):
+    """共有メモリで受け渡す配列（画像）か"""
+    import numpy as np
+
+    return isinstance(value, np.ndarray) and value.ndim >= 2 and value.nbytes >= SHARED_FRAME_MIN_BYTES
+
+
+def _run_stage(stage, context, shared, spare):
+    """プロセスプールで1段階を実行する（モジュールレベルの関数でないとpickleできない）
+
+    shared は {キー: FrameHandle} で、その画像はコピーせず共有メモリのビューとして段階に渡す。
+    段階が変えなかった画像はハンドルのまま返し、新しく作った画像は空きのブロック spare に
+    書き込んでハンドルで返す（spare の形はブロックのバイト数。収まらない画像だけはpickleで返る）。
+    """
+    from shared_frames import attach
+
+    views = {}
+    for key, handle in shared.items():
+        views[key] = context[key] = attach(handle)
+    result = stage(context)
+    if result is None:
+        return None
+
+    spare = list(spare)
+    for key, value in list(result.items()):
+        if key in views and value is views[key]:
+            result[key] = shared[key]
+        elif _is_frame(value):
+            handle = next((h for h in spare if h.shape[0] >= value.nbytes), None)
+            if handle is None:
+                continue
+            spare.remove(handle)
+            handle = handle._replace(shape=value.shape, dtype=value.dtype.str)
+            attach(handle)[...] = value
+            result[key] = handle
+    return result
+
+
+class Pipeline:
+    """段階を順に実行する変換エンジン
+
+    stages は (段階名, 段階) のリスト。executors は {段階名: "thread" / "process" /
+    ("process", ワーカー数)} で、指定の無い段階は呼び出し元のスレッドで実行する。
+    プロセスで実行する段階との画像の受け渡しには、パイプラインが持つ共有メモリのプール
+    （shared_frames.SharedFramePool）を使う。段階は受け取った配列をその場で書き換えないこと。
+    """
+
+    def __init__(self, stages, executors=None):
+        self.stages = list(stages)
+        self.executors = {}
+        for name, spec in (executors or {}).items():
+            kind, workers = (spec, None) if isinstance(spec, str) else spec
+            if kind not in (INLINE, THREAD, PROCESS):
+                raise ValueError(f"不明な実行方法です: {kind}")
+            self.executors[name] = (kind, workers)
+        self._pools = {}
+        self._frames = None
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        """段階を名前で取得する"""
+        for stage_name, stage in self.stages:
+            if stage_name == name:
+                return stage
+        raise KeyError(name)
+
+    def _pool(self, name):
+        kind, workers = self.executors.get(name, (INLINE, None))
+        if kind == INLINE:
+            return kind, None
+        with self._lock:
+            pool = self._pools.get(name)
+            if pool is None:
+                if kind == PROCESS:
+                    from concurrency import make_executor
+                    from shared_frames import SharedFramePool
+                    pool = make_executor(PROCESS, workers)
+                    if self._frames is None:
+                        self._frames = SharedFramePool()
+                else:
+                    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"pipeline-{name}")
+                self._pools[name] = pool
+        return kind, pool
+
+    def _execute(self, name, stage, context):
+        kind, pool = self._pool(name)
+        if kind == INLINE:
+            return stage(context)
+        if kind == THREAD:
+            return pool.submit(stage, context).result()
+        # プロセスにはキャンセルトークンなどを送らず、戻ってきたコンテキストに付け直す
+        runtime = {key: context.pop(key) for key in RUNTIME_KEYS if key in context}
+        return self._execute_in_process(pool, stage, context, runtime)
+
+    def _execute_in_process(self, pool, stage, context, runtime):
+        """プロセスで1段階を実行する（画像はpickleせず共有メモリで受け渡す）"""
+        import numpy as np
+        from shared_frames import FrameHandle
+
+        frames = self._frames
+        originals = {key: value for key, value in context.items() if _is_frame(value)}
+        shared = {}
+        spare = []
+        try:
+            # 処理中の画像の分だけ確保する（上限で待つと run_many の駆動スレッド同士で詰まるため）
+            for key, value in originals.items():
+                handle = frames.try_acquire(value.shape, value.dtype, force=True)
+                frames.array(handle)[...] = value
+                shared[key] = handle
+            # 段階が新しく作る画像の書き込み先（入力の画像と同じ数・最大の大きさ）
+            if originals:
+                largest = max(value.nbytes for value in originals.values())
+                spare = [frames.try_acquire((largest,), force=True) for _ in originals]
+
+            sent = {key: value for key, value in context.items() if key not in shared}
+            result = pool.submit(_run_stage, stage, sent, shared, spare).result()
+            if result is None:
+                return None
+            for key, value in result.items():
+                if not isinstance(value, FrameHandle):
+                    continue
+                if shared.get(key) == value:
+                    # 変わらなかった画像は手元の配列をそのまま使う
+                    result[key] = originals[key]
+                else:
+                    # ブロックは次の画像で再利用するため、新しい画像は取り出しておく
+                    result[key] = np.array(frames.array(value))
+            result.update(runtime)
+            return result
+        finally:
+            for handle in list(shared.values()) + spare:
+                frames.release(handle)
+
+    def run(self, path=None, token=None, on_delta=None, context=None, start_at=None, until=None, on_stage=None):
+        """1枚の画像を変換し、コンテキストを返す（途中で打ち切った場合は None）
+
+        context と start_at を指定すると、途中の段階から再開する（前回の結果の再利用）。
+        until を指定すると、その段階まで実行して返す。
+        on_stage(段階名, コンテキスト) は各段階の終了時に呼ばれる（進捗表示用）。
+        各段階の処理時間（ミリ秒）はコンテキストの timings に段階名で記録する。
+        """
+        if context is None:
+            context = {"path": path, "name": os.path.splitext(os.path.basename(path))[0]}
+        context["token"] = token
+        context["on_delta"] = on_delta
+
+        started = start_at is None
+        for name, stage in self.stages:
+            if not started:
+                if name != start_at:
+                    continue
+                started = True
+            check_cancelled(token)
+            stage_start = time.perf_counter()
+            context = self._execute(name, stage, context)
+            if context is None:
+                return None
+            context.setdefault("timings", {})[name] = (time.perf_counter() - stage_start) * 1000
+            if on_stage is not None:
+                on_stage(name, context)
+            if name == until:
+                break
+
+        for key in RUNTIME_KEYS:
+            context.pop(key, None)
+        return context
+
+    def params(self):
+        """エクスポート用に、エッジ検出のしきい値と単純化の割合を返す"""
+        params = {}
+        stages = dict(self.stages)
+        edges = stages.get("edges")
+        if edges is not None:
+            params["threshold1"] = edges.threshold1
+            params["threshold2"] = edges.threshold2
+        simplifier = stages.get("simplifier")
+        if simplifier is not None:
+            params["simplification"] = simplifier.ratio
+        return params
+
+    def run_many(self, paths, workers=None, token=None, on_result=None):
+        """複数の画像を変換する（on_result(path, コンテキスト, エラー) で結果を受け取る）
+
+        workers 本の駆動スレッドがそれぞれ1枚ずつ段階を進めるため、
+        ある画像の描画中に次の画像のエッジ検出がプロセスプールで進む。
+        """
+        from concurrency import cpu_count
+
+        def drive(path):
+            try:
+                result, error = self.run(path, token=token), None
+            except Exception as e:
+                result, error = None, e
+            if on_result is not None:
+                on_result(path, result, error)
+            return result
+
+        with ThreadPoolExecutor(max_workers=workers or cpu_count(), thread_name_prefix="pipeline") as executor:
+            return list(executor.map(drive, paths))
+
+    def close(self):
+        """段階ごとのプールを終了する"""
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools = {}
+            frames, self._frames = self._frames, None
+        for pool in pools:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if frames is not None:
+            frames.close()
+
+
+def main_preset(describer=None, executors=None):
+    """main.py / main_backup.py の変換: Canny 50/150、外側の輪郭のみ"""
+    return Pipeline([
+        ("loader", ImageLoader()),
+        ("edges", CannyEdgeDetector(50, 150)),
+        ("contours", ContourSelector(RETR_EXTERNAL)),
+        ("simplifier", Simplifier(0.01)),
+        ("renderer", ContourRenderer(no_contour="original")),
+        ("describer", describer or Describer()),
+    ], executors)
+
+
+def fixed_main_preset(describer=None, executors=None):
+    """fixed_main.py の変換: Canny 30/100、全ての輪郭、二値化での再検出、面積100以下は除外"""
+    return Pipeline([
+        ("loader", ImageLoader()),
+        ("edges", CannyEdgeDetector(30, 100)),
+        ("contours", ContourSelector(RETR_LIST, min_area=100, threshold_fallback=127)),
+        ("simplifier", Simplifier(0.01)),
+        ("renderer", ContourRenderer(no_contour="binary")),
+        ("describer", describer or Describer()),
+    ], executors)
+
+
+def advanced_preset(threshold1=50, threshold2=150, simplification=10, line_width=5, style=STYLE_OUTLINE,
+                    executors=None):
+    """advanced_version.py の変換: しきい値・単純化レベル（1〜100）・線の太さ・スタイルを指定、説明なし"""
+    return Pipeline([
+        ("loader", ImageLoader()),
+        ("edges", CannyEdgeDetector(threshold1, threshold2)),
+        ("contours", ContourSelector(RETR_EXTERNAL, keep_edges=True)),
+        ("simplifier", Simplifier(simplification / 1000, use_pyramid=True)),
+        ("renderer", ContourRenderer(line_width=line_width, style=style, no_contour="original")),
+    ], executors)
+
+
+PRESETS = {
+    "main": main_preset,
+    "fixed_main": fixed_main_preset,
+    "advanced": advanced_preset,
+}
@@ -0,0 +1,162 @@
+"""象形文字の形による類似検索
+
+変換時に輪郭から小さな形状記述子（Huモーメント + 正規化フーリエ記述子）を計算し、
+配列ベースのインデックスに格納する。検索は全件に対する行列演算1回で行うため、
+100万件でも1コアで数ミリ秒〜数十ミリ秒で返る。
+
+使い方:
+    python shape_index.py インデックス.npz 画像ファイル -k 10
+"""
+import sys
+import argparse
+
+import numpy as np
+
+# フーリエ記述子の計算に使う再標本化の点数と、使う係数の数
+RESAMPLE_POINTS = 64
+FOURIER_COEFFICIENTS = 16
+
+HU_DIMENSIONS = 7
+DESCRIPTOR_SIZE = HU_DIMENSIONS + FOURIER_COEFFICIENTS
+
+# 各成分の重み（Huモーメントはlogスケールで値域が広いため小さくする）
+HU_WEIGHT = 0.25
+FOURIER_WEIGHT = 1.0
+
+# これより小さいHuモーメントは0とみなす（対称な形では計算誤差で符号も桁も揺れるため）
+HU_FLOOR = 1e-10
+
+
+def resample_contour(contour, count=RESAMPLE_POINTS):
+    """閉じた輪郭を周囲長に沿って等間隔に再標本化する"""
+    points = np.asarray(contour, dtype=np.float64).reshape(-1, 2)
+    closed = np.vstack([points, points[:1]])
+    segment_lengths = np.hypot(*np.diff(closed, axis=0).T)
+    cumulative = np.concatenate([[0.0], np.cumsum(segment_lengths)])
+    total = cumulative[-1]
+    if total == 0:
+        return np.repeat(points[:1], count, axis=0)
+    targets = np.linspace(0, total, count, endpoint=False)
+    x = np.interp(targets, cumulative, closed[:, 0])
+    y = np.interp(targets, cumulative, closed[:, 1])
+    return np.stack([x, y], axis=1)
+
+
+def fourier_descriptor(contour, coefficients=FOURIER_COEFFICIENTS):
+    """位置・大きさ・回転・始点に依存しないフーリエ記述子"""
+    points = resample_contour(contour)
+    spectrum = np.fft.fft(points[:, 0] + 1j * points[:, 1])
+    magnitudes = np.abs(spectrum[1:coefficients + 2])
+    # 1次の係数で割って大きさを正規化（直流成分は位置なので除く）
+    scale = magnitudes[0] if magnitudes[0] > 0 else 1.0
+    return (magnitudes[1:] / scale).astype(np.float32)
+
+
+def hu_descriptor(contour):
+    """Huモーメント（符号付きlogスケール）"""
+    import cv2
+
+    hu = cv2.HuMoments(cv2.moments(np.asarray(contour, dtype=np.float32).reshape(-1, 1, 2))).ravel()
+    hu[np.abs(hu) < HU_FLOOR] = 0.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scaled = -np.sign(hu) * np.log10(np.abs(hu))
+    scaled[~np.isfinite(scaled)] = 0.0
+    return scaled.astype(np.float32)
+
+
+def compute_descriptor(contour):
+    """輪郭（approx_contour など）から形状記述子を計算する"""
+    return np.concatenate([
+        hu_descriptor(contour) * HU_WEIGHT,
+        fourier_descriptor(contour) * FOURIER_WEIGHT,
+    ]).astype(np.float32)
+
+
+class ShapeIndex:
+    """形状記述子の配列ベースのインデックス（k近傍検索）"""
+
+    def __init__(self, dimensions=DESCRIPTOR_SIZE, capacity=1024):
+        self.dimensions = dimensions
+        self._vectors = np.zeros((capacity, dimensions), dtype=np.float32)
+        self._norms = np.zeros(capacity, dtype=np.float32)
+        self.ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def vectors(self):
+        return self._vectors[:len(self.ids)]
+
+    def _reserve(self, count):
+        if count <= len(self._vectors):
+            return
+        capacity = max(count, len(self._vectors) * 2)
+        vectors = np.zeros((capacity, self.dimensions), dtype=np.float32)
+        norms = np.zeros(capacity, dtype=np.float32)
+        vectors[:len(self.ids)] = self.vectors
+        norms[:len(self.ids)] = self._norms[:len(self.ids)]
+        self._vectors, self._norms = vectors, norms
+
+    def add(self, glyph_id, descriptor):
+        """記述子を1件追加する"""
+        self.add_many([glyph_id], np.asarray(descriptor, dtype=np.float32).reshape(1, -1))
+
+    def add_many(self, glyph_ids, descriptors):
+        """記述子をまとめて追加する"""
+        descriptors = np.asarray(descriptors, dtype=np.float32).reshape(-1, self.dimensions)
+        start = len(self.ids)
+        self._reserve(start + len(descriptors))
+        self._vectors[start:start + len(descriptors)] = descriptors
+        self._norms[start:start + len(descriptors)] = np.einsum("ij,ij->i", descriptors, descriptors)
+        self.ids.extend(glyph_ids)
+
+    def search(self, descriptor, k=10):
+        """記述子に近い順に (ID, 距離) のリストを返す"""
+        count = len(self.ids)
+        if count == 0:
+            return []
+        query = np.asarray(descriptor, dtype=np.float32).ravel()
+        # |x - q|^2 = |x|^2 - 2 x・q + |q|^2 を1回の行列ベクトル積で計算
+        distances = self._norms[:count] - 2.0 * (self.vectors @ query) + float(query @ query)
+        k = min(k, count)
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return [(self.ids[i], float(np.sqrt(max(distances[i], 0.0)))) for i in nearest]
+
+    def save(self, path):
+        """NPZファイルに保存する"""
+        np.savez(path, vectors=self.vectors, ids=np.array(self.ids, dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        """NPZファイルから読み込む"""
+        with np.load(path) as data:
+            vectors = data["vectors"]
+            ids = data["ids"].tolist()
+        index = cls(dimensions=vectors.shape[1], capacity=max(1, len(ids)))
+        index.add_many(ids, vectors)
+        return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="形の似た象形文字を検索")
+    parser.add_argument("index", help="batch.py --index で作成したインデックス（.npz）")
+    parser.add_argument("image", help="検索に使う画像")
+    parser.add_argument("-k", type=int, default=10, help="表示する件数")
+    args = parser.parse_args()
+
+    from batch import extract_main_contour
+
+    extracted = extract_main_contour(args.image)
+    if extracted is None or extracted["main_contour"] is None:
+        print("輪郭が見つかりませんでした")
+        return 1
+    index = ShapeIndex.load(args.index)
+    for glyph_id, distance in index.search(compute_descriptor(extracted["approx_contour"]), args.k):
+        print(f"{distance:8.4f}  {glyph_id}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
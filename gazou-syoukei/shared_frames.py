@@ -0,0 +1,378 @@
+"""共有メモリによるプロセス間のフレーム受け渡し
+
+デコードとエッジ検出を別々のプロセスで実行すると、NumPyの画像をpickleで
+受け渡すたびに画像全体のコピーが2回（送信側・受信側）発生する。
+ここでは multiprocessing.shared_memory のブロックをプールしておき、
+グレースケール画像とエッジ画像は共有メモリに直接書き込んで、
+プロセス間ではハンドル（ブロック名・形・型）だけを渡す。
+
+ブロックの確保・返却は親プロセスだけが行い、使い終わったブロックは次の画像で再利用する。
+プールを閉じたとき・プロセス終了時（atexit / ガベージコレクション）には
+全てのブロックを unlink するため、途中で例外が起きても /dev/shm に残らない。
+
+使い方:
+    python shared_frames.py 画像フォルダ --decode-workers 2 --edge-workers 2
+    python shared_frames.py 画像フォルダ --compare   # pickleでの受け渡しと比較
+"""
+import sys
+import time
+import queue
+import atexit
+import weakref
+import argparse
+import threading
+from collections import OrderedDict, deque, namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# ブロックの大きさはこの単位で切り上げる（少し大きさの違う画像でも再利用できるように）
+SLOT_ALIGNMENT = 1024 * 1024
+
+# プール全体の上限（バイト）。超える場合は使用中のブロックが返却されるまで新しい画像を始めない
+DEFAULT_POOL_BYTES = 512 * 1024 * 1024
+
+# ワーカー側でアタッチしたままにしておくブロック数
+ATTACH_CACHE_SIZE = 64
+
+# ブロック名・配列の形・型。これだけをプロセス間で受け渡す
+FrameHandle = namedtuple("FrameHandle", ["name", "shape", "dtype"])
+
+
+def _nbytes(shape, dtype):
+    return int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+
+def _destroy_blocks(blocks):
+    """全てのブロックを閉じて削除する（finalize / atexit から呼ばれる）"""
+    while blocks:
+        _, block = blocks.popitem()
+        try:
+            block.close()
+        except BufferError:
+            # 親プロセス内にビューが残っている場合でも削除だけは行う
+            pass
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedFramePool:
+    """共有メモリブロックのプール（親プロセスで使う）
+
+    acquire() で形に合うブロックを借り、release() で返す。
+    返されたブロックは削除せず、次に同じ大きさ以下の画像が来たときに再利用する。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_POOL_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._blocks = OrderedDict()
+        self._free = []
+        self._in_use = set()
+        self._total = 0
+        self.stats = {"created": 0, "reused": 0, "peak_bytes": 0}
+        # close() を呼び忘れた場合・異常終了した場合もブロックを残さない
+        self._finalizer = weakref.finalize(self, _destroy_blocks, self._blocks)
+        atexit.register(self._finalizer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def total_bytes(self):
+        return self._total
+
+    def try_acquire(self, shape, dtype=np.uint8, force=False):
+        """形に合うブロックを借りる（上限を超える場合は None）
+
+        force=True の場合は上限を超えても確保する（処理中の画像が無く、待っても空かない場合）。
+        """
+        nbytes = _nbytes(shape, dtype)
+        with self._lock:
+            # 足りる中で一番小さい空きブロックを再利用する
+            candidates = [name for name in self._free if self._blocks[name].size >= nbytes]
+            if candidates:
+                name = min(candidates, key=lambda n: self._blocks[n].size)
+                self._free.remove(name)
+                self._in_use.add(name)
+                self.stats["reused"] += 1
+                return FrameHandle(name, tuple(shape), np.dtype(dtype).str)
+
+            size = -(-max(nbytes, 1) // SLOT_ALIGNMENT) * SLOT_ALIGNMENT
+            # 上限を超える場合は、空きブロックを削除して場所を空ける
+            while self._free and self._total + size > self.max_bytes:
+                self._remove(self._free.pop(0))
+            if not force and self._total + size > self.max_bytes:
+                return None
+
+            block = shared_memory.SharedMemory(create=True, size=size)
+            self._blocks[block.name] = block
+            self._in_use.add(block.name)
+            self._total += block.size
+            self.stats["created"] += 1
+            self.stats["peak_bytes"] = max(self.stats["peak_bytes"], self._total)
+            return FrameHandle(block.name, tuple(shape), np.dtype(dtype).str)
+
+    def _remove(self, name):
+        block = self._blocks.pop(name)
+        self._total -= block.size
+        block.close()
+        block.unlink()
+
+    def array(self, handle):
+        """親プロセスでブロックを配列として参照する（コピーしない）"""
+        block = self._blocks[handle.name]
+        return np.ndarray(handle.shape, dtype=handle.dtype, buffer=block.buf)
+
+    def release(self, handle):
+        """ブロックを返却する（削除せず再利用に回す）"""
+        with self._lock:
+            if handle.name in self._in_use:
+                self._in_use.discard(handle.name)
+                self._free.append(handle.name)
+
+    def close(self):
+        """全てのブロックを削除する"""
+        with self._lock:
+            self._free = []
+            self._in_use = set()
+            self._total = 0
+        self._finalizer()
+
+
+# ワーカープロセス側でアタッチしたブロック（名前 → SharedMemory）
+_attached = OrderedDict()
+
+
+def _attach_block(name):
+    block = _attached.get(name)
+    if block is not None:
+        _attached.move_to_end(name)
+        return block
+    try:
+        # Python 3.13以降は、ワーカー側でリソーストラッカーに登録しない
+        block = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # それ以前はプールのワーカーが親と同じトラッカーを共有するので、登録されても削除されない
+        block = shared_memory.SharedMemory(name=name)
+    _attached[name] = block
+    while len(_attached) > ATTACH_CACHE_SIZE:
+        _, old = _attached.popitem(last=False)
+        try:
+            old.close()
+        except BufferError:
+            pass
+    return block
+
+
+def attach(handle, shape=None):
+    """ワーカー側でハンドルを配列として参照する（コピーしない）"""
+    block = _attach_block(handle.name)
+    return np.ndarray(shape or handle.shape, dtype=handle.dtype, buffer=block.buf)
+
+
+def decode_to_shared(path, handle):
+    """画像をグレースケールでデコードし、共有メモリに書き込む（ワーカーで実行）
+
+    戻り値は (ハンドル または 配列, デコード時間, 受け渡し時間)。
+    EXIFの回転で縦横が入れ替わった場合は形を直したハンドルを返し、
+    ブロックに収まらない場合だけ配列をそのまま返す（pickleで受け渡される）。
+    """
+    import cv2
+
+    start = time.perf_counter()
+    gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    decoded = time.perf_counter()
+    if gray is None:
+        return None, decoded - start, 0.0
+    block = _attach_block(handle.name)
+    if gray.nbytes > block.size:
+        return gray, decoded - start, 0.0
+    handle = handle._replace(shape=gray.shape)
+    np.ndarray(gray.shape, dtype=gray.dtype, buffer=block.buf)[...] = gray
+    return handle, decoded - start, time.perf_counter() - decoded
+
+
+def canny_shared(src, dst, threshold1, threshold2):
+    """共有メモリのグレースケール画像からエッジ画像を共有メモリに直接書き込む（ワーカーで実行）
+
+    戻り値は (エッジ検出時間, 受け渡し時間)。
+    """
+    import cv2
+
+    start = time.perf_counter()
+    gray = attach(src)
+    edges = attach(dst, gray.shape)
+    attached = time.perf_counter()
+    cv2.Canny(gray, threshold1, threshold2, edges=edges)
+    return time.perf_counter() - attached, attached - start
+
+
+def _frame_shape(path):
+    """デコード前にヘッダーから (高さ, 幅) を読む"""
+    from batch import read_image_size
+
+    size = read_image_size(path)
+    if size is None:
+        return None
+    width, height = size
+    return (height, width)
+
+
+def run_shared_pipeline(paths, on_edges, decode_workers=2, edge_workers=2,
+                        threshold1=50, threshold2=150, pool_bytes=DEFAULT_POOL_BYTES):
+    """デコードとエッジ検出を別々のプロセスプールで実行する
+
+    on_edges(path, edges) は親プロセスで呼ばれる（edges は共有メモリのビューなので、
+    呼び出しの後も使う場合はコピーすること）。戻り値は処理時間と受け渡し時間の集計。
+    """
+    from concurrency import make_executor
+
+    results = queue.Queue()
+    stats = {"images": 0, "failed": 0, "pickled": 0,
+             "decode": 0.0, "edges": 0.0, "handoff": 0.0, "wait": 0.0}
+
+    def forward(stage, path, handles):
+        return lambda future: results.put((stage, path, handles, future))
+
+    with SharedFramePool(pool_bytes) as pool, \
+            make_executor("process", decode_workers) as decoders, \
+            make_executor("process", edge_workers) as detectors:
+        pending = deque(paths)
+        in_flight = 0
+        # 同時に処理する画像数を抑え、少ないブロックを使い回す（新しいブロックは初回書き込みが遅い）
+        max_in_flight = 2 * (decode_workers + edge_workers)
+        while pending or in_flight:
+            # メモリの上限まで新しい画像のデコードを始める
+            while pending and in_flight < max_in_flight:
+                shape = _frame_shape(pending[0])
+                if shape is None:
+                    stats["failed"] += 1
+                    pending.popleft()
+                    continue
+                # 処理中の画像が無い場合は、上限を超える大きな画像でも1枚だけは始める
+                force = in_flight == 0
+                gray = pool.try_acquire(shape, force=force)
+                if gray is None:
+                    break
+                edges = pool.try_acquire(shape, force=force)
+                if edges is None:
+                    pool.release(gray)
+                    break
+                path = pending.popleft()
+                decoders.submit(decode_to_shared, path, gray).add_done_callback(
+                    forward("decoded", path, (gray, edges)))
+                in_flight += 1
+
+            wait_start = time.perf_counter()
+            stage, path, (gray, edges), future = results.get()
+            stats["wait"] += time.perf_counter() - wait_start
+            try:
+                if stage == "decoded":
+                    frame, decode_time, handoff = future.result()
+                    stats["decode"] += decode_time
+                    stats["handoff"] += handoff
+                    if frame is None:
+                        raise ValueError("画像を読み込めませんでした")
+                    if isinstance(frame, np.ndarray):
+                        # ブロックに収まらなかった画像は大きいブロックを借り直す
+                        stats["pickled"] += 1
+                        pool.release(gray)
+                        pool.release(edges)
+                        gray = pool.try_acquire(frame.shape, force=True)
+                        edges = pool.try_acquire(frame.shape, force=True)
+                        pool.array(gray)[...] = frame
+                    else:
+                        gray = frame
+                    detectors.submit(canny_shared, gray, edges, threshold1, threshold2).add_done_callback(
+                        forward("edges", path, (gray, edges._replace(shape=gray.shape))))
+                    continue
+
+                edge_time, handoff = future.result()
+                stats["edges"] += edge_time
+                stats["handoff"] += handoff
+                on_edges(path, pool.array(edges))
+                stats["images"] += 1
+            except Exception as e:
+                print(f"変換に失敗しました: {path}: {e}")
+                stats["failed"] += 1
+            in_flight -= 1
+            if gray is not None:
+                pool.release(gray)
+            if edges is not None:
+                pool.release(edges)
+
+        stats.update(pool.stats)
+    work = stats["decode"] + stats["edges"]
+    stats["handoff_ratio"] = stats["handoff"] / work if work else 0.0
+    return stats
+
+
+def _decode_pickled(path):
+    import cv2
+
+    return cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+
+
+def _canny_pickled(gray, threshold1, threshold2):
+    import cv2
+
+    return cv2.Canny(gray, threshold1, threshold2)
+
+
+def run_pickled_pipeline(paths, on_edges, decode_workers=2, edge_workers=2, threshold1=50, threshold2=150):
+    """比較用: 同じ処理を配列のpickleで受け渡して実行する"""
+    from concurrency import make_executor
+
+    with make_executor("process", decode_workers) as decoders, \
+            make_executor("process", edge_workers) as detectors:
+        decoded = [(path, decoders.submit(_decode_pickled, path)) for path in paths]
+        detected = [(path, detectors.submit(_canny_pickled, future.result(), threshold1, threshold2))
+                    for path, future in decoded]
+        for path, future in detected:
+            on_edges(path, future.result())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共有メモリでのフレーム受け渡しの計測")
+    parser.add_argument("folder", help="画像フォルダ")
+    parser.add_argument("--decode-workers", type=int, default=2)
+    parser.add_argument("--edge-workers", type=int, default=2)
+    parser.add_argument("--pool-mb", type=int, default=DEFAULT_POOL_BYTES // 1024 // 1024,
+                        help="共有メモリプールの上限（MB）")
+    parser.add_argument("--compare", action="store_true", help="pickleでの受け渡しと比較する")
+    args = parser.parse_args()
+
+    import cv2
+    from batch import list_images
+
+    paths = list_images(args.folder)
+    counts = {}
+
+    def on_edges(path, edges):
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        counts[path] = len(contours)
+
+    start = time.perf_counter()
+    stats = run_shared_pipeline(paths, on_edges, args.decode_workers, args.edge_workers,
+                                pool_bytes=args.pool_mb * 1024 * 1024)
+    elapsed = time.perf_counter() - start
+    print(f"共有メモリ: {stats['images']}枚, {elapsed:.2f}秒, "
+          f"受け渡し {stats['handoff'] * 1000:.1f}ms（処理時間の{stats['handoff_ratio']:.2%}）, "
+          f"ブロック作成 {stats['created']}回 / 再利用 {stats['reused']}回, "
+          f"ピーク {stats['peak_bytes'] / 1024 / 1024:.0f}MB")
+
+    if args.compare:
+        start = time.perf_counter()
+        run_pickled_pipeline(paths, on_edges, args.decode_workers, args.edge_workers)
+        print(f"pickle: {len(paths)}枚, {time.perf_counter() - start:.2f}秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""輪郭の多段階単純化（Douglas–Peucker 許容誤差ツリー）
+
+輪郭ごとに1回だけ、各頂点が「どの許容誤差まで残るか」を計算しておく。
+以後は任意の単純化レベル（cv2.approxPolyDP の epsilon に相当）を
+しきい値で切り出すだけで得られるため、スライダーを動かすたびに
+approxPolyDP を実行し直す必要がない。
+
+分割の始点の選び方（閉じた輪郭では最も遠い2点を3回の探索で近似的に求める）、
+最大距離の頂点の選び方、仕上げの「ほぼ直線上の頂点の除去」は OpenCV の
+approxPolyDP と同じにしてあり、頂点とその順序は cv2.approxPolyDP と一致する
+（距離の測り方はインストールされている OpenCV のバージョンに合わせる）。
+"""
+import numpy as np
+
+
+def opencv_uses_segment_distance():
+    """インストールされている OpenCV の approxPolyDP が、頂点から線分までの距離を使うか
+
+    OpenCV 4.13 以降は直線ではなく線分までの距離で最も遠い頂点を選ぶ。
+    """
+    import cv2
+
+    major, minor = (int(part) for part in cv2.__version__.split(".")[:2])
+    return (major, minor) >= (4, 13)
+
+
+def _anchors(points, iterations):
+    """閉じた輪郭を2本の折れ線に分ける2点と、その距離の二乗を求める
+
+    approxPolyDP と同じく、始点から最も遠い点を求め直すことを iterations 回繰り返す。
+    """
+    n = len(points)
+    position = 0
+    offset = 0
+    max_distance = 0
+    for _ in range(iterations):
+        position = (position + offset) % n
+        following = points[(position + np.arange(1, n)) % n]
+        distances = ((following - points[position]) ** 2).sum(axis=1)
+        if len(distances) and distances.max() > 0:
+            offset = int(np.argmax(distances)) + 1
+            max_distance = float(distances[offset - 1])
+        else:
+            max_distance = 0.0
+    return position, (position + offset) % n, max_distance
+
+
+def douglas_peucker_tolerances(points, closed=True, segment_distance=False):
+    """各頂点が残る許容誤差（の二乗）と、単純化した輪郭の始点を求める
+
+    戻り値は (tolerances, start)。頂点 i は epsilon ** 2 < tolerances[i] のときに
+    単純化後の輪郭に残り、輪郭は頂点 start から順に並ぶ。
+    親の分割より大きな値にならないよう単調に補正するため、
+    しきい値での切り出しは常に入れ子になる。
+    segment_distance=True では頂点から直線ではなく線分までの距離を使う（OpenCV 5 の approxPolyDP）。
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    n = len(points)
+    tolerances = np.zeros(n, dtype=np.float64)
+    if n == 0:
+        return tolerances, 0
+
+    if not closed and (n == 1 or (points[0] != points[-1]).any()):
+        tolerances[0] = tolerances[n - 1] = np.inf
+        work = points
+        start = 0
+        stack = [(0, n - 1, np.inf)]
+    else:
+        # 始点と終点が同じ開いた輪郭は、探索1回の閉じた輪郭として扱う（approxPolyDP と同じ）
+        start, far, max_distance = _anchors(points, 3 if closed else 1)
+        tolerances[start] = np.inf
+        if far == start:
+            return tolerances, start
+        # start が先頭になるよう並べ替えて、2本の折れ線として扱う
+        work = np.roll(points, -start, axis=0)
+        work = np.vstack([work, work[:1]])
+        far = (far - start) % n
+        tolerances[(start + far) % n] = max_distance
+        stack = [(far, n, max_distance), (0, far, max_distance)]
+
+    while stack:
+        first, last, parent = stack.pop()
+        if last - first < 2:
+            continue
+        a = work[first]
+        dx, dy = work[last] - a
+        inner = work[first + 1:last]
+        length = dx * dx + dy * dy
+        # approxPolyDP と同じく、距離の二乗に線分の長さの二乗を掛けた値で最も遠い頂点を選ぶ
+        # （同じ距離なら先の頂点）
+        cross = (inner[:, 1] - a[1]) * dx - (inner[:, 0] - a[0]) * dy
+        distances = cross * cross
+        if segment_distance:
+            # 線分の外側の頂点は端点までの距離
+            projection = (inner[:, 0] - a[0]) * dx + (inner[:, 1] - a[1]) * dy
+            before = projection < 0
+            after = projection > length
+            distances[before] = ((inner[before] - a) ** 2).sum(axis=1) * length
+            distances[after] = ((inner[after] - work[last]) ** 2).sum(axis=1) * length
+        offset = int(np.argmax(distances))
+        index = first + 1 + offset
+        tolerance = min(distances[offset] / length if length else np.inf, parent)
+        tolerances[(start + index) % n] = tolerance
+        stack.append((index, last, tolerance))
+        stack.append((first, index, tolerance))
+
+    return tolerances, start
+
+
+def _remove_collinear(points, epsilon_squared, closed):
+    """approxPolyDP の仕上げと同じく、ほぼ直線上に並んだ頂点を取り除く"""
+    points = [tuple(point) for point in points]
+    count = new_count = len(points)
+    if count == 0:
+        return points
+
+    def read(position):
+        return points[position], (position + 1) % count
+
+    position = count - 1 if closed else 0
+    start_point, position = read(position)
+    write = position
+    point, position = read(position)
+
+    i = 0 if closed else 1
+    while i < count - (0 if closed else 1) and new_count > 2:
+        end_point, position = read(position)
+        dx = end_point[0] - start_point[0]
+        dy = end_point[1] - start_point[1]
+        distance = abs((point[0] - start_point[0]) * dy - (point[1] - start_point[1]) * dx)
+        inner_product = ((point[0] - start_point[0]) * (end_point[0] - point[0])
+                         + (point[1] - start_point[1]) * (end_point[1] - point[1]))
+        if (distance * distance <= 0.5 * epsilon_squared * (dx * dx + dy * dy) and dx != 0 and dy != 0
+                and inner_product >= 0):
+            new_count -= 1
+            points[write] = start_point = end_point
+            write = (write + 1) % count
+            point, position = read(position)
+            i += 2
+            continue
+        points[write] = start_point = point
+        write = (write + 1) % count
+        point = end_point
+        i += 1
+
+    if not closed:
+        points[write] = point
+    return points[:new_count]
+
+
+class SimplificationPyramid:
+    """1本の輪郭から任意の単純化レベルを切り出すためのデータ
+
+    contour は cv2.findContours の輪郭（N×1×2）。
+    """
+
+    def __init__(self, contour, closed=True):
+        import cv2
+
+        self.contour = np.asarray(contour).reshape(-1, 1, 2)
+        self.closed = closed
+        points = self.contour.reshape(-1, 2)
+        tolerances, self._start = douglas_peucker_tolerances(points, closed, opencv_uses_segment_distance())
+
+        # 許容誤差の大きい順に並べておき、しきい値で先頭k個を取り出す
+        # （並べ替えた後も輪郭の順に戻せるよう、始点からの位置で持つ）
+        order = np.argsort(-tolerances, kind="stable")
+        self._order = (order - self._start) % max(len(points), 1)
+        self._sorted_tolerances = -tolerances[order]
+
+        # epsilon = ratio * 周囲長 が approxPolyDP の呼び出し側と同じ値になるよう cv2 で求める
+        self.arc_length = cv2.arcLength(self.contour, closed) if len(points) else 0.0
+
+    def __len__(self):
+        return len(self.contour)
+
+    def count(self, epsilon):
+        """epsilon で単純化したときに残る頂点数（ほぼ直線上の頂点を取り除く前）"""
+        return int(np.searchsorted(self._sorted_tolerances, -epsilon * epsilon, side="left"))
+
+    def simplify(self, epsilon):
+        """epsilon（ピクセル）で単純化した輪郭を返す（cv2.approxPolyDP と同じ結果）"""
+        if len(self.contour) == 0:
+            return self.contour.copy()
+        k = self.count(epsilon)
+        indices = (np.sort(self._order[:k]) + self._start) % len(self.contour)
+        points = _remove_collinear(self.contour[indices].reshape(-1, 2).tolist(), epsilon * epsilon, self.closed)
+        return np.array(points, dtype=self.contour.dtype).reshape(-1, 1, 2)
+
+    def simplify_ratio(self, ratio):
+        """周囲長に対する割合で単純化する（epsilon = ratio * 周囲長）"""
+        return self.simplify(ratio * self.arc_length)
+
+    def levels(self, ratios):
+        """複数の単純化レベルの輪郭をまとめて返す"""
+        return [self.simplify_ratio(ratio) for ratio in ratios]
@@ -0,0 +1,87 @@
+"""説明欄へのストリーミング表示
+
+APIから届いたトークンの断片をワーカースレッドからバッファに溜め、
+UIスレッドでは FLUSH_INTERVAL_MS ごとに1回だけまとめて Text ウィジェットに追記する。
+断片ごとに after() を呼ぶとイベントキューが溢れるため、更新は常に1つに集約する。
+"""
+import threading
+import tkinter as tk
+
+# 追記をまとめる間隔（ミリ秒）
+FLUSH_INTERVAL_MS = 50
+
+
+class StreamingText:
+    """Text ウィジェットにストリームを追記する（1回の変換につき1つ作成する）
+
+    is_active() が False を返すようになったら（新しい変換に置き換えられたら）追記しない。
+    push() / close() は任意のスレッドから、start() / finish() はUIスレッドから呼ぶ。
+    """
+
+    def __init__(self, root, text_widget, is_active=None, interval_ms=FLUSH_INTERVAL_MS):
+        self.root = root
+        self.text_widget = text_widget
+        self.is_active = is_active or (lambda: True)
+        self.interval_ms = interval_ms
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._scheduled = False
+        self._closed = False
+
+    def start(self):
+        """説明欄を空にして受信を開始する"""
+        self._replace("")
+
+    def push(self, text):
+        """受信した断片を追加する（次のまとめ更新で表示される）"""
+        with self._lock:
+            if self._closed:
+                return
+            self._buffer.append(text)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        try:
+            self.root.after(self.interval_ms, self._flush)
+        except (RuntimeError, tk.TclError):
+            # ウィンドウが破棄済み、またはメインループ外
+            with self._lock:
+                self._scheduled = False
+
+    def _flush(self):
+        with self._lock:
+            text = "".join(self._buffer)
+            self._buffer = []
+            self._scheduled = False
+            closed = self._closed
+        if closed or not text or not self.is_active():
+            return
+        try:
+            self.text_widget.config(state="normal")
+            self.text_widget.insert("end", text)
+            self.text_widget.see("end")
+            self.text_widget.config(state="disabled")
+        except tk.TclError:
+            pass
+
+    def close(self):
+        """受信を終了する（まだ表示していない断片は捨てる）"""
+        with self._lock:
+            self._closed = True
+            self._buffer = []
+
+    def finish(self, final_text):
+        """受信を終了し、最終的な説明文で置き換える（ローカルの説明に切り替わった場合も含む）"""
+        self.close()
+        self._replace(final_text)
+
+    def _replace(self, text):
+        if not self.is_active():
+            return
+        try:
+            self.text_widget.config(state="normal")
+            self.text_widget.delete("1.0", "end")
+            self.text_widget.insert("end", text)
+            self.text_widget.config(state="disabled")
+        except tk.TclError:
+            pass
@@ -0,0 +1,209 @@
+"""変換パラメータの探索（スイープ）
+
+advanced_version.py のスライダー（エッジ検出のしきい値1・2、輪郭の単純化レベル）の
+組み合わせを格子状に試し、コンタクトシート（一覧画像）と輪郭数・処理時間の表を出力する。
+
+1枚の画像につきデコードとグレースケール変換は1回だけ行い、
+同じしきい値の組のCanny・輪郭検出・単純化ピラミッドは全ての単純化レベルで使い回す。
+しきい値の組ごとに並列に実行する。
+
+使い方:
+    python sweep.py 画像ファイルまたはフォルダ 出力フォルダ
+    python sweep.py 画像フォルダ 出力フォルダ --threshold1 30,50,80 --threshold2 100,150,200 \\
+        --simplification 5,10,30 --workers 4
+"""
+import os
+import sys
+import csv
+import time
+import argparse
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from concurrency import BATCH, apply_policy, cpu_count
+from pipeline import (
+    CannyEdgeDetector, ContourRenderer, ContourSelector, ImageLoader, Simplifier, RETR_EXTERNAL,
+)
+
+DEFAULT_THRESHOLD1 = (30, 50, 80)
+DEFAULT_THRESHOLD2 = (100, 150, 200)
+DEFAULT_SIMPLIFICATION = (5, 10, 20, 40)
+
+# コンタクトシートの1コマの大きさ（ピクセル）と見出しの高さ
+THUMBNAIL_SIZE = 160
+LABEL_HEIGHT = 28
+
+TABLE_FIELDS = ("image", "threshold1", "threshold2", "simplification", "contours", "points",
+                "decode_ms", "edges_ms", "pyramid_ms", "render_ms")
+
+
+def _parse_values(text):
+    return tuple(int(value) for value in text.split(",") if value.strip())
+
+
+def _sweep_thresholds(context, threshold1, threshold2, simplifications, renderer):
+    """しきい値の組1つについて、全ての単純化レベルを評価する"""
+    start = time.perf_counter()
+    # 読み込み結果は共有し、エッジ・輪郭は組ごとのコンテキストに持つ
+    local = dict(context)
+    local = CannyEdgeDetector(threshold1, threshold2)(local)
+    local = ContourSelector(RETR_EXTERNAL)(local)
+    edges_ms = (time.perf_counter() - start) * 1000
+
+    rows = []
+    images = []
+    pyramid_ms = 0.0
+    for level in simplifications:
+        step_start = time.perf_counter()
+        # 単純化ピラミッドは最初のレベルで作られ、以降はしきい値で切り出すだけ
+        local = Simplifier(level / 1000, use_pyramid=True)(local)
+        simplified = time.perf_counter()
+        if pyramid_ms == 0.0:
+            pyramid_ms = (simplified - step_start) * 1000
+        local = renderer(local)
+        rows.append({
+            "image": context["name"],
+            "threshold1": threshold1,
+            "threshold2": threshold2,
+            "simplification": level,
+            "contours": local["contour_count"],
+            "points": len(local["approx_contour"]) if local["approx_contour"] is not None else 0,
+            "edges_ms": round(edges_ms, 2),
+            "pyramid_ms": round(pyramid_ms, 2),
+            "render_ms": round((time.perf_counter() - simplified) * 1000, 2),
+        })
+        images.append(local["output_image"])
+    return rows, images
+
+
+def contact_sheet(grid, labels, thumbnail_size=THUMBNAIL_SIZE):
+    """画像の2次元リストを見出し付きの一覧画像にまとめる"""
+    from PIL import Image, ImageDraw
+
+    rows = len(grid)
+    columns = max(len(row) for row in grid)
+    cell_height = thumbnail_size + LABEL_HEIGHT
+    sheet = Image.new("RGB", (columns * thumbnail_size, rows * cell_height), color="white")
+    draw = ImageDraw.Draw(sheet)
+    for r, row in enumerate(grid):
+        for c, image in enumerate(row):
+            thumbnail = image.copy()
+            thumbnail.thumbnail((thumbnail_size, thumbnail_size))
+            x, y = c * thumbnail_size, r * cell_height
+            sheet.paste(thumbnail, (x, y + LABEL_HEIGHT))
+            draw.text((x + 4, y + 2), labels[r][c], fill="black")
+            draw.rectangle([x, y, x + thumbnail_size - 1, y + cell_height - 1], outline="gray")
+    return sheet
+
+
+def sweep_image(path, thresholds1, thresholds2, simplifications, executor, line_width=5, style=0):
+    """1枚の画像についてパラメータの格子を評価する
+
+    戻り値は (表の行のリスト, コンタクトシート)。読み込めない場合は (None, None)。
+    """
+    start = time.perf_counter()
+    context = ImageLoader()({"path": path, "name": os.path.splitext(os.path.basename(path))[0]})
+    if context is None:
+        return None, None
+    decode_ms = (time.perf_counter() - start) * 1000
+    renderer = ContourRenderer(line_width=line_width, style=style, no_contour="original")
+
+    pairs = list(itertools.product(thresholds1, thresholds2))
+    futures = [executor.submit(_sweep_thresholds, context, t1, t2, simplifications, renderer)
+               for t1, t2 in pairs]
+
+    table = []
+    grid = []
+    labels = []
+    for (t1, t2), future in zip(pairs, futures):
+        rows, images = future.result()
+        for row in rows:
+            row["decode_ms"] = round(decode_ms, 2)
+        table.extend(rows)
+        grid.append(images)
+        labels.append([f"{t1}/{t2} s{row['simplification']} ({row['points']} pts)" for row in rows])
+    return table, contact_sheet(grid, labels)
+
+
+def summarize(table):
+    """パラメータの組ごとに、全画像での平均の頂点数と処理時間を集計する"""
+    groups = {}
+    for row in table:
+        key = (row["threshold1"], row["threshold2"], row["simplification"])
+        groups.setdefault(key, []).append(row)
+    summary = []
+    for key, rows in sorted(groups.items()):
+        summary.append({
+            "threshold1": key[0],
+            "threshold2": key[1],
+            "simplification": key[2],
+            "images": len(rows),
+            "no_contour": sum(1 for row in rows if row["points"] == 0),
+            "mean_points": sum(row["points"] for row in rows) / len(rows),
+            "mean_edges_ms": sum(row["edges_ms"] for row in rows) / len(rows),
+            "mean_render_ms": sum(row["render_ms"] for row in rows) / len(rows),
+        })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="変換パラメータの組み合わせを一括で試す")
+    parser.add_argument("input", help="画像ファイルまたはフォルダ")
+    parser.add_argument("output_dir", help="コンタクトシートと表の保存先")
+    parser.add_argument("--threshold1", default=",".join(map(str, DEFAULT_THRESHOLD1)),
+                        help="エッジ検出 しきい値1（カンマ区切り）")
+    parser.add_argument("--threshold2", default=",".join(map(str, DEFAULT_THRESHOLD2)),
+                        help="エッジ検出 しきい値2（カンマ区切り）")
+    parser.add_argument("--simplification", default=",".join(map(str, DEFAULT_SIMPLIFICATION)),
+                        help="輪郭の単純化レベル 1〜100（カンマ区切り）")
+    parser.add_argument("--line-width", type=int, default=5, help="線の太さ")
+    parser.add_argument("--style", type=int, default=0, choices=(0, 1, 2),
+                        help="0: 輪郭のみ, 1: 塗りつぶし, 2: テクスチャ付き")
+    parser.add_argument("--workers", type=int, default=None, help="並列数（既定はCPUコア数）")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.input):
+        from batch import list_images
+        paths = list_images(args.input)
+    else:
+        paths = [args.input]
+    thresholds1 = _parse_values(args.threshold1)
+    thresholds2 = _parse_values(args.threshold2)
+    simplifications = _parse_values(args.simplification)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    combinations = len(thresholds1) * len(thresholds2) * len(simplifications)
+    print(f"{len(paths)}枚 × {combinations}通りのパラメータを評価します")
+    # しきい値の組ごとに1スレッド、OpenCVはスレッドごとに1つ
+    apply_policy(BATCH)
+    start = time.perf_counter()
+    table = []
+    with ThreadPoolExecutor(max_workers=args.workers or cpu_count(), thread_name_prefix="sweep") as executor:
+        for path in paths:
+            rows, sheet = sweep_image(path, thresholds1, thresholds2, simplifications, executor,
+                                      args.line_width, args.style)
+            if rows is None:
+                print(f"読み込みに失敗しました: {path}")
+                continue
+            name = os.path.splitext(os.path.basename(path))[0]
+            sheet.save(os.path.join(args.output_dir, f"{name}_sweep.png"))
+            table.extend(rows)
+
+    table_path = os.path.join(args.output_dir, "sweep.csv")
+    with open(table_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=TABLE_FIELDS)
+        writer.writeheader()
+        writer.writerows(table)
+
+    # エッジ検出の時間はしきい値の組ごと（単純化レベル間で共有）、描画の時間は組み合わせごと
+    print("しきい値1 しきい値2 単純化 平均頂点数 輪郭なし エッジ(ms) 描画(ms)")
+    for row in summarize(table):
+        print(f"{row['threshold1']:>9} {row['threshold2']:>9} {row['simplification']:>6} "
+              f"{row['mean_points']:>10.1f} {row['no_contour']:>8} "
+              f"{row['mean_edges_ms']:>10.1f} {row['mean_render_ms']:>8.1f}")
+    print(f"完了: {time.perf_counter() - start:.1f}秒, 表: {table_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
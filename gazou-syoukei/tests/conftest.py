@@ -0,0 +1,7 @@
+import os
+import sys
+
+# テストからアプリのモジュール（gazou-syoukei 直下）を読み込めるようにする
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
@@ -0,0 +1,132 @@
+"""テスト用のチャットAPIのスタブサーバー
+
+/v1/chat/completions に、決めておいたトークンを返す。stream=True のリクエストには
+Server-Sent Events で1トークンずつ返し、最初のトークンまでの遅延・トークン間の遅延・
+途中で止まる（以後のトークンを送らない）応答を再現できる。
+"""
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubOpenAIServer:
+    """別スレッドで動くスタブサーバー（with 文で起動・停止する）
+
+    tokens: 返すトークンのリスト
+    first_token_delay: 最初のトークンを送るまでの秒数
+    token_delay: トークン間の秒数
+    stall_after: この数のトークンを送った後は、停止するまで何も送らない（None なら最後まで送る）
+    """
+
+    def __init__(self, tokens, first_token_delay=0.0, token_delay=0.0, stall_after=None):
+        self.tokens = list(tokens)
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.stall_after = stall_after
+        self.requests = []
+        self._stopped = threading.Event()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def client(self):
+        """このサーバーに接続する OpenAI クライアント"""
+        from openai import OpenAI
+
+        return OpenAI(api_key="test-key", base_url=self.base_url, max_retries=0)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopped.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                stub.requests.append(body)
+                if not self.path.endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                if body.get("stream"):
+                    self._stream(body)
+                else:
+                    self._complete(body)
+
+            def _complete(self, body):
+                if stub._stopped.wait(stub.first_token_delay):
+                    self.close_connection = True
+                    return
+                payload = json.dumps({
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "".join(stub.tokens)}}],
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _event(self, body, delta, finish_reason=None):
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                self._write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+
+            def _write(self, text):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _stream(self, body):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                # 停止したら接続を閉じ、受信途中のクライアントを待たせたままにしない
+                self.close_connection = True
+                try:
+                    if stub._stopped.wait(stub.first_token_delay):
+                        return
+                    self._event(body, {"role": "assistant", "content": ""})
+                    for sent, token in enumerate(stub.tokens):
+                        if stub.stall_after is not None and sent >= stub.stall_after:
+                            stub._stopped.wait()
+                            return
+                        if sent and stub._stopped.wait(stub.token_delay):
+                            return
+                        self._event(body, {"content": token})
+                    self._event(body, {}, "stop")
+                    self._write("data: [DONE]\n\n")
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # クライアントが途中で接続を閉じた（キャンセル）
+                    pass
+
+        return Handler
@@ -0,0 +1,52 @@
+"""複数フレームの画像の変換のテスト"""
+import pytest
+from PIL import Image, ImageDraw
+
+import animation
+from animation import convert_frames
+from conversion_jobs import CancelToken, ConversionCancelled
+
+
+def _write_gif(path):
+    frames = []
+    for box in [(20, 20, 80, 80), (30, 10, 90, 70), (10, 30, 60, 90)]:
+        frame = Image.new("RGB", (100, 100), "white")
+        ImageDraw.Draw(frame).rectangle(box, fill="black")
+        frames.append(frame)
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=50, loop=0)
+    return str(path)
+
+
+@pytest.fixture
+def converted(monkeypatch):
+    calls = []
+    real = animation._convert_frame
+
+    def convert_frame(path, image, token=None):
+        calls.append(image)
+        return real(path, image, token)
+
+    monkeypatch.setattr(animation, "_convert_frame", convert_frame)
+    return calls
+
+
+def test_first_frame_is_reused(tmp_path, converted):
+    path = _write_gif(tmp_path / "anim.gif")
+    first = {"output_image": Image.new("RGB", (500, 500), "white")}
+
+    result = convert_frames(path, workers=2, first=first)
+
+    assert len(result["frames"]) == 3
+    assert result["frames"][0] is first["output_image"]
+    # 最初のフレームは変換し直さない
+    assert len(converted) == 2
+
+
+def test_cancelled_token_stops_conversion(tmp_path, converted):
+    path = _write_gif(tmp_path / "anim.gif")
+    token = CancelToken(1)
+    token.cancel()
+
+    with pytest.raises(ConversionCancelled):
+        convert_frames(path, workers=2, token=token)
+    assert converted == []
@@ -0,0 +1,45 @@
+"""アーカイブの読み込みと結果の書き出しのテスト"""
+import io
+import os
+import tarfile
+
+import pytest
+
+from archive_io import DirectorySink, iter_archive, safe_member_name
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("glyphs/a.png", "glyphs/a.png"),
+    ("./glyphs/./a.png", "glyphs/a.png"),
+    ("../../etc/passwd", "etc/passwd"),
+    ("glyphs/../../a.png", "glyphs/a.png"),
+    ("/etc/cron.d/job", "etc/cron.d/job"),
+    ("//server/share/a.png", "server/share/a.png"),
+    ("..\\..\\Windows\\a.png", "Windows/a.png"),
+    ("C:\\Windows\\a.png", "Windows/a.png"),
+    ("C:/a.png", "a.png"),
+    ("../..", ""),
+])
+def test_safe_member_name_stays_relative(name, expected):
+    assert safe_member_name(name) == expected
+
+
+def test_malicious_members_are_written_inside_output_dir(tmp_path):
+    archive_path = str(tmp_path / "images.tar")
+    with tarfile.open(archive_path, "w") as archive:
+        for name in ["../escape.png", "/abs/root.png", "sub/../../up.png", "ok/fine.png"]:
+            info = tarfile.TarInfo(name)
+            info.size = 3
+            archive.addfile(info, io.BytesIO(b"png"))
+
+    output_dir = tmp_path / "out"
+    sink = DirectorySink(str(output_dir))
+    for name, data in iter_archive(archive_path, (".png",)):
+        sink.write(safe_member_name(name), data)
+    sink.close()
+
+    written = sorted(os.path.relpath(os.path.join(root, file), output_dir)
+                     for root, _, files in os.walk(output_dir) for file in files)
+    assert written == [os.path.join("abs", "root.png"), "escape.png",
+                       os.path.join("ok", "fine.png"), os.path.join("sub", "up.png")]
+    assert sorted(os.listdir(tmp_path)) == ["images.tar", "out"]
@@ -0,0 +1,68 @@
+"""象形文字のアトラスのテスト"""
+import json
+import itertools
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from atlas import GRID, PACKED, AtlasWriter
+
+
+def _glyph(number):
+    """余白の中央に、番号ごとに色と大きさの違う四角を描いた画像"""
+    color = (number * 7 % 256, 255 - number * 11 % 256, number * 13 % 200)
+    width, height = 12 + number * 5 % 80, 10 + number * 9 % 85
+    image = Image.new("RGB", (100, 100), "white")
+    left, top = 50 - width // 2, 50 - height // 2
+    ImageDraw.Draw(image).rectangle((left, top, left + width - 1, top + height - 1), fill=color)
+    return image, color
+
+
+def _colors(region):
+    return {tuple(int(value) for value in pixel) for pixel in np.asarray(region).reshape(-1, 3)}
+
+
+def _overlaps(a, b):
+    return (a["x"] < b["x"] + b["width"] and b["x"] < a["x"] + a["width"]
+            and a["y"] < b["y"] + b["height"] and b["y"] < a["y"] + a["height"])
+
+
+@pytest.mark.parametrize("layout", [GRID, PACKED])
+def test_rects_do_not_overlap_and_map_to_their_glyphs(tmp_path, layout):
+    colors = {}
+    with AtlasWriter(str(tmp_path), cell_size=64, page_size=200, layout=layout) as atlas:
+        for number in range(30):
+            image, colors[f"glyph{number}"] = _glyph(number)
+            atlas.add(f"glyph{number}", image, f"説明{number}")
+
+    with open(tmp_path / "atlas.json", encoding="utf-8") as f:
+        index = json.load(f)
+    assert index["layout"] == layout
+    assert len(index["pages"]) == atlas.page_count > 1
+    assert [glyph["name"] for glyph in index["glyphs"]] == [f"glyph{number}" for number in range(30)]
+
+    pages = [Image.open(tmp_path / name).convert("RGB") for name in index["pages"]]
+    for page_number, page in enumerate(pages):
+        rects = [glyph for glyph in index["glyphs"] if glyph["page"] == page_number]
+        for glyph in rects:
+            assert glyph["x"] + glyph["width"] <= page.width and glyph["y"] + glyph["height"] <= page.height
+            if layout == GRID:
+                assert (glyph["width"], glyph["height"]) == (64, 64)
+        for a, b in itertools.combinations(rects, 2):
+            assert not _overlaps(a, b), (a["name"], b["name"])
+
+    for glyph in index["glyphs"]:
+        page = pages[glyph["page"]]
+        region = page.crop((glyph["x"], glyph["y"], glyph["x"] + glyph["width"], glyph["y"] + glyph["height"]))
+        assert glyph["description"] == "説明" + glyph["name"][len("glyph"):]
+        expected = colors[glyph["name"]]
+        if layout == PACKED:
+            # 余白を切り詰めるので、領域全体がその象形文字の色になる
+            assert _colors(region) == {expected}
+        else:
+            # マスの中央にその象形文字があり、マスの縁は白い（縮小で隣のマスにはみ出さない）
+            assert region.getpixel((32, 32)) == expected
+            pixels = np.asarray(region)
+            assert (pixels[0] == 255).all() and (pixels[-1] == 255).all()
+            assert (pixels[:, 0] == 255).all() and (pixels[:, -1] == 255).all()
@@ -0,0 +1,42 @@
+"""バッチ変換のスケジューラーのテスト"""
+import threading
+
+from batch import MemoryBudgetScheduler
+
+
+def test_on_result_error_is_reported_as_failure_before_release():
+    scheduler = MemoryBudgetScheduler(1000, max_workers=2, estimate_fn=lambda item: 10, rss_fn=lambda: 0)
+    lock = threading.Lock()
+    calls = []
+
+    def on_result(item, result, error):
+        with lock:
+            calls.append((item, result, error, scheduler._reserved))
+        if item == 2 and error is None:
+            raise ValueError("保存に失敗")
+
+    scheduler.run([1, 2, 3], lambda item: item * 10, on_result)
+
+    by_item = {}
+    for item, result, error, reserved in calls:
+        by_item.setdefault(item, []).append((result, error))
+        # 結果を受け取っている間は予約したメモリを解放しない
+        assert reserved >= 10
+    assert by_item[1] == [(10, None)]
+    assert by_item[3] == [(30, None)]
+    first, second = by_item[2]
+    assert first == (20, None)
+    assert second[0] is None and isinstance(second[1], ValueError)
+    assert scheduler._reserved == 0 and scheduler._running == 0
+
+
+def test_failed_conversion_is_passed_to_on_result():
+    scheduler = MemoryBudgetScheduler(1000, max_workers=1, estimate_fn=lambda item: 10, rss_fn=lambda: 0)
+    calls = []
+
+    def convert(item):
+        raise OSError("壊れた画像")
+
+    scheduler.run(["broken"], convert, lambda *args: calls.append(args))
+
+    assert len(calls) == 1 and isinstance(calls[0][2], OSError)
@@ -0,0 +1,80 @@
+"""説明文のオフライン一括生成（投入 → 取り込み）のテスト"""
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image, ImageDraw
+
+from batch import run_batch
+from batch_requests import fetch_results, ingest, results_path, submit
+
+
+class FakeBatchClient:
+    """アップロードされたリクエストに、custom_id を入れた説明文で応答する Batch API の代わり"""
+
+    def __init__(self):
+        self.uploaded = None
+        self.files = SimpleNamespace(create=self._upload, content=self._content)
+        self.batches = SimpleNamespace(create=self._create, retrieve=self._retrieve)
+
+    def _upload(self, file, purpose):
+        self.uploaded = file.read().decode("utf-8")
+        return SimpleNamespace(id="file-input")
+
+    def _create(self, input_file_id, endpoint, completion_window):
+        return SimpleNamespace(id="batch-1", status="validating")
+
+    def _retrieve(self, batch_id):
+        return SimpleNamespace(id=batch_id, status="completed", output_file_id="file-output", request_counts=None)
+
+    def _content(self, file_id):
+        lines = []
+        for line in self.uploaded.splitlines():
+            custom_id = json.loads(line)["custom_id"]
+            lines.append(json.dumps({
+                "custom_id": custom_id,
+                "response": {"status_code": 200, "body": {
+                    "choices": [{"message": {"content": f"APIの説明: {custom_id}"}}]}},
+                "error": None,
+            }, ensure_ascii=False))
+        return io.BytesIO(("\n".join(lines) + "\n").encode("utf-8"))
+
+
+def _write_images(folder):
+    folder.mkdir()
+    for name, box in [("a", (40, 40, 160, 140)), ("b", (40, 40, 160, 140)), ("c", (20, 60, 120, 180))]:
+        image = Image.new("RGB", (200, 200), "white")
+        ImageDraw.Draw(image).ellipse(box, fill="black")
+        image.save(folder / f"{name}.png")
+
+
+def test_submit_and_ingest_round_trip(tmp_path):
+    _write_images(tmp_path / "in")
+    output_dir = tmp_path / "out"
+    requests = str(tmp_path / "requests.jsonl")
+
+    run_batch(str(tmp_path / "in"), str(output_dir), use_api=False, dedupe=True, describe_offline=requests)
+    # b は a の重複として変換されず、a の仮置きの説明文がコピーされる
+    submitted = [json.loads(line)["custom_id"] for line in open(requests, encoding="utf-8")]
+    assert sorted(submitted) == ["a", "c"]
+    assert (output_dir / "b.txt").read_text(encoding="utf-8") == (output_dir / "a.txt").read_text(encoding="utf-8")
+
+    client = FakeBatchClient()
+    submit(client, requests)
+    results = fetch_results(client, requests)
+    assert results == results_path(requests)
+    assert ingest(results, str(output_dir)) == (2, 0)
+
+    assert (output_dir / "a.txt").read_text(encoding="utf-8") == "APIの説明: a"
+    assert (output_dir / "b.txt").read_text(encoding="utf-8") == "APIの説明: a"
+    assert (output_dir / "c.txt").read_text(encoding="utf-8") == "APIの説明: c"
+
+
+def test_offline_descriptions_reject_export_and_atlas(tmp_path):
+    with pytest.raises(ValueError):
+        run_batch(str(tmp_path), str(tmp_path / "out"), use_api=False,
+                  describe_offline=str(tmp_path / "requests.jsonl"), export_path=str(tmp_path / "export.npz"))
+    with pytest.raises(ValueError):
+        run_batch(str(tmp_path), str(tmp_path / "out"), use_api=False,
+                  describe_offline=str(tmp_path / "requests.jsonl"), atlas_layout="grid")
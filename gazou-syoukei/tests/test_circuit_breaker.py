@@ -0,0 +1,90 @@
+"""サーキットブレーカーのハーフオープンの試行のテスト"""
+import threading
+
+import pytest
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from conversion_jobs import CancelToken, ConversionCancelled
+from descriptions import DescriptionService
+
+FEATURES = {"points_count": 12, "is_closed": True, "area": 5000.0, "perimeter": 300.0, "is_convex": False}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _half_open_breaker(clock, **kwargs):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=30, clock=clock, **kwargs)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.state == HALF_OPEN
+    return breaker
+
+
+def test_release_returns_probe_slot():
+    clock = FakeClock()
+    breaker = _half_open_breaker(clock)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.release()
+    assert breaker.allow_request()
+
+
+def test_stuck_probe_times_out_and_reopens():
+    clock = FakeClock()
+    breaker = _half_open_breaker(clock, probe_timeout_seconds=10)
+    assert breaker.allow_request()
+    clock.now += 10
+    assert breaker.state == OPEN
+    assert breaker.metrics()["probe_timeouts"] == 1
+    # クールダウン後は再び試行できる
+    clock.now += 30
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+class BlockingStream:
+    """close() されるまで応答を返さないストリーム"""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        self.closed.wait(5)
+        raise ConnectionError("stream closed")
+
+    def close(self):
+        self.closed.set()
+
+
+class BlockingClient:
+    def __init__(self):
+        self.streams = []
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        stream = BlockingStream()
+        self.streams.append(stream)
+        return stream
+
+
+def test_cancelled_probe_does_not_leave_breaker_half_open():
+    clock = FakeClock()
+    breaker = _half_open_breaker(clock)
+    service = DescriptionService(latency_budget_ms=5000, breaker=breaker)
+    client = BlockingClient()
+    token = CancelToken(1)
+    threading.Timer(0.1, token.cancel).start()
+
+    with pytest.raises(ConversionCancelled):
+        service.describe_character(client, FEATURES, "cancelled", token)
+
+    assert breaker.metrics()["consecutive_failures"] == 1
+    assert breaker.allow_request()
@@ -0,0 +1,80 @@
+"""知覚ハッシュによる重複排除のテスト"""
+import numpy as np
+from PIL import Image, ImageDraw
+
+from dedupe import HashStore, dhash, hamming_distances, plan_dedupe
+
+
+def _image(path, box, size=(200, 160), color="black", background="white"):
+    image = Image.new("RGB", size, background)
+    ImageDraw.Draw(image).ellipse(box, fill=color)
+    image.save(path)
+    return str(path)
+
+
+def test_dhash_matches_resized_copy_and_skips_flat_images(tmp_path):
+    original = _image(tmp_path / "a.png", (30, 20, 150, 120))
+    resized = tmp_path / "a_small.jpg"
+    Image.open(original).resize((100, 80)).save(resized, quality=90)
+    different = _image(tmp_path / "b.png", (120, 60, 190, 150))
+
+    assert hamming_distances(np.array([dhash(original)], dtype=np.uint64), dhash(str(resized)))[0] <= 4
+    assert hamming_distances(np.array([dhash(original)], dtype=np.uint64), dhash(different))[0] > 4
+    # 真っ白・真っ黒の画像は互いに一致しないよう、ハッシュを求めない
+    Image.new("RGB", (50, 50), "white").save(tmp_path / "white.png")
+    Image.new("RGB", (50, 50), "black").save(tmp_path / "black.png")
+    assert dhash(str(tmp_path / "white.png")) is None
+    assert dhash(str(tmp_path / "black.png")) is None
+
+
+def test_find_respects_threshold():
+    store = HashStore(threshold=2)
+    store.add(0b1111_0000, "first")
+    store.add(0xFFFF_FFFF_0000_0000, "second")
+
+    assert store.find(0b1111_0000) == "first"
+    # 2ビット違いまでは一致、3ビット違いは別の画像
+    assert store.find(0b1111_0011) == "first"
+    assert store.find(0b1111_0111) is None
+    # 最も近い結果を返す
+    assert store.find(0xFFFF_FFFF_0000_0001) == "second"
+
+
+def test_persisted_store_lookups(tmp_path):
+    path = str(tmp_path / "hashes.sqlite")
+    store = HashStore(path, threshold=4)
+    for number in range(1500):
+        # 配列の拡張（1024件）をまたいで登録する
+        store.add(number << 20, f"result{number}")
+    store.close()
+
+    reopened = HashStore(path, threshold=4)
+    assert len(reopened) == 1500
+    assert reopened.find(1499 << 20) == "result1499"
+    assert reopened.find((7 << 20) | 0b101) == "result7"
+    assert reopened.find(0xFFFF_FFFF_FFFF_FFFF) is None
+    reopened.close()
+
+
+def test_plan_dedupe_uses_batch_and_stored_results(tmp_path):
+    first = _image(tmp_path / "first.png", (30, 20, 150, 120))
+    copy = _image(tmp_path / "copy.png", (30, 20, 150, 120))
+    other = _image(tmp_path / "other.png", (120, 60, 190, 150))
+    flat = str(tmp_path / "flat.png")
+    Image.new("RGB", (50, 50), "white").save(flat)
+    previous = _image(tmp_path / "previous.png", (10, 10, 60, 150))
+
+    old_result = str(tmp_path / "out" / "old")
+    (tmp_path / "out").mkdir()
+    Image.new("RGB", (10, 10)).save(old_result + ".png")
+    store = HashStore(threshold=4)
+    store.add(dhash(previous), old_result)
+
+    def result_fn(path):
+        return str(tmp_path / "out" / path.rsplit("/", 1)[-1][:-4])
+
+    unique, duplicates, hashes = plan_dedupe([first, copy, other, flat, previous], store, result_fn)
+
+    assert unique == [first, other, flat]
+    assert duplicates == {copy: result_fn(first), previous: old_result}
+    assert flat not in hashes
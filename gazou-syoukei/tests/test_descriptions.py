@@ -0,0 +1,129 @@
+"""説明生成サービスの予算・ヘッジ・まとめ生成のテスト"""
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from descriptions import DescriptionService
+
+FEATURES = {"points_count": 12, "is_closed": True, "area": 5000.0, "perimeter": 300.0, "is_convex": False}
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class SlowStream:
+    def __init__(self, text, delay, error=None):
+        self.text = text
+        self.delay = delay
+        self.error = error
+
+    def __iter__(self):
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        yield _chunk(self.text)
+
+    def close(self):
+        pass
+
+
+class SlowClient:
+    """delay 秒後に応答する（error を指定するとその例外で失敗する）チャットAPIの代わり"""
+
+    def __init__(self, text, delay, error=None):
+        self.text = text
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        self.calls += 1
+        return SlowStream(self.text, self.delay, self.error)
+
+
+def _service(**kwargs):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=60)
+    return DescriptionService(latency_budget_ms=100, breaker=breaker, **kwargs)
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_hedged_request_that_succeeds_is_not_a_failure():
+    service = _service()
+    client = SlowClient("この象形文字は遅れて届きました。", delay=0.3)
+
+    start = time.monotonic()
+    description, source = service.describe_character(client, FEATURES, "slow")
+    assert source == "local"
+    assert time.monotonic() - start < 0.3
+
+    assert _wait_until(lambda: service.metrics()["backfilled"] == 1)
+    assert service.breaker.metrics()["consecutive_failures"] == 0
+    assert service.breaker.state == "closed"
+    assert service.describe_character(client, FEATURES, "slow") == ("この象形文字は遅れて届きました。", "cache")
+
+
+def test_hedged_request_that_fails_is_a_failure():
+    service = _service()
+    client = SlowClient("", delay=0.3, error=ConnectionError("read timeout"))
+
+    assert service.describe_character(client, FEATURES, "broken")[1] == "local"
+    assert _wait_until(lambda: service.breaker.state == "open")
+
+
+def test_batch_request_respects_budget_and_backfills():
+    service = _service()
+    answer = json.dumps([{"id": 1, "description": "この象形文字は一つ目です。"},
+                         {"id": 2, "description": "この象形文字は二つ目です。"}], ensure_ascii=False)
+    client = SlowClient(answer, delay=0.3)
+    items = [(FEATURES, "first"), (None, "second")]
+
+    start = time.monotonic()
+    results = service.describe_many(client, items, batch_size=2)
+    assert time.monotonic() - start < 0.3
+    assert [source for _, source in results] == ["local", "local"]
+
+    assert _wait_until(lambda: service.metrics()["backfilled"] == 2)
+    assert service.breaker.metrics()["consecutive_failures"] == 0
+    assert service.describe_many(client, items, batch_size=2) == [
+        ("この象形文字は一つ目です。", "cache"), ("この象形文字は二つ目です。", "cache")]
+    assert client.calls == 1
+
+
+def test_hedged_requests_that_have_not_started_are_cancelled():
+    service = DescriptionService(latency_budget_ms=50, max_workers=2,
+                                 breaker=CircuitBreaker(failure_threshold=5, cooldown_seconds=60))
+    # 20件を予算内に返し終えるまで、最初の2件がワーカーを塞いだままになる
+    client = SlowClient("", delay=1.5, error=ConnectionError("read timeout"))
+
+    start = time.monotonic()
+    for number in range(20):
+        assert service.describe_character(client, FEATURES, f"outage{number}")[1] == "local"
+    assert time.monotonic() - start < 1.5
+    service.shutdown()
+
+    # 待ち行列に残った呼び出しは取り消され、APIに届くのはワーカーで始まっていた分だけ
+    assert _wait_until(lambda: service.breaker.metrics()["consecutive_failures"] == 2, timeout=3.0)
+    assert client.calls == 2
+
+
+def test_queued_call_is_skipped_when_breaker_opened():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=60)
+    service = DescriptionService(latency_budget_ms=100, breaker=breaker)
+    client = SlowClient("この象形文字は届きません。", delay=0.0)
+    breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError):
+        service._call_api(client, "prompt")
+    assert client.calls == 0
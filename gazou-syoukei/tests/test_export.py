@@ -0,0 +1,62 @@
+"""列指向エクスポートのテスト"""
+import os
+
+import numpy as np
+
+from export import ColumnarWriter, make_row, read_column, read_vertices
+
+FEATURES = {"points_count": 4, "is_closed": True, "area": 100.0, "perimeter": 40.0, "is_convex": True}
+
+
+def _row(number):
+    if number % 3 == 2:
+        # 輪郭の無い画像（頂点が0個の行）
+        return make_row(f"/images/画像{number}.png", description=None, contour_count=0)
+    contour = np.arange(2 * (number + 1), dtype=np.int32).reshape(-1, 1, 2) + number
+    features = dict(FEATURES, points_count=number + 1, area=float(number))
+    return make_row(f"/images/画像{number}.png", features, contour, f"説明{number}", "local",
+                    {"threshold1": 50, "threshold2": 150, "simplification": 0.01},
+                    {"edges": float(number)}, contour_count=number)
+
+
+def test_read_column_across_row_groups(tmp_path):
+    path = str(tmp_path / "glyphs.npz")
+    rows = [_row(number) for number in range(7)]
+    with ColumnarWriter(path, row_group_size=3) as writer:
+        for row in rows[:5]:
+            writer.add(row)
+    # 追記では行グループ番号を引き継ぐ
+    with ColumnarWriter(path, row_group_size=3) as writer:
+        for row in rows[5:]:
+            writer.add(row)
+
+    assert read_column(path, "name") == [f"画像{number}" for number in range(7)]
+    assert read_column(path, "description") == [row["description"] or "" for row in rows]
+    np.testing.assert_array_equal(read_column(path, "points_count"), [row["points_count"] for row in rows])
+    np.testing.assert_array_equal(read_column(path, "has_contour"), [number % 3 != 2 for number in range(7)])
+    edges = read_column(path, "edges_ms")
+    assert np.isnan(edges[2]) and edges[4] == 4.0
+
+    vertices, starts = read_column(path, "vertices")
+    assert len(starts) == 8
+    for number, row in enumerate(rows):
+        expected = row["vertices"] if row["vertices"] is not None else np.zeros((0, 2))
+        np.testing.assert_array_equal(vertices[starts[number]:starts[number + 1]], expected)
+        np.testing.assert_array_equal(read_vertices(path, number), expected)
+
+
+def test_empty_batches(tmp_path):
+    path = str(tmp_path / "glyphs.npz")
+    # 1行も無ければファイルを作らない
+    with ColumnarWriter(path) as writer:
+        writer.flush()
+    assert not os.path.exists(path)
+
+    # 全ての行に輪郭が無い行グループ
+    with ColumnarWriter(path, row_group_size=2) as writer:
+        writer.add(make_row("a.png"))
+        writer.add(make_row("b.png"))
+    vertices, starts = read_column(path, "vertices")
+    assert vertices.shape == (0, 2)
+    np.testing.assert_array_equal(starts, [0, 0, 0])
+    assert read_column(path, "description") == ["", ""]
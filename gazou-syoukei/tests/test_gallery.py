@@ -0,0 +1,35 @@
+"""ギャラリーの表示範囲の計算のテスト"""
+import pytest
+
+from gallery import visible_cells
+
+CELL = 100
+
+
+@pytest.mark.parametrize("top, height, expected", [
+    # 3行ちょうど見えているときは、その3行と下の1行
+    (0, 300, (0, 16)),
+    # 行の途中から見えているときは、掛かっている行を全て含む
+    (50, 300, (0, 20)),
+    (250, 100, (8, 20)),
+    # 下端が境目ちょうどなら、次の行は見えていない
+    (200, 100, (8, 16)),
+    # ウィンドウの高さが0（表示前）でも下の1行は作る
+    (0, 0, (0, 4)),
+])
+def test_visible_rows_with_overscan(top, height, expected):
+    assert visible_cells(top, height, CELL, columns=4, count=1000) == expected
+
+
+def test_range_is_clamped_to_image_count():
+    # 最後の行は途中までしか埋まっていない
+    assert visible_cells(0, 10_000, CELL, columns=4, count=10) == (0, 10)
+    assert visible_cells(150, 300, CELL, columns=3, count=10) == (3, 10)
+    # 内容より下までスクロールしても範囲が逆転しない
+    assert visible_cells(5_000, 300, CELL, columns=4, count=10) == (10, 10)
+    assert visible_cells(0, 300, CELL, columns=4, count=0) == (0, 0)
+
+
+def test_overscan_and_single_column():
+    assert visible_cells(0, 300, CELL, columns=1, count=100, overscan=0) == (0, 3)
+    assert visible_cells(120, 300, CELL, columns=1, count=100, overscan=2) == (1, 7)
@@ -0,0 +1,67 @@
+"""輪郭のベクターストアのテスト"""
+import numpy as np
+import pytest
+
+from glyph_store import GlyphStore, index_path, names_path
+
+SQUARE = np.array([[[10, 10]], [[200, 10]], [[200, 180]], [[10, 180]]], dtype=np.int32)
+TRIANGLE = np.array([[[0, 0]], [[32767, 5]], [[100, 20000]]], dtype=np.int32)
+
+
+def test_add_and_get_round_trip(tmp_path):
+    path = str(tmp_path / "glyphs.bin")
+    with GlyphStore(path) as store:
+        assert store.add(SQUARE, (240, 320), "square") == 0
+        assert store.add(TRIANGLE, (20001, 32768), "triangle") == 1
+
+    with GlyphStore(path, readonly=True) as store:
+        assert len(store) == 2
+        contour, shape = store.get(0)
+        np.testing.assert_array_equal(contour, SQUARE)
+        assert contour.dtype == np.int32 and shape == (240, 320)
+        contour, shape = store.get(1)
+        np.testing.assert_array_equal(contour, TRIANGLE)
+        assert shape == (20001, 32768)
+        assert store.names() == ["square", "triangle"]
+
+
+def test_rejects_coordinates_beyond_int16(tmp_path):
+    path = str(tmp_path / "glyphs.bin")
+    with GlyphStore(path) as store:
+        store.add(SQUARE, (240, 320), "square")
+        with pytest.raises(ValueError):
+            store.add(np.array([[[0, 0]], [[40000, 0]]]), (100, 40001), "wide")
+        with pytest.raises(ValueError):
+            store.add(np.array([[[32767, 0]], [[-32767, 0]]]), (100, 40001), "jump")
+        # 失敗した輪郭は何も書き込まない
+        assert len(store) == 1
+        assert store.add(TRIANGLE, (20001, 32768), "triangle") == 1
+        np.testing.assert_array_equal(store.get(1)[0], TRIANGLE)
+
+
+def test_recovers_from_truncated_tail(tmp_path):
+    path = str(tmp_path / "glyphs.bin")
+    with GlyphStore(path) as store:
+        store.add(SQUARE, (240, 320), "square")
+        store.add(TRIANGLE, (20001, 32768), "triangle")
+
+    # 3件目のデータだけ書き込み、インデックスは途中で落ちた状態を作る
+    with open(path, "ab") as f:
+        f.write(b"\x01\x02\x03\x04\x05\x06")
+    with open(index_path(path), "ab") as f:
+        f.write(b"\x00" * 7)
+    with open(names_path(path), "a", encoding="utf-8") as f:
+        f.write("broken\n")
+
+    with GlyphStore(path) as store:
+        assert len(store) == 2
+        assert store.names() == ["square", "triangle"]
+        assert store.add(SQUARE * 2, (480, 640), "large") == 2
+        np.testing.assert_array_equal(store.get(2)[0], SQUARE * 2)
+
+    with GlyphStore(path, readonly=True) as store:
+        assert len(store) == 3
+        np.testing.assert_array_equal(store.get(0)[0], SQUARE)
+        np.testing.assert_array_equal(store.get(1)[0], TRIANGLE)
+        assert store.get(2)[1] == (480, 640)
+        assert store.names() == ["square", "triangle", "large"]
@@ -0,0 +1,42 @@
+"""変換パイプラインのプロセス実行のテスト"""
+import numpy as np
+
+from pipeline import PROCESS, CannyEdgeDetector, Pipeline
+
+
+class SharedCheck:
+    """受け取った画像が共有メモリのビューか（pickleで複製されていないか）を記録する"""
+
+    def __call__(self, context):
+        context["gray_was_shared"] = not context["gray"].flags.owndata
+        return context
+
+
+def _context():
+    rng = np.random.default_rng(0)
+    gray = np.zeros((400, 400), dtype=np.uint8)
+    gray[100:300, 120:280] = 255
+    gray[rng.integers(0, 400, 500), rng.integers(0, 400, 500)] = 128
+    image = np.dstack([gray, gray, gray])
+    return {"path": "test.png", "name": "test", "image": image, "gray": gray, "shape": gray.shape}
+
+
+def test_process_stage_matches_inline_and_passes_frames_through_shared_memory():
+    stages = [("check", SharedCheck()), ("edges", CannyEdgeDetector(50, 150))]
+    inline = Pipeline(stages).run(context=_context())
+
+    pipeline = Pipeline(stages, {"check": (PROCESS, 1), "edges": (PROCESS, 1)})
+    try:
+        context = _context()
+        gray = context["gray"]
+        result = pipeline.run(context=context)
+        stats = dict(pipeline._frames.stats)
+    finally:
+        pipeline.close()
+
+    assert result["gray_was_shared"]
+    np.testing.assert_array_equal(result["edges"], inline["edges"])
+    # 変わらなかった画像は送り返さず、手元の配列をそのまま使う
+    assert result["gray"] is gray
+    # 2段目は1段目で返却したブロックを再利用する
+    assert stats["reused"] > 0
@@ -0,0 +1,56 @@
+"""形状記述子のインデックス（k近傍検索）のテスト"""
+import numpy as np
+
+from shape_index import ShapeIndex, compute_descriptor
+
+
+def _polygon(sides, radius=100.0, center=(200.0, 200.0), rotation=0.0):
+    angles = rotation + 2 * np.pi * np.arange(sides) / sides
+    points = np.stack([center[0] + radius * np.cos(angles), center[1] + radius * np.sin(angles)], axis=1)
+    return np.round(points).astype(np.int32).reshape(-1, 1, 2)
+
+
+def test_search_orders_by_distance_and_matches_brute_force():
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(3000, 8)).astype(np.float32)
+    index = ShapeIndex(dimensions=8, capacity=16)
+    # 容量の拡張をまたいで追加する
+    index.add_many([f"g{i}" for i in range(2000)], vectors[:2000])
+    for i in range(2000, 3000):
+        index.add(f"g{i}", vectors[i])
+    query = rng.normal(size=8).astype(np.float32)
+
+    results = index.search(query, k=10)
+
+    expected = np.argsort(np.linalg.norm(vectors - query, axis=1))[:10]
+    assert [glyph_id for glyph_id, _ in results] == [f"g{i}" for i in expected]
+    distances = [distance for _, distance in results]
+    assert distances == sorted(distances)
+    np.testing.assert_allclose(distances, np.linalg.norm(vectors[expected] - query, axis=1), rtol=1e-4)
+
+
+def test_search_edge_cases(tmp_path):
+    index = ShapeIndex(dimensions=2)
+    assert index.search([0.0, 0.0]) == []
+    index.add_many(["a", "b", "c"], [[0, 0], [3, 4], [1, 0]])
+    # k が件数より多ければ全件を返す
+    assert index.search([0.0, 0.0], k=10) == [("a", 0.0), ("c", 1.0), ("b", 5.0)]
+
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+    loaded = ShapeIndex.load(path)
+    assert loaded.search([3.0, 3.9], k=2)[0][0] == "b"
+    assert loaded.ids == ["a", "b", "c"]
+
+
+def test_similar_shapes_rank_first():
+    index = ShapeIndex()
+    index.add("triangle", compute_descriptor(_polygon(3)))
+    index.add("square", compute_descriptor(_polygon(4)))
+    index.add("hexagon", compute_descriptor(_polygon(6)))
+
+    # 位置・大きさ・回転が違っても同じ形が最も近い
+    query = compute_descriptor(_polygon(4, radius=40.0, center=(90.0, 300.0), rotation=0.3))
+    assert index.search(query, k=1)[0][0] == "square"
+    query = compute_descriptor(_polygon(3, radius=150.0, rotation=1.0))
+    assert index.search(query, k=1)[0][0] == "triangle"
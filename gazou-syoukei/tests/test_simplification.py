@@ -0,0 +1,50 @@
+"""SimplificationPyramid が cv2.approxPolyDP と同じ輪郭を返すことのテスト"""
+import cv2
+import numpy as np
+import pytest
+
+from simplification import SimplificationPyramid
+
+RATIOS = (0.0, 0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.3, 1.0)
+
+
+def _contours(seed, count=20):
+    """ぼかした多角形・楕円のエッジから輪郭を作る"""
+    rng = np.random.default_rng(seed)
+    contours = []
+    for _ in range(count):
+        img = np.zeros((300, 300), np.uint8)
+        for _ in range(rng.integers(1, 5)):
+            if rng.random() < 0.5:
+                cv2.fillPoly(img, [rng.integers(0, 300, size=(rng.integers(3, 10), 2)).astype(np.int32)], 255)
+            else:
+                center = tuple(int(v) for v in rng.integers(40, 260, 2))
+                axes = tuple(int(v) for v in rng.integers(5, 120, 2))
+                cv2.ellipse(img, center, axes, float(rng.integers(0, 180)), 0, 360, 255, -1)
+        img = cv2.GaussianBlur(img, (0, 0), rng.uniform(0.5, 3))
+        found, _ = cv2.findContours(cv2.Canny(img, 50, 150), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        contours.extend(found[:3])
+    return contours
+
+
+@pytest.mark.parametrize("closed", [True, False])
+def test_matches_approx_poly_dp(closed):
+    mismatches = []
+    for contour in _contours(0):
+        pyramid = SimplificationPyramid(contour, closed)
+        for ratio in RATIOS:
+            epsilon = ratio * cv2.arcLength(contour, closed)
+            expected = cv2.approxPolyDP(contour, epsilon, closed)
+            actual = pyramid.simplify(epsilon)
+            if expected.shape != actual.shape or not (expected == actual).all():
+                mismatches.append((len(contour), ratio, len(expected), len(actual)))
+    assert mismatches == []
+
+
+def test_simplify_ratio_matches_simplifier_epsilon():
+    # Simplifier（use_pyramid=False）と同じく epsilon = ratio * cv2.arcLength
+    for contour in _contours(1, count=5):
+        pyramid = SimplificationPyramid(contour)
+        for ratio in RATIOS:
+            expected = cv2.approxPolyDP(contour, ratio * cv2.arcLength(contour, True), True)
+            assert np.array_equal(pyramid.simplify_ratio(ratio), expected)
@@ -0,0 +1,40 @@
+"""main.py の読み込み時間のテスト
+
+ウィンドウを200ms以内に表示するため、main.py の読み込みでは cv2・numpy・openai を
+読み込まないこと、読み込みが予算内に終わることを別プロセスで確認する。
+"""
+import os
+import sys
+import json
+import subprocess
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# main.py の読み込みにかけてよい時間（ミリ秒）。ウィンドウ表示の200msの内数
+IMPORT_BUDGET_MS = 150
+
+HEAVY_MODULES = ("cv2", "numpy", "openai")
+
+MEASURE = """
+import sys, time, json
+start = time.perf_counter()
+import main
+elapsed_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({"elapsed_ms": elapsed_ms, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def _measure():
+    result = subprocess.run([sys.executable, "-c", MEASURE], cwd=APP_DIR, capture_output=True, text=True,
+                            check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_main_does_not_import_heavy_modules():
+    assert _measure()["loaded"] == []
+
+
+def test_main_import_within_budget():
+    # 初回はディスクキャッシュの影響を受けるため、最速の値で判定する
+    elapsed_ms = min(_measure()["elapsed_ms"] for _ in range(3))
+    assert elapsed_ms < IMPORT_BUDGET_MS, f"main の読み込みに{elapsed_ms:.0f}msかかりました"
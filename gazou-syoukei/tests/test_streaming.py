@@ -0,0 +1,89 @@
+"""ストリーミングでの説明の受信のテスト（スタブサーバーを使う）"""
+import time
+import threading
+
+import pytest
+
+from circuit_breaker import CircuitBreaker
+from conversion_jobs import CancelToken, ConversionCancelled
+from descriptions import DescriptionService
+from stub_openai_server import StubOpenAIServer
+
+FEATURES = {"points_count": 12, "is_closed": True, "area": 5000.0, "perimeter": 300.0, "is_convex": False}
+TOKENS = ["この象形文字は", "山を", "表しています。", "古代の人々は", "この形を祈りに用いました。"]
+
+
+def _service(budget_ms, grace_ms=2000):
+    return DescriptionService(latency_budget_ms=budget_ms, stream_grace_ms=grace_ms,
+                              breaker=CircuitBreaker(failure_threshold=5, cooldown_seconds=60))
+
+
+class Recorder:
+    def __init__(self):
+        self.deltas = []
+        self.times = []
+        self._lock = threading.Lock()
+
+    def __call__(self, text):
+        with self._lock:
+            self.deltas.append(text)
+            self.times.append(time.monotonic())
+
+
+def test_tokens_are_delivered_as_they_arrive():
+    recorder = Recorder()
+    with StubOpenAIServer(TOKENS, token_delay=0.1) as server:
+        client = server.client()
+        start = time.monotonic()
+        description, source = _service(3000).describe_character(client, FEATURES, "mountain", on_delta=recorder)
+        elapsed = time.monotonic() - start
+
+    assert (description, source) == ("".join(TOKENS), "api")
+    assert recorder.deltas == TOKENS
+    assert server.requests[0]["stream"] is True
+    # 最初のトークンは応答全体より十分前に届く
+    assert recorder.times[0] - start < elapsed - 0.3
+
+
+def test_stalled_stream_falls_back_after_grace_period():
+    recorder = Recorder()
+    with StubOpenAIServer(TOKENS, stall_after=1) as server:
+        client = server.client()
+        service = _service(200, grace_ms=300)
+        start = time.monotonic()
+        description, source = service.describe_character(client, FEATURES, "stalled", on_delta=recorder)
+        elapsed = time.monotonic() - start
+
+    assert source == "local"
+    assert description != TOKENS[0]
+    assert recorder.deltas == TOKENS[:1]
+    # 予算 + 猶予 で打ち切る（待ち続けない）
+    assert 0.45 <= elapsed < 0.8
+    assert service.metrics()["hedged"] == 1
+
+
+def test_stream_without_first_token_in_budget_falls_back_at_budget():
+    recorder = Recorder()
+    with StubOpenAIServer(TOKENS, first_token_delay=1.0) as server:
+        client = server.client()
+        start = time.monotonic()
+        _, source = _service(200).describe_character(client, FEATURES, "late", on_delta=recorder)
+        elapsed = time.monotonic() - start
+
+    assert source == "local"
+    assert elapsed < 0.5
+    assert recorder.deltas == []
+
+
+def test_cancel_aborts_stream():
+    recorder = Recorder()
+    with StubOpenAIServer(TOKENS, stall_after=2) as server:
+        client = server.client()
+        token = CancelToken(1)
+        threading.Timer(0.3, token.cancel).start()
+        start = time.monotonic()
+        with pytest.raises(ConversionCancelled):
+            _service(3000).describe_character(client, FEATURES, "cancelled", token, on_delta=recorder)
+        assert time.monotonic() - start < 1.0
+
+    assert recorder.deltas == TOKENS[:2]
@@ -0,0 +1,83 @@
+"""説明欄へのストリーミング表示（まとめ更新）のテスト"""
+import threading
+
+from streaming_text import StreamingText
+
+
+class FakeRoot:
+    """after() の予約を溜めておき、テストから実行する"""
+
+    def __init__(self):
+        self.pending = []
+
+    def after(self, interval_ms, callback):
+        self.pending.append((interval_ms, callback))
+
+    def run_pending(self):
+        pending, self.pending = self.pending, []
+        for _, callback in pending:
+            callback()
+
+
+class FakeText:
+    def __init__(self):
+        self.content = ""
+        self.inserts = []
+
+    def config(self, **options):
+        pass
+
+    def delete(self, start, end):
+        self.content = ""
+
+    def insert(self, index, text):
+        self.inserts.append(text)
+        self.content += text
+
+    def see(self, index):
+        pass
+
+
+def test_fragments_are_coalesced_into_one_update():
+    root, widget = FakeRoot(), FakeText()
+    stream = StreamingText(root, widget, interval_ms=30)
+    stream.start()
+
+    for fragment in ["象", "形", "文字", "です"]:
+        stream.push(fragment)
+    # 断片がいくつ届いても予約は1つだけ
+    assert [interval for interval, _ in root.pending] == [30]
+    root.run_pending()
+    assert widget.inserts == ["", "象形文字です"]
+
+    # 更新の後に届いた断片は次の予約で表示する
+    threads = [threading.Thread(target=stream.push, args=(str(number),)) for number in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(root.pending) == 1
+    root.run_pending()
+    assert sorted(widget.inserts[-1]) == sorted("".join(str(number) for number in range(20)))
+    assert root.pending == []
+
+
+def test_close_and_inactive_streams_do_not_append():
+    root, widget = FakeRoot(), FakeText()
+    active = [True]
+    stream = StreamingText(root, widget, is_active=lambda: active[0])
+    stream.start()
+
+    stream.push("古い")
+    active[0] = False
+    root.run_pending()
+    # 新しい変換に置き換えられたら表示しない
+    assert widget.content == ""
+
+    active[0] = True
+    stream.push("途中")
+    stream.finish("最終的な説明")
+    root.run_pending()
+    stream.push("遅れて届いた断片")
+    assert widget.content == "最終的な説明"
+    assert root.pending == []
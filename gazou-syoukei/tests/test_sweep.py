@@ -0,0 +1,66 @@
+"""変換パラメータの探索（スイープ）のテスト"""
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw
+
+from pipeline import CannyEdgeDetector, ContourSelector, ImageLoader, Simplifier, RETR_EXTERNAL
+from sweep import LABEL_HEIGHT, THUMBNAIL_SIZE, _parse_values, summarize, sweep_image
+
+THRESHOLDS1 = (30, 80)
+THRESHOLDS2 = (100, 150, 200)
+SIMPLIFICATIONS = (5, 20, 60)
+
+
+def _image(path):
+    image = Image.new("RGB", (240, 200), "white")
+    draw = ImageDraw.Draw(image)
+    draw.polygon([(30, 40), (200, 25), (215, 170), (120, 110), (40, 180)], fill="black")
+    draw.ellipse((90, 60, 130, 100), fill="gray")
+    image.save(path)
+    return str(path)
+
+
+def _points(path, threshold1, threshold2, level):
+    """スイープを通さずに1つの組を変換したときの頂点数"""
+    context = ImageLoader()({"path": path, "name": "glyph"})
+    context = CannyEdgeDetector(threshold1, threshold2)(context)
+    context = ContourSelector(RETR_EXTERNAL)(context)
+    context = Simplifier(level / 1000)(context)
+    return len(context["approx_contour"]) if context["approx_contour"] is not None else 0
+
+
+def test_grid_enumerates_every_combination_in_order(tmp_path):
+    path = _image(tmp_path / "glyph.png")
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        table, sheet = sweep_image(path, THRESHOLDS1, THRESHOLDS2, SIMPLIFICATIONS, executor)
+
+    expected = list(itertools.product(THRESHOLDS1, THRESHOLDS2, SIMPLIFICATIONS))
+    assert [(row["threshold1"], row["threshold2"], row["simplification"]) for row in table] == expected
+    assert all(row["image"] == "glyph" for row in table)
+    # しきい値の組ごとに1行、単純化レベルごとに1列
+    assert sheet.size == (len(SIMPLIFICATIONS) * THUMBNAIL_SIZE,
+                          len(THRESHOLDS1) * len(THRESHOLDS2) * (THUMBNAIL_SIZE + LABEL_HEIGHT))
+    # 中間結果を使い回しても、1つずつ変換した結果と変わらない
+    for row in table:
+        assert row["points"] == _points(path, row["threshold1"], row["threshold2"], row["simplification"])
+    for _, rows in itertools.groupby(table, key=lambda row: (row["threshold1"], row["threshold2"])):
+        points = [row["points"] for row in rows]
+        assert points == sorted(points, reverse=True)
+
+
+def test_unreadable_image_and_summary(tmp_path):
+    broken = tmp_path / "broken.png"
+    broken.write_bytes(b"not an image")
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert sweep_image(str(broken), THRESHOLDS1, THRESHOLDS2, SIMPLIFICATIONS, executor) == (None, None)
+
+    assert _parse_values("30, 50,,80") == (30, 50, 80)
+    table = [
+        {"threshold1": 30, "threshold2": 100, "simplification": 5, "points": 8, "edges_ms": 2.0, "render_ms": 1.0},
+        {"threshold1": 30, "threshold2": 100, "simplification": 5, "points": 0, "edges_ms": 4.0, "render_ms": 3.0},
+        {"threshold1": 10, "threshold2": 100, "simplification": 5, "points": 5, "edges_ms": 1.0, "render_ms": 1.0},
+    ]
+    summary = summarize(table)
+    assert [(row["threshold1"], row["images"], row["no_contour"]) for row in summary] == [(10, 1, 0), (30, 2, 1)]
+    assert summary[1]["mean_points"] == 4.0 and summary[1]["mean_edges_ms"] == 3.0
@@ -0,0 +1,93 @@
+"""SVG・PDFでの保存のテスト"""
+import re
+import zlib
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from pipeline import STYLE_FILLED, STYLE_OUTLINE, STYLE_TEXTURED, normalize_contour, render_contour
+from vector_export import PdfWriter, glyph_of, to_svg
+
+CONTOUR = np.array([[[30, 40]], [[220, 35]], [[260, 190]], [[120, 260]], [[25, 180]]], dtype=np.int32)
+
+
+def _glyph(style=STYLE_OUTLINE, canvas_size=(500, 500)):
+    return glyph_of(render_contour(CONTOUR, (300, 300), canvas_size, 5, style))
+
+
+def _svg_points(d):
+    return [(int(x), int(y)) for x, y in re.findall(r"[ML] (-?\d+) (-?\d+)", d)]
+
+
+def test_svg_path_round_trip():
+    glyph = _glyph(STYLE_TEXTURED)
+    root = ET.fromstring(to_svg(glyph))
+    paths = root.findall("{http://www.w3.org/2000/svg}path")
+
+    assert root.get("viewBox") == "0 0 500 500"
+    outline = paths[0]
+    assert outline.get("d").endswith("Z")
+    assert _svg_points(outline.get("d")) == normalize_contour(CONTOUR, (300, 300), (500, 500))
+    assert outline.get("stroke-width") == "5"
+    # テクスチャの線も同じ座標で書き出す
+    texture = _svg_points(paths[1].get("d"))
+    assert texture == [point for x1, y1, x2, y2 in glyph["texture"] for point in ((x1, y1), (x2, y2))]
+
+
+def _parse_pdf(data):
+    """相互参照表が指す位置とオブジェクトを確かめながら {番号: 本体} を返す"""
+    startxref = int(re.search(rb"startxref\n(\d+)\n%%EOF\n$", data).group(1))
+    assert data[startxref:startxref + 5] == b"xref\n"
+    header = re.match(rb"xref\n0 (\d+)\n", data[startxref:])
+    size = int(header.group(1))
+    entries = data[startxref + header.end():].split(b"trailer")[0].splitlines()
+    assert len(entries) == size
+    assert entries[0] == b"0000000000 65535 f "
+
+    trailer = data[data.rindex(b"trailer"):]
+    assert int(re.search(rb"/Size (\d+)", trailer).group(1)) == size
+    objects = {}
+    for number, entry in enumerate(entries[1:], start=1):
+        offset, _, kind = entry.split()
+        assert kind == b"n"
+        offset = int(offset)
+        prefix = f"{number} 0 obj\n".encode("ascii")
+        assert data[offset:offset + len(prefix)] == prefix
+        end = data.index(b"\nendobj\n", offset)
+        objects[number] = data[offset + len(prefix):end]
+    # 相互参照表に無いオブジェクトは無い
+    assert len(re.findall(rb"^\d+ 0 obj$", data, re.M)) == size - 1
+    return objects
+
+
+def test_pdf_xref_offsets_and_object_count(tmp_path):
+    path = str(tmp_path / "glyphs.pdf")
+    glyphs = [_glyph(STYLE_OUTLINE), _glyph(STYLE_FILLED, (250, 250)), _glyph(STYLE_TEXTURED)]
+    with PdfWriter(path) as writer:
+        for glyph in glyphs:
+            writer.add_page(glyph)
+        assert writer.page_count == 3
+    with open(path, "rb") as f:
+        data = f.read()
+    assert data.startswith(b"%PDF-1.4\n")
+
+    objects = _parse_pdf(data)
+    # カタログ・ページの一覧と、ページごとに本体とページの2つ
+    assert len(objects) == 2 + 2 * len(glyphs)
+    assert objects[1] == b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = [int(number) for number in re.findall(rb"(\d+) 0 R", objects[2])]
+    assert b"/Count 3" in objects[2] and len(kids) == 3
+
+    for kid, glyph in zip(kids, glyphs):
+        page = objects[kid]
+        width, height = glyph["canvas_size"]
+        assert f"/MediaBox [0 0 {width} {height}]".encode("ascii") in page
+        content = objects[int(re.search(rb"/Contents (\d+) 0 R", page).group(1))]
+        length = int(re.search(rb"/Length (\d+)", content).group(1))
+        stream = content[content.index(b"stream\n") + 7:]
+        assert len(stream) == length + len(b"\nendstream")
+        commands = zlib.decompress(stream[:length]).decode("ascii")
+        points = normalize_contour(CONTOUR, (300, 300), glyph["canvas_size"])
+        assert commands.startswith(f"1 0 0 -1 0 {height} cm")
+        assert f"{points[0][0]} {points[0][1]} m" in commands
+        assert all(f"{x} {y} l" in commands for x, y in points[1:])
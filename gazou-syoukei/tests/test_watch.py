@@ -0,0 +1,69 @@
+"""フォルダ監視デーモンのテスト（走査での監視）"""
+import os
+import time
+import threading
+
+import watch
+from watch import WatchDaemon
+
+
+class FakeImage:
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(b"png")
+
+
+def _slow_convert(calls, seconds):
+    def convert_image(path, client):
+        calls.append(path)
+        time.sleep(seconds)
+        return {"image": FakeImage(), "description": "説明"}
+
+    return convert_image
+
+
+def _run(daemon, seconds):
+    thread = threading.Thread(target=daemon.run)
+    thread.start()
+    time.sleep(seconds)
+    daemon.stop()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+def test_polling_converts_slow_file_once(tmp_path, monkeypatch):
+    calls = []
+    # 変換の間に何度も走査されるよう、変換を走査の間隔より十分遅くする
+    monkeypatch.setattr(watch, "convert_image", _slow_convert(calls, 0.5))
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    (input_dir / "a.png").write_bytes(b"image")
+
+    daemon = WatchDaemon(str(input_dir), str(tmp_path / "out"), use_api=False,
+                         debounce=0.05, poll_interval=0.05, use_inotify=False)
+    _run(daemon, 1.5)
+
+    assert calls == [str(input_dir / "a.png")]
+    assert daemon.stats["converted"] == 1
+
+
+def test_polling_reconverts_file_updated_during_conversion(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(watch, "convert_image", _slow_convert(calls, 0.4))
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    image = input_dir / "a.png"
+    image.write_bytes(b"image")
+
+    daemon = WatchDaemon(str(input_dir), str(tmp_path / "out"), use_api=False,
+                         debounce=0.05, poll_interval=0.05, use_inotify=False)
+    thread = threading.Thread(target=daemon.run)
+    thread.start()
+    time.sleep(0.2)
+    image.write_bytes(b"updated image")
+    os.utime(image, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    time.sleep(1.5)
+    daemon.stop()
+    thread.join(timeout=5)
+
+    assert calls == [str(image), str(image)]
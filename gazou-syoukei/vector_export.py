@@ -0,0 +1,162 @@
+"""象形文字のベクター形式（SVG・PDF）での保存
+
+500x500のキャンバスに描いたPNGの代わりに、単純化した輪郭から直接SVGのパスや
+PDFのページを作る。線の太さ・スタイル（輪郭のみ / 塗りつぶし / テクスチャ付き）は
+PNGと同じで、拡大や印刷でも変換をやり直す必要がない。
+
+PDFは外部ライブラリを使わずに書き出す。PdfWriter は1ページ書くごとにファイルに
+流し込むため、バッチで何万枚でも1つの複数ページのPDFにまとめられる。
+"""
+import os
+import zlib
+
+from pipeline import STYLE_FILLED, STYLE_TEXTURED, normalize_contour
+
+VECTOR_EXTENSIONS = (".svg", ".pdf")
+
+# 保存ダイアログの種類（各アプリの save_image で使う）
+SAVE_FILETYPES = [("PNG files", "*.png"), ("SVG files", "*.svg"), ("PDF files", "*.pdf"), ("All files", "*.*")]
+
+# テクスチャの線の濃さ（PNGでは30%の割合でブレンドしている）
+TEXTURE_GRAY = 0.7
+
+
+def glyph_of(image):
+    """render_contour が描いた画像から、描画に使った輪郭とパラメータを取り出す（無ければ None）"""
+    return getattr(image, "info", {}).get("glyph")
+
+
+def _points(glyph):
+    return normalize_contour(glyph["contour"], glyph["shape"], glyph["canvas_size"])
+
+
+def to_svg(glyph):
+    """SVGの文字列を作る"""
+    width, height = glyph["canvas_size"]
+    points = _points(glyph)
+    path = "M " + " L ".join(f"{x} {y}" for x, y in points) + " Z"
+    elements = [f'<rect width="{width}" height="{height}" fill="white"/>']
+    if glyph["style"] == STYLE_FILLED:
+        elements.append(f'<path d="{path}" fill="black" stroke="black" stroke-width="1"/>')
+    else:
+        elements.append(f'<path d="{path}" fill="none" stroke="black" stroke-width="{glyph["line_width"]}" '
+                        f'stroke-linejoin="round"/>')
+        if glyph["style"] == STYLE_TEXTURED:
+            gray = round(TEXTURE_GRAY * 255)
+            strokes = " ".join(f"M {x1} {y1} L {x2} {y2}" for x1, y1, x2, y2 in glyph.get("texture", ()))
+            if strokes:
+                elements.append(f'<path d="{strokes}" fill="none" stroke="rgb({gray},{gray},{gray})" '
+                                f'stroke-width="1"/>')
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {width} {height}">\n  ' + "\n  ".join(elements) + "\n</svg>\n")
+
+
+def _pdf_content(glyph):
+    """1ページ分のPDFの描画命令（座標はキャンバスと同じく左上が原点）"""
+    width, height = glyph["canvas_size"]
+    points = _points(glyph)
+    path = f"{points[0][0]} {points[0][1]} m " + " ".join(f"{x} {y} l" for x, y in points[1:]) + " h"
+    # y軸を反転してキャンバスの座標のまま描く
+    commands = [f"1 0 0 -1 0 {height} cm", "0 g 0 G 1 j 1 J"]
+    if glyph["style"] == STYLE_FILLED:
+        commands.append(f"1 w {path} B")
+    else:
+        commands.append(f"{glyph['line_width']} w {path} S")
+        if glyph["style"] == STYLE_TEXTURED and glyph.get("texture"):
+            strokes = " ".join(f"{x1} {y1} m {x2} {y2} l" for x1, y1, x2, y2 in glyph["texture"])
+            commands.append(f"{TEXTURE_GRAY} G 1 w {strokes} S")
+    return "\n".join(commands).encode("ascii")
+
+
+class PdfWriter:
+    """複数ページのPDFを1ページずつ書き出す（ページは書いた順に並ぶ）
+
+    ページの本体はその場でファイルに書き、最後に close() でページの一覧と
+    相互参照表を書く。オブジェクト番号 1 はカタログ、2 はページの一覧に予約する。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "wb")
+        self._offsets = {}
+        self._pages = []
+        self._next_object = 3
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write_object(self, number, body):
+        self._offsets[number] = self._file.tell()
+        self._file.write(f"{number} 0 obj\n".encode("ascii") + body + b"\nendobj\n")
+
+    def _allocate(self):
+        number = self._next_object
+        self._next_object += 1
+        return number
+
+    def add_page(self, glyph):
+        """象形文字を1ページとして追加する"""
+        width, height = glyph["canvas_size"]
+        content = zlib.compress(_pdf_content(glyph))
+        content_number = self._allocate()
+        self._write_object(
+            content_number,
+            f"<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n".encode("ascii")
+            + content + b"\nendstream")
+        page_number = self._allocate()
+        self._write_object(
+            page_number,
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+            f"/Contents {content_number} 0 R /Resources << >> >>".encode("ascii"))
+        self._pages.append(page_number)
+
+    def close(self):
+        if self._file is None:
+            return
+        kids = " ".join(f"{number} 0 R" for number in self._pages)
+        self._write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>".encode("ascii"))
+        self._write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref = self._file.tell()
+        lines = [f"xref\n0 {self._next_object}\n", "0000000000 65535 f \n"]
+        lines += [f"{self._offsets[number]:010d} 00000 n \n" for number in range(1, self._next_object)]
+        lines.append(f"trailer\n<< /Size {self._next_object} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n")
+        self._file.write("".join(lines).encode("ascii"))
+        self._file.close()
+        self._file = None
+
+    @property
+    def page_count(self):
+        return len(self._pages)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def save_svg(path, glyph):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(to_svg(glyph))
+
+
+def save_pdf(path, glyph):
+    with PdfWriter(path) as writer:
+        writer.add_page(glyph)
+
+
+def save_vector(path, image):
+    """拡張子が .svg / .pdf なら画像の輪郭からベクター形式で保存する
+
+    保存した場合は True、ベクター形式でない場合は False を返す。
+    輪郭が見つからなかった画像（元の画像をそのまま表示している場合）は ValueError。
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in VECTOR_EXTENSIONS:
+        return False
+    glyph = glyph_of(image)
+    if glyph is None:
+        raise ValueError("輪郭が無い画像はベクター形式で保存できません")
+    if extension == ".svg":
+        save_svg(path, glyph)
+    else:
+        save_pdf(path, glyph)
+    return True
@@ -0,0 +1,311 @@
+"""フォルダを監視して、置かれた画像を順次象形文字に変換するデーモン
+
+入力フォルダに画像が追加・更新されるたびに変換し、出力フォルダに
+`画像名.png`と`画像名.txt`を保存する。Linuxではinotifyで変更を受け取り、
+それ以外の環境（またはinotifyが使えない場合）は一定間隔でフォルダを走査する。
+
+書き込み途中のファイルを変換しないよう、書き込みの完了（inotifyの
+IN_CLOSE_WRITE / IN_MOVED_TO）を待つか、サイズと更新時刻が
+DEBOUNCE_SECONDS の間変わらなくなってから変換する。
+変換済みのファイルはサイズと更新時刻と共にSQLiteに記録し、再起動しても
+変換し直さない（内容が変わったファイルだけを変換し直す）。
+
+使い方:
+    python watch.py 入力フォルダ 出力フォルダ
+    python watch.py 入力フォルダ 出力フォルダ --record done.sqlite --workers 4 --no-api
+"""
+import os
+import sys
+import time
+import select
+import signal
+import sqlite3
+import struct
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from batch import IMAGE_EXTENSIONS, convert_image
+from concurrency import BATCH, apply_policy, cpu_count
+from openai_client import get_client
+
+# サイズと更新時刻がこの時間変わらなければ書き込みが終わったとみなす（秒）
+DEBOUNCE_SECONDS = float(os.environ.get("WATCH_DEBOUNCE_SECONDS", "0.3"))
+# inotifyが使えない場合の走査間隔（秒）
+POLL_INTERVAL = float(os.environ.get("WATCH_POLL_INTERVAL", "0.25"))
+
+# inotify のイベント（<sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith(".")
+
+
+def _file_state(path):
+    """(サイズ, 更新時刻ns)。ファイルが無ければ None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class DoneRecord:
+    """変換済みのファイルをサイズ・更新時刻と共に記録するSQLiteのストア"""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS done ("
+                         "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+                         "converted_at REAL NOT NULL)")
+        self._db.commit()
+        self._done = {path: (size, mtime_ns)
+                      for path, size, mtime_ns in self._db.execute("SELECT path, size, mtime_ns FROM done")}
+
+    def is_done(self, path, state):
+        with self._lock:
+            return self._done.get(path) == state
+
+    def claim(self, path, state):
+        """変換を始めるファイルを記録する（メモリ上だけ。変換が終わるまでは再起動すると変換し直す）"""
+        with self._lock:
+            self._done[path] = state
+
+    def mark(self, path, state):
+        with self._lock:
+            self._done[path] = state
+            self._db.execute("INSERT OR REPLACE INTO done (path, size, mtime_ns, converted_at) VALUES (?, ?, ?, ?)",
+                             (path, state[0], state[1], time.time()))
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._done)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class InotifyWatcher:
+    """inotifyで1つのフォルダの書き込み完了・移動・作成・変更を受け取る（Linuxのみ）"""
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+
+    def __init__(self, folder):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 に失敗しました")
+        if libc.inotify_add_watch(self._fd, os.fsencode(folder), self.MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(error, "inotify_add_watch に失敗しました")
+
+    def read(self, timeout):
+        """timeout 秒まで待ってイベントを読む。[(ファイル名, マスク)] を返す
+
+        イベントが溢れた場合は [(None, IN_Q_OVERFLOW)] を返す（フォルダを走査し直す）。
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            events.append((os.fsdecode(name) if name else None, mask))
+        return events
+
+    def close(self):
+        os.close(self._fd)
+
+
+class WatchDaemon:
+    """入力フォルダを監視し、新しい・更新された画像を変換する"""
+
+    def __init__(self, input_dir, output_dir, record_path=None, workers=None, use_api=True,
+                 debounce=DEBOUNCE_SECONDS, poll_interval=POLL_INTERVAL, use_inotify=True):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.workers = workers or cpu_count()
+        self.client = get_client() if use_api else None
+        os.makedirs(output_dir, exist_ok=True)
+        self.record = DoneRecord(record_path or os.path.join(output_dir, ".watch.sqlite"))
+
+        self.watcher = None
+        if use_inotify and sys.platform.startswith("linux"):
+            try:
+                self.watcher = InotifyWatcher(input_dir)
+            except (OSError, AttributeError) as e:
+                print(f"inotifyが使えないため走査で監視します: {e}")
+
+        # 変換待ち: {パス: (状態, 最後に状態が変わった時刻, 最初に見つけた時刻, 書き込み完了済みか)}
+        self._pending = {}
+        # 変換中のパス（変換中に更新された場合は完了後に変換し直す）
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stats = {"converted": 0, "failed": 0, "max_latency": 0.0, "total_latency": 0.0}
+
+    def stop(self):
+        self._stop.set()
+
+    def _notice(self, path, closed=False, now=None):
+        """ファイルの変化を記録する（書き込み完了のイベントなら待たずに変換できる）"""
+        now = time.monotonic() if now is None else now
+        state = _file_state(path)
+        if state is None:
+            self._pending.pop(path, None)
+            return
+        previous = self._pending.get(path)
+        if previous is None:
+            # 変換済み・変換中（同じサイズと更新時刻）のファイルは変換待ちにしない
+            if self.record.is_done(path, state):
+                return
+            self._pending[path] = (state, now, now, closed)
+        elif previous[0] != state or closed:
+            self._pending[path] = (state, now, previous[2], closed)
+
+    def _scan(self):
+        """フォルダ全体を走査して変化を記録する（起動時・走査での監視・イベントの溢れ）"""
+        try:
+            names = os.listdir(self.input_dir)
+        except OSError as e:
+            print(f"入力フォルダを読めません: {e}")
+            return
+        for name in names:
+            if _is_image(name):
+                path = os.path.join(self.input_dir, name)
+                previous = self._pending.get(path)
+                if previous is None or previous[0] != _file_state(path):
+                    self._notice(path)
+
+    def _ready(self, now):
+        """書き込みが終わった変換待ちのパスを取り出す"""
+        ready = []
+        for path, (state, changed_at, first_seen, closed) in list(self._pending.items()):
+            with self._lock:
+                if path in self._running:
+                    continue
+            if not closed and now - changed_at < self.debounce:
+                continue
+            current = _file_state(path)
+            if current is None:
+                del self._pending[path]
+            elif current != state:
+                # まだ書き込まれている
+                self._pending[path] = (current, now, first_seen, False)
+            else:
+                # 変換待ちから外す前に記録し、変換中の走査で同じ状態のファイルを拾い直さない
+                self.record.claim(path, state)
+                del self._pending[path]
+                ready.append((path, state, first_seen))
+        return ready
+
+    def _convert(self, path, state, first_seen):
+        name = os.path.splitext(os.path.basename(path))[0]
+        try:
+            result = convert_image(path, self.client)
+            if result is None:
+                raise ValueError("画像を読み込めませんでした")
+            result["image"].save(os.path.join(self.output_dir, f"{name}.png"))
+            with open(os.path.join(self.output_dir, f"{name}.txt"), "w", encoding="utf-8") as f:
+                f.write(result["description"])
+            # 書き込み途中のファイルを記録しないよう、変換を始めた時の状態を記録する
+            self.record.mark(path, state)
+            latency = time.monotonic() - first_seen
+            with self._lock:
+                self.stats["converted"] += 1
+                self.stats["total_latency"] += latency
+                self.stats["max_latency"] = max(self.stats["max_latency"], latency)
+            print(f"変換しました: {os.path.basename(path)}（検出から{latency * 1000:.0f}ms）")
+        except Exception as e:
+            with self._lock:
+                self.stats["failed"] += 1
+            # 失敗したファイルも記録し、更新されるまで繰り返し変換しない
+            self.record.mark(path, state)
+            print(f"変換に失敗しました: {path}: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(path)
+
+    def _wait_for_changes(self):
+        """変化を待って記録する（inotifyのイベント、または走査）"""
+        timeout = self.debounce / 2 if self._pending else self.poll_interval
+        if self.watcher is None:
+            self._stop.wait(timeout)
+            self._scan()
+            return
+        for name, mask in self.watcher.read(timeout):
+            if mask & IN_Q_OVERFLOW:
+                self._scan()
+            elif name and _is_image(name):
+                self._notice(os.path.join(self.input_dir, name),
+                             closed=bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO)))
+
+    def run(self):
+        """stop() が呼ばれるまで監視と変換を続ける"""
+        apply_policy(BATCH)
+        print(f"監視を開始します: {self.input_dir} → {self.output_dir}"
+              f"（{'inotify' if self.watcher else '走査'}、変換済み{len(self.record)}件）")
+        self._scan()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="watch") as executor:
+            while not self._stop.is_set():
+                for path, state, first_seen in self._ready(time.monotonic()):
+                    with self._lock:
+                        self._running.add(path)
+                    executor.submit(self._convert, path, state, first_seen)
+                self._wait_for_changes()
+        if self.watcher is not None:
+            self.watcher.close()
+        self.record.close()
+        converted = self.stats["converted"]
+        average = self.stats["total_latency"] / converted * 1000 if converted else 0.0
+        print(f"監視を終了しました: 変換{converted}件, 失敗{self.stats['failed']}件, "
+              f"平均{average:.0f}ms, 最大{self.stats['max_latency'] * 1000:.0f}ms")
+        return self.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="フォルダを監視して画像を象形文字に変換する")
+    parser.add_argument("input_dir", help="監視するフォルダ")
+    parser.add_argument("output_dir", help="変換結果の保存先フォルダ")
+    parser.add_argument("--record", default=None,
+                        help="変換済みの記録（SQLite、既定は 出力フォルダ/.watch.sqlite）")
+    parser.add_argument("--workers", type=int, default=None, help="同時に変換する数（既定はCPUコア数）")
+    parser.add_argument("--no-api", action="store_true", help="ChatGPT APIを使わずローカルの説明を使う")
+    parser.add_argument("--poll", action="store_true", help="inotifyを使わずに走査で監視する")
+    args = parser.parse_args()
+
+    daemon = WatchDaemon(args.input_dir, args.output_dir, args.record, args.workers,
+                         use_api=not args.no_api, use_inotify=not args.poll)
+    # Ctrl+C / SIGTERM で変換中の画像を終えてから止める
+    signal.signal(signal.SIGINT, lambda *_: daemon.stop())
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stop())
+    daemon.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())